@@ -10,12 +10,31 @@ import numpy as np
 from ta.trend import EMAIndicator, MACD, SMAIndicator
 from ta.momentum import RSIIndicator
 
+from candle_store import list_series, load_candles, save_candles, count_candles, series_size
+from streaming_indicators import StreamingIndicators, state_path
+from profiling import span
+
 # Diretórios
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'historical')
 PROCESSED_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'processed')
 
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 
+def rolling_std(series, window):
+    """
+    Desvio padrão amostral (ddof=1) calculado sobre cada janela
+
+    O rolling().std() do pandas acumula somas de forma online e perde precisão
+    depois de um valor muito fora da escala; calcular janela a janela dá o
+    mesmo resultado que o cálculo incremental (streaming_indicators).
+    """
+    values = series.to_numpy(dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(values, window)
+        result[window - 1:] = windows.std(axis=1, ddof=1)
+    return pd.Series(result, index=series.index)
+
 def add_technical_indicators(df):
     """
     Adiciona indicadores técnicos ao DataFrame
@@ -52,9 +71,9 @@ def add_technical_indicators(df):
     
     # Bollinger Bands (usando SMA 20)
     df['bb_middle'] = df['sma_20']
-    rolling_std = df['close'].rolling(window=20).std()
-    df['bb_upper'] = df['bb_middle'] + (rolling_std * 2)
-    df['bb_lower'] = df['bb_middle'] - (rolling_std * 2)
+    bb_std = rolling_std(df['close'], 20)
+    df['bb_upper'] = df['bb_middle'] + (bb_std * 2)
+    df['bb_lower'] = df['bb_middle'] - (bb_std * 2)
     
     # Volume médio
     df['volume_sma'] = df['volume'].rolling(window=20).mean()
@@ -63,7 +82,7 @@ def add_technical_indicators(df):
     df['price_change_pct'] = df['close'].pct_change() * 100
     
     # Volatilidade (desvio padrão dos retornos)
-    df['volatility'] = df['price_change_pct'].rolling(window=20).std()
+    df['volatility'] = rolling_std(df['price_change_pct'], 20)
     
     # Remover linhas com NaN (primeiras linhas onde indicadores não podem ser calculados)
     df = df.dropna().reset_index(drop=True)
@@ -71,7 +90,7 @@ def add_technical_indicators(df):
     return df
 
 def process_all_files():
-    """Processa todos os arquivos CSV adicionando indicadores técnicos"""
+    """Processa todas as séries adicionando indicadores técnicos"""
     print("=" * 60)
     print("ADICIONANDO INDICADORES TÉCNICOS")
     print("=" * 60)
@@ -79,36 +98,37 @@ def process_all_files():
     print(f"Diretório de saída: {PROCESSED_DIR}")
     print("=" * 60)
     
-    # Listar todos os arquivos CSV
-    csv_files = [f for f in os.listdir(DATA_DIR) if f.endswith('.csv')]
+    # Listar todas as séries (formato colunar ou CSV)
+    series_names = list_series(DATA_DIR)
     
-    if not csv_files:
-        print("✗ Nenhum arquivo CSV encontrado no diretório de dados")
+    if not series_names:
+        print("✗ Nenhuma série encontrada no diretório de dados")
         return
     
-    print(f"\nArquivos encontrados: {len(csv_files)}")
+    print(f"\nSéries encontradas: {len(series_names)}")
     
-    for filename in csv_files:
-        print(f"\nProcessando: {filename}")
+    for name in series_names:
+        print(f"\nProcessando: {name}")
         
         # Ler dados
-        input_path = os.path.join(DATA_DIR, filename)
-        df = pd.read_csv(input_path)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        df = load_candles(DATA_DIR, name)
         
         print(f"  - Velas originais: {len(df)}")
         
         # Adicionar indicadores
-        df_processed = add_technical_indicators(df)
+        with span('indicators', rows=len(df), series=name):
+            df_processed = add_technical_indicators(df)
         
         print(f"  - Velas após processamento: {len(df_processed)}")
         print(f"  - Indicadores adicionados: {len(df_processed.columns) - len(df.columns)}")
         
         # Salvar dados processados
-        output_path = os.path.join(PROCESSED_DIR, filename)
-        df_processed.to_csv(output_path, index=False)
+        save_candles(df_processed, PROCESSED_DIR, name)
+        
+        print(f"✓ Salvo em: {os.path.join(PROCESSED_DIR, name)}")
         
-        print(f"✓ Salvo em: {output_path}")
+        # Salvar estado incremental para que update_data processe só velas novas
+        StreamingIndicators.from_history(df).save(state_path(name, PROCESSED_DIR))
         
         # Mostrar preview dos indicadores
         print(f"\n  Preview dos últimos valores:")
@@ -125,13 +145,11 @@ def process_all_files():
     print("=" * 60)
     
     # Resumo
-    print("\nArquivos processados:")
-    for filename in csv_files:
-        output_path = os.path.join(PROCESSED_DIR, filename)
-        if os.path.exists(output_path):
-            size = os.path.getsize(output_path) / 1024
-            num_lines = sum(1 for _ in open(output_path)) - 1
-            print(f"  - {filename} ({size:.2f} KB, {num_lines} velas)")
+    print("\nSéries processadas:")
+    for name in series_names:
+        size = series_size(PROCESSED_DIR, name) / 1024
+        num_lines = count_candles(PROCESSED_DIR, name)
+        print(f"  - {name} ({size:.2f} KB, {num_lines} velas)")
 
 if __name__ == "__main__":
     process_all_files()
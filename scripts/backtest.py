@@ -9,13 +9,188 @@ import sys
 import json
 import numpy as np
 import pandas as pd
-import joblib
 from datetime import datetime
 
+import model_bundle
+from candle_store import load_candles
+from feature_store import load_features, attach_features
+from profiling import span
+
 PROJECT_DIR = os.path.dirname(os.path.dirname(__file__))
 MODELS_DIR = os.path.join(PROJECT_DIR, 'models')
 DATA_DIR = os.path.join(PROJECT_DIR, 'data', 'processed')
 
+ACTION_MAP = {-1: 'sell', 0: 'hold', 1: 'buy'}
+
+
+def simulate_positions(close, actions, confidences, initial_balance,
+                       confidence_threshold=80, stop_loss=3.0, take_profit=5.0, start_index=0):
+    """
+    Máquina de estados de posições sobre arrays pré-calculados
+    
+    Reproduz exatamente as regras de Backtester.run (stop-loss/take-profit,
+    abertura por confiança, fechamento por sinal contrário e no fim dos dados),
+    mas consome predições já calculadas para toda a série.
+    
+    Args:
+        close: Sequência de preços de fechamento
+        actions: Sequência de ações ('buy', 'sell', 'hold') por vela
+        confidences: Sequência de confianças (0-100) por vela
+        initial_balance: Saldo inicial
+    
+    Returns:
+        (trades, saldo final). Em cada trade, entry_time/exit_time são os
+        índices das velas; o chamador converte para timestamps se precisar.
+    """
+    close = list(close)
+    actions = list(actions)
+    confidences = list(confidences)
+    
+    balance = initial_balance
+    position = None
+    entry_price = 0
+    trade = None
+    trades = []
+    
+    def close_trade(idx, reason):
+        nonlocal balance, position, entry_price
+        price = close[idx]
+        trade['exit_time'] = idx
+        trade['exit_price'] = price
+        trade['status'] = 'closed'
+        trade['close_reason'] = reason
+        
+        if position == 'long':
+            pnl = (price - entry_price) * trade['quantity']
+            pnl_pct = ((price - entry_price) / entry_price) * 100
+        else:  # short
+            pnl = (entry_price - price) * trade['quantity']
+            pnl_pct = ((entry_price - price) / entry_price) * 100
+        
+        trade['pnl'] = pnl
+        trade['pnl_pct'] = pnl_pct
+        balance += pnl
+        position = None
+        entry_price = 0
+    
+    for idx in range(start_index, len(close)):
+        price = close[idx]
+        
+        # Verificar stop-loss/take-profit
+        if position is not None:
+            if position == 'long':
+                pnl_pct = ((price - entry_price) / entry_price) * 100
+            else:
+                pnl_pct = ((entry_price - price) / entry_price) * 100
+            
+            if pnl_pct <= -stop_loss:
+                close_trade(idx, 'stop_loss')
+            elif pnl_pct >= take_profit:
+                close_trade(idx, 'take_profit')
+        
+        action = actions[idx]
+        confidence = confidences[idx]
+        
+        # Abrir posição se confiança for alta
+        if confidence >= confidence_threshold and action in ('buy', 'sell'):
+            if position is None:
+                position_size = balance * 0.1  # 10% do saldo
+                position = 'long' if action == 'buy' else 'short'
+                entry_price = price
+                trade = {
+                    'entry_time': idx,
+                    'entry_price': price,
+                    'type': action,
+                    'quantity': position_size / price,
+                    'confidence': confidence,
+                    'status': 'open'
+                }
+                trades.append(trade)
+        
+        # Fechar posição se sinal contrário
+        elif position is not None:
+            if (position == 'long' and action == 'sell') or \
+               (position == 'short' and action == 'buy'):
+                close_trade(idx, 'opposite_signal')
+    
+    # Fechar posição aberta ao final
+    if position is not None:
+        close_trade(len(close) - 1, 'end_of_data')
+    
+    return trades, balance
+
+
+def calculate_metrics(trades, initial_balance, balance):
+    """
+    Calcula métricas de performance a partir da lista de trades
+    
+    Args:
+        trades: Trades gerados pelo backtest (apenas os fechados são considerados)
+        initial_balance: Saldo inicial
+        balance: Saldo final
+    """
+    closed_trades = [t for t in trades if t['status'] == 'closed']
+    
+    if not closed_trades:
+        return {
+            'error': 'No trades executed',
+            'initial_balance': initial_balance,
+            'final_balance': balance
+        }
+    
+    # Métricas básicas
+    total_trades = len(closed_trades)
+    winning_trades = [t for t in closed_trades if t['pnl'] > 0]
+    losing_trades = [t for t in closed_trades if t['pnl'] < 0]
+    
+    win_rate = (len(winning_trades) / total_trades) * 100 if total_trades > 0 else 0
+    
+    total_pnl = sum(t['pnl'] for t in closed_trades)
+    roi = ((balance - initial_balance) / initial_balance) * 100
+    
+    # Profit factor
+    gross_profit = sum(t['pnl'] for t in winning_trades) if winning_trades else 0
+    gross_loss = abs(sum(t['pnl'] for t in losing_trades)) if losing_trades else 0
+    profit_factor = gross_profit / gross_loss if gross_loss > 0 else float('inf')
+    
+    # Drawdown
+    equity_curve = [initial_balance]
+    for trade in closed_trades:
+        equity_curve.append(equity_curve[-1] + trade['pnl'])
+    
+    peak = equity_curve[0]
+    max_drawdown = 0
+    for value in equity_curve:
+        if value > peak:
+            peak = value
+        drawdown = ((peak - value) / peak) * 100
+        if drawdown > max_drawdown:
+            max_drawdown = drawdown
+    
+    # Sharpe Ratio (simplificado)
+    returns = [t['pnl_pct'] for t in closed_trades]
+    sharpe_ratio = (np.mean(returns) / np.std(returns)) if np.std(returns) > 0 else 0
+    
+    metrics = {
+        'initial_balance': initial_balance,
+        'final_balance': balance,
+        'total_pnl': total_pnl,
+        'roi': roi,
+        'total_trades': total_trades,
+        'winning_trades': len(winning_trades),
+        'losing_trades': len(losing_trades),
+        'win_rate': win_rate,
+        'profit_factor': profit_factor,
+        'max_drawdown': max_drawdown,
+        'sharpe_ratio': sharpe_ratio,
+        'avg_win': np.mean([t['pnl'] for t in winning_trades]) if winning_trades else 0,
+        'avg_loss': np.mean([t['pnl'] for t in losing_trades]) if losing_trades else 0,
+        'trades': closed_trades
+    }
+    
+    return metrics
+
+
 class Backtester:
     def __init__(self, symbol, interval, initial_balance=10000):
         """
@@ -34,66 +209,81 @@ class Backtester:
         self.entry_price = 0
         self.trades = []
         
-        # Carregar modelo
-        self.model, self.scaler, self.feature_names = self.load_model()
+        # Carregar modelo (e versão em arrays para inferência rápida, se suportada)
+        self.model, self.scaler, self.feature_names, self.packed = self.load_model()
         
         # Carregar dados
         self.data = self.load_data()
     
     def load_model(self):
         """Carrega modelo treinado"""
-        model_path = os.path.join(MODELS_DIR, f"{self.symbol}_{self.interval}_model.pkl")
-        scaler_path = os.path.join(MODELS_DIR, f"{self.symbol}_{self.interval}_scaler.pkl")
-        features_path = os.path.join(MODELS_DIR, f"{self.symbol}_{self.interval}_features.txt")
-        
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Model not found: {model_path}")
-        
-        model = joblib.load(model_path)
-        scaler = joblib.load(scaler_path)
-        
-        with open(features_path, 'r') as f:
-            feature_names = [line.strip() for line in f.readlines()]
-        
-        return model, scaler, feature_names
+        return model_bundle.load_model(self.symbol, self.interval, MODELS_DIR, packed=True)
     
     def load_data(self):
-        """Carrega dados históricos"""
-        data_path = os.path.join(DATA_DIR, f"{self.symbol}_{self.interval}.csv")
-        
-        if not os.path.exists(data_path):
-            raise FileNotFoundError(f"Data file not found: {data_path}")
-        
-        df = pd.read_csv(data_path)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        
-        return df
+        """Carrega dados históricos com as features derivadas do feature_store"""
+        name = f"{self.symbol}_{self.interval}"
+        return attach_features(load_candles(DATA_DIR, name), load_features(name, DATA_DIR))
     
     def predict(self, row):
         """Faz predição para uma linha de dados"""
         features = []
         for feature_name in self.feature_names:
-            if feature_name in row:
-                features.append(row[feature_name])
-            else:
-                features.append(0)
+            value = row[feature_name] if feature_name in row else 0
+            # Sem histórico suficiente para a feature (NaN): mesmo default de feature ausente
+            features.append(0 if pd.isna(value) else value)
         
         X = np.array([features])
-        X_scaled = self.scaler.transform(X)
-        
-        prediction = self.model.predict(X_scaled)[0]
         
-        if hasattr(self.model, 'predict_proba'):
-            probabilities = self.model.predict_proba(X_scaled)[0]
+        if self.packed is not None:
+            prediction, probabilities = self.packed.predict_row(X[0])
             confidence = max(probabilities) * 100
         else:
-            confidence = 75
+            X_scaled = self.scaler.transform(X)
+            
+            prediction = self.model.predict(X_scaled)[0]
+            
+            if hasattr(self.model, 'predict_proba'):
+                probabilities = self.model.predict_proba(X_scaled)[0]
+                confidence = max(probabilities) * 100
+            else:
+                confidence = 75
         
-        action_map = {-1: 'sell', 0: 'hold', 1: 'buy'}
-        action = action_map.get(prediction, 'hold')
+        action = ACTION_MAP.get(prediction, 'hold')
         
         return action, confidence
     
+    def feature_matrix(self):
+        """Matriz de features de toda a série (0 para features ausentes ou NaN, como em predict)"""
+        columns = []
+        for feature_name in self.feature_names:
+            if feature_name in self.data.columns:
+                columns.append(np.nan_to_num(self.data[feature_name].to_numpy(dtype=np.float64), nan=0.0))
+            else:
+                columns.append(np.zeros(len(self.data)))
+        
+        return np.column_stack(columns)
+    
+    def predict_all(self):
+        """
+        Faz predições para toda a série em uma única chamada ao modelo
+        
+        Returns:
+            (actions, confidences): arrays com a ação e a confiança (0-100) de cada vela
+        """
+        # Em lotes grandes o sklearn (Cython) é mais rápido que os arrays de nós
+        X_scaled = self.scaler.transform(self.feature_matrix())
+        
+        predictions = self.model.predict(X_scaled)
+        
+        if hasattr(self.model, 'predict_proba'):
+            confidences = self.model.predict_proba(X_scaled).max(axis=1) * 100
+        else:
+            confidences = np.full(len(X_scaled), 75)
+        
+        actions = np.array([ACTION_MAP.get(p, 'hold') for p in predictions.tolist()], dtype=object)
+        
+        return actions, confidences
+    
     def open_position(self, row, action, confidence):
         """Abre uma posição"""
         if self.position is not None:
@@ -169,7 +359,7 @@ class Backtester:
         elif pnl_pct >= take_profit_pct:
             self.close_position(row, reason='take_profit')
     
-    def run(self, confidence_threshold=80, stop_loss=3.0, take_profit=5.0, start_index=1000):
+    def run(self, confidence_threshold=80, stop_loss=3.0, take_profit=5.0, start_index=1000, vectorized=False):
         """
         Executa backtest
         
@@ -178,6 +368,8 @@ class Backtester:
             stop_loss: Porcentagem de stop-loss
             take_profit: Porcentagem de take-profit
             start_index: Índice inicial (pular primeiros dados para ter indicadores calculados)
+            vectorized: Se True, faz as predições em lote e usa simulate_positions
+                        (mesmas métricas, muito mais rápido)
         """
         print(f"\n{'='*60}")
         print(f"BACKTESTING: {self.symbol} {self.interval}")
@@ -189,6 +381,14 @@ class Backtester:
         print(f"Período: {self.data.iloc[start_index]['timestamp']} até {self.data.iloc[-1]['timestamp']}")
         print(f"{'='*60}\n")
         
+        with span('backtest', rows=len(self.data) - start_index, symbol=self.symbol, interval=self.interval,
+                  vectorized=vectorized):
+            if vectorized:
+                return self._run_vectorized(confidence_threshold, stop_loss, take_profit, start_index)
+            return self._run_loop(confidence_threshold, stop_loss, take_profit, start_index)
+    
+    def _run_loop(self, confidence_threshold, stop_loss, take_profit, start_index):
+        """Backtest vela a vela, com uma predição por linha"""
         for idx in range(start_index, len(self.data)):
             row = self.data.iloc[idx]
             
@@ -214,68 +414,38 @@ class Backtester:
         
         return self.calculate_metrics()
     
+    def _run_vectorized(self, confidence_threshold, stop_loss, take_profit, start_index):
+        """Backtest com inferência em lote + máquina de estados sobre arrays"""
+        actions, confidences = self.predict_all()
+        
+        trades, balance = simulate_positions(
+            self.data['close'].to_numpy(dtype=np.float64).tolist(),
+            actions,
+            confidences,
+            self.balance,
+            confidence_threshold=confidence_threshold,
+            stop_loss=stop_loss,
+            take_profit=take_profit,
+            start_index=start_index
+        )
+        
+        # Converter índices das velas em timestamps
+        timestamps = self.data['timestamp']
+        for trade in trades:
+            trade['entry_time'] = timestamps.iloc[trade['entry_time']]
+            if 'exit_time' in trade:
+                trade['exit_time'] = timestamps.iloc[trade['exit_time']]
+        
+        self.trades.extend(trades)
+        self.balance = balance
+        self.position = None
+        self.entry_price = 0
+        
+        return self.calculate_metrics()
+    
     def calculate_metrics(self):
         """Calcula métricas de performance"""
-        closed_trades = [t for t in self.trades if t['status'] == 'closed']
-        
-        if not closed_trades:
-            return {
-                'error': 'No trades executed',
-                'initial_balance': self.initial_balance,
-                'final_balance': self.balance
-            }
-        
-        # Métricas básicas
-        total_trades = len(closed_trades)
-        winning_trades = [t for t in closed_trades if t['pnl'] > 0]
-        losing_trades = [t for t in closed_trades if t['pnl'] < 0]
-        
-        win_rate = (len(winning_trades) / total_trades) * 100 if total_trades > 0 else 0
-        
-        total_pnl = sum(t['pnl'] for t in closed_trades)
-        roi = ((self.balance - self.initial_balance) / self.initial_balance) * 100
-        
-        # Profit factor
-        gross_profit = sum(t['pnl'] for t in winning_trades) if winning_trades else 0
-        gross_loss = abs(sum(t['pnl'] for t in losing_trades)) if losing_trades else 0
-        profit_factor = gross_profit / gross_loss if gross_loss > 0 else float('inf')
-        
-        # Drawdown
-        equity_curve = [self.initial_balance]
-        for trade in closed_trades:
-            equity_curve.append(equity_curve[-1] + trade['pnl'])
-        
-        peak = equity_curve[0]
-        max_drawdown = 0
-        for value in equity_curve:
-            if value > peak:
-                peak = value
-            drawdown = ((peak - value) / peak) * 100
-            if drawdown > max_drawdown:
-                max_drawdown = drawdown
-        
-        # Sharpe Ratio (simplificado)
-        returns = [t['pnl_pct'] for t in closed_trades]
-        sharpe_ratio = (np.mean(returns) / np.std(returns)) if np.std(returns) > 0 else 0
-        
-        metrics = {
-            'initial_balance': self.initial_balance,
-            'final_balance': self.balance,
-            'total_pnl': total_pnl,
-            'roi': roi,
-            'total_trades': total_trades,
-            'winning_trades': len(winning_trades),
-            'losing_trades': len(losing_trades),
-            'win_rate': win_rate,
-            'profit_factor': profit_factor,
-            'max_drawdown': max_drawdown,
-            'sharpe_ratio': sharpe_ratio,
-            'avg_win': np.mean([t['pnl'] for t in winning_trades]) if winning_trades else 0,
-            'avg_loss': np.mean([t['pnl'] for t in losing_trades]) if losing_trades else 0,
-            'trades': closed_trades
-        }
-        
-        return metrics
+        return calculate_metrics(self.trades, self.initial_balance, self.balance)
     
     def print_results(self, metrics):
         """Imprime resultados do backtest"""
@@ -299,17 +469,20 @@ class Backtester:
 
 
 def main():
-    if len(sys.argv) < 3:
-        print("Usage: python3 backtest.py <symbol> <interval> [confidence_threshold]")
-        print("Example: python3 backtest.py ETHUSDT 1h 80")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    
+    if len(args) < 2:
+        print("Usage: python3 backtest.py <symbol> <interval> [confidence_threshold] [--vectorized]")
+        print("Example: python3 backtest.py ETHUSDT 1h 80 --vectorized")
         sys.exit(1)
     
-    symbol = sys.argv[1]
-    interval = sys.argv[2]
-    confidence_threshold = int(sys.argv[3]) if len(sys.argv) > 3 else 80
+    symbol = args[0]
+    interval = args[1]
+    confidence_threshold = int(args[2]) if len(args) > 2 else 80
+    vectorized = '--vectorized' in sys.argv
     
     backtester = Backtester(symbol, interval, initial_balance=10000)
-    metrics = backtester.run(confidence_threshold=confidence_threshold)
+    metrics = backtester.run(confidence_threshold=confidence_threshold, vectorized=vectorized)
     
     if 'error' in metrics:
         print(f"Error: {metrics['error']}")
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Varredura paralela de parâmetros de backtesting
+Testa combinações de confiança mínima, stop-loss e take-profit
+
+As probabilidades do modelo são calculadas uma única vez por símbolo/intervalo;
+cada combinação da grade roda apenas a máquina de estados de posições
+(simulate_positions) em um pool de processos.
+
+Uso: python3 backtest_sweep.py <symbol>:<interval> [...] [opções]
+Exemplo: python3 backtest_sweep.py ETHUSDT:1h SOLUSDT:1h \
+             --confidence 60,70,80,90 --stop-loss 1,2,3 --take-profit 2,5,8
+"""
+
+import os
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from backtest import PROJECT_DIR, Backtester, simulate_positions, calculate_metrics
+
+DEFAULT_OUTPUT = os.path.join(PROJECT_DIR, 'backtest_sweep_results.csv')
+
+# Métricas de ordenação -> ascending (True quando menor é melhor)
+SORT_COLUMNS = {
+    'roi': False,
+    'sharpe_ratio': False,
+    'max_drawdown': True,
+    'win_rate': False,
+    'profit_factor': False,
+    'total_trades': False,
+}
+
+RESULT_COLUMNS = [
+    'symbol', 'interval', 'confidence_threshold', 'stop_loss', 'take_profit',
+    'roi', 'sharpe_ratio', 'max_drawdown', 'total_trades', 'win_rate',
+    'profit_factor', 'final_balance'
+]
+
+# Séries pré-calculadas compartilhadas com os workers (via initializer)
+_SERIES = {}
+
+
+def _init_worker(series):
+    global _SERIES
+    _SERIES = series
+
+
+def _run_cell(cell):
+    """Executa uma célula da grade usando as predições pré-calculadas"""
+    key, confidence_threshold, stop_loss, take_profit = cell
+    series = _SERIES[key]
+
+    trades, balance = simulate_positions(
+        series['close'],
+        series['actions'],
+        series['confidences'],
+        series['initial_balance'],
+        confidence_threshold=confidence_threshold,
+        stop_loss=stop_loss,
+        take_profit=take_profit,
+        start_index=series['start_index']
+    )
+    metrics = calculate_metrics(trades, series['initial_balance'], balance)
+
+    symbol, interval = key
+    return {
+        'symbol': symbol,
+        'interval': interval,
+        'confidence_threshold': confidence_threshold,
+        'stop_loss': stop_loss,
+        'take_profit': take_profit,
+        'roi': metrics.get('roi', 0.0),
+        'sharpe_ratio': metrics.get('sharpe_ratio', 0.0),
+        'max_drawdown': metrics.get('max_drawdown', 0.0),
+        'total_trades': metrics.get('total_trades', 0),
+        'win_rate': metrics.get('win_rate', 0.0),
+        'profit_factor': metrics.get('profit_factor', 0.0),
+        'final_balance': metrics['final_balance'],
+    }
+
+
+def precompute_series(symbol, interval, initial_balance, start_index):
+    """Carrega modelo e dados e calcula ações/confianças para toda a série"""
+    backtester = Backtester(symbol, interval, initial_balance=initial_balance)
+
+    start = time.perf_counter()
+    actions, confidences = backtester.predict_all()
+    elapsed = time.perf_counter() - start
+
+    print(f"  {symbol} {interval}: {len(actions)} velas, inferência em {elapsed*1000:.0f} ms")
+
+    return {
+        'close': backtester.data['close'].to_numpy(dtype=np.float64).tolist(),
+        'actions': actions.tolist(),
+        'confidences': confidences.tolist(),
+        'initial_balance': initial_balance,
+        'start_index': start_index,
+    }
+
+
+def run_sweep(pairs, confidences, stop_losses, take_profits,
+              initial_balance=10000, start_index=1000, workers=None):
+    """
+    Executa a grade completa para todos os pares
+
+    Returns:
+        DataFrame com uma linha por combinação (não ordenado)
+    """
+    print("\nCalculando predições (uma vez por par)...")
+    series = {
+        (symbol, interval): precompute_series(symbol, interval, initial_balance, start_index)
+        for symbol, interval in pairs
+    }
+
+    cells = [
+        (key, confidence, stop_loss, take_profit)
+        for key in series
+        for confidence, stop_loss, take_profit in itertools.product(confidences, stop_losses, take_profits)
+    ]
+
+    print(f"\nExecutando {len(cells)} combinações em {workers or os.cpu_count()} processos...")
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(series,)) as executor:
+        chunksize = max(1, len(cells) // ((workers or os.cpu_count()) * 4))
+        results = list(executor.map(_run_cell, cells, chunksize=chunksize))
+
+    print(f"✓ Varredura concluída em {time.perf_counter() - start:.2f}s")
+
+    return pd.DataFrame(results, columns=RESULT_COLUMNS)
+
+
+def rank_results(results, sort_by='roi'):
+    """
+    Ordena os resultados pela métrica escolhida
+
+    Combinações sem nenhuma operação ficam por último: drawdown e Sharpe
+    zerados não significam uma estratégia boa.
+    """
+    no_trades = results['total_trades'] == 0
+    ranked = results.assign(_no_trades=no_trades).sort_values(
+        ['_no_trades', sort_by], ascending=[True, SORT_COLUMNS[sort_by]], kind='stable'
+    )
+    ranked = ranked.drop(columns='_no_trades').reset_index(drop=True)
+    ranked.insert(0, 'rank', np.arange(1, len(ranked) + 1))
+    return ranked
+
+
+def parse_grid(value, cast=float):
+    """Converte '60,70,80' em [60.0, 70.0, 80.0]"""
+    return [cast(v) for v in value.split(',') if v.strip()]
+
+
+def parse_pair(value):
+    if ':' not in value:
+        raise argparse.ArgumentTypeError(f"Par inválido '{value}' (use SYMBOL:INTERVAL)")
+    symbol, interval = value.split(':', 1)
+    return symbol.upper(), interval
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Varredura paralela de parâmetros de backtesting')
+    parser.add_argument('pairs', nargs='+', type=parse_pair, help='Pares no formato SYMBOL:INTERVAL')
+    parser.add_argument('--confidence', default='60,70,80,90', help='Grade de confiança mínima (%%)')
+    parser.add_argument('--stop-loss', default='1,2,3,5', help='Grade de stop-loss (%%)')
+    parser.add_argument('--take-profit', default='2,3,5,8', help='Grade de take-profit (%%)')
+    parser.add_argument('--initial-balance', type=float, default=10000)
+    parser.add_argument('--start-index', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None, help='Processos (padrão: número de CPUs)')
+    parser.add_argument('--sort', default='roi', choices=sorted(SORT_COLUMNS), help='Métrica de ordenação')
+    parser.add_argument('--top', type=int, default=20, help='Linhas exibidas no terminal')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='CSV de saída')
+    args = parser.parse_args()
+
+    confidences = parse_grid(args.confidence)
+    stop_losses = parse_grid(args.stop_loss)
+    take_profits = parse_grid(args.take_profit)
+
+    print("=" * 60)
+    print("VARREDURA DE PARÂMETROS DE BACKTESTING")
+    print("=" * 60)
+    print(f"Pares: {', '.join(f'{s} {i}' for s, i in args.pairs)}")
+    print(f"Confiança: {confidences}")
+    print(f"Stop-loss: {stop_losses}")
+    print(f"Take-profit: {take_profits}")
+    print("=" * 60)
+
+    results = run_sweep(
+        args.pairs, confidences, stop_losses, take_profits,
+        initial_balance=args.initial_balance,
+        start_index=args.start_index,
+        workers=args.workers
+    )
+    ranked = rank_results(results, args.sort)
+    ranked.to_csv(args.output, index=False)
+
+    print(f"\nMelhores combinações por {args.sort}:")
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(ranked.head(args.top).to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+
+    print(f"\n✓ Resultados salvos em: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
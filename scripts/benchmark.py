@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+"""
+Benchmark das etapas do pipeline com dados sintéticos reprodutíveis
+
+Para cada tamanho de dataset (gerado por generate_synthetic_data) mede tempo
+de parede, tempo de CPU e pico de memória de:
+
+    indicators  add_technical_indicators
+    labels      create_labels
+    features    create_features
+    train       train_for_symbol_interval
+    predict     make_prediction
+    backtest    Backtester.run
+
+Cada etapa roda em um processo novo, com entradas lidas de um diretório de
+trabalho temporário, então o pico de memória de uma etapa não é contaminado
+pelas anteriores. O pico é o high-water mark do RSS (VmHWM), zerado logo antes
+da etapa; em sistemas sem /proc usa-se ru_maxrss.
+
+Uso:
+    python3 benchmark.py run [--sizes 10k,100k,1m] [--stages ...] [--output arquivo.json]
+                             [--baseline baseline.json]
+    python3 benchmark.py compare <baseline.json> <resultado.json> [--tolerance 0.2]
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+
+from profiling import reset_peak_rss, current_rss_mb, peak_rss_mb
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_OUTPUT = os.path.join(PROJECT_DIR, 'benchmark_results.json')
+
+BENCH_SYMBOL = 'BENCHUSDT'
+BENCH_INTERVAL = '5m'
+BENCH_INTERVAL_MINUTES = 5
+BENCH_BASE_PRICE = 2500
+BENCH_VOLATILITY = 0.025
+
+STAGES = ['indicators', 'labels', 'features', 'train', 'predict', 'backtest']
+DEFAULT_SIZES = '10k,100k'
+
+# Diferenças abaixo destes valores são tratadas como ruído na comparação
+MIN_TIME_DELTA = 0.010  # segundos
+MIN_MEMORY_DELTA = 5.0  # MB
+
+_SIZE_SUFFIXES = {'k': 10**3, 'm': 10**6}
+
+
+def parse_size(value):
+    """Converte '10k', '5m' ou '250000' em número de velas"""
+    value = value.strip().lower()
+    if value[-1:] in _SIZE_SUFFIXES:
+        return int(float(value[:-1]) * _SIZE_SUFFIXES[value[-1]])
+    return int(value)
+
+
+# ---------------------------------------------------------------------------
+# Etapas (executadas no processo filho)
+# ---------------------------------------------------------------------------
+
+def _configure_workspace(workspace):
+    """
+    Aponta os diretórios dos módulos do pipeline para o diretório de trabalho
+
+    Inclui os diretórios lidos por funções auxiliares (ex: candle_store.PROCESSED_DIR
+    em train_model.training_period), para nenhuma etapa ler os dados reais do projeto.
+    """
+    import candle_store
+    import add_technical_indicators
+    import streaming_indicators
+    import feature_store
+    import prepare_training_data
+    import model_bundle
+    import train_model
+    import predict
+    import backtest
+
+    historical = os.path.join(workspace, 'data', 'historical')
+    processed = os.path.join(workspace, 'data', 'processed')
+    training = os.path.join(workspace, 'data', 'training')
+    models = os.path.join(workspace, 'models')
+
+    candle_store.HISTORICAL_DIR = historical
+    candle_store.PROCESSED_DIR = processed
+    add_technical_indicators.DATA_DIR = historical
+    add_technical_indicators.PROCESSED_DIR = processed
+    streaming_indicators.HISTORICAL_DIR = historical
+    streaming_indicators.PROCESSED_DIR = processed
+    feature_store.PROCESSED_DIR = processed
+    prepare_training_data.PROCESSED_DIR = processed
+    prepare_training_data.TRAINING_DIR = training
+    model_bundle.MODELS_DIR = models
+    train_model.TRAINING_DIR = training
+    train_model.MODELS_DIR = models
+    predict.MODELS_DIR = models
+    predict.DATA_DIR = processed
+    backtest.MODELS_DIR = models
+    backtest.DATA_DIR = processed
+
+    return {
+        'historical': historical,
+        'labeled': os.path.join(workspace, 'data', 'labeled'),
+        'processed': processed,
+        'training': training,
+        'models': models,
+    }
+
+
+def _stage_indicators(dirs, options):
+    from candle_store import load_candles, save_candles
+    from add_technical_indicators import add_technical_indicators
+
+    df = load_candles(dirs['historical'], options['name'])
+    result = yield (add_technical_indicators, (df,), {})
+    save_candles(result, dirs['processed'], options['name'])
+    return len(df)
+
+
+def _stage_labels(dirs, options):
+    from candle_store import load_candles, save_candles
+    from prepare_training_data import create_labels
+
+    df = load_candles(dirs['processed'], options['name'])
+    result = yield (create_labels, (df,), {})
+    save_candles(result, dirs['labeled'], options['name'])
+    return len(df)
+
+
+def _stage_features(dirs, options):
+    from sklearn.model_selection import train_test_split
+    from candle_store import load_candles
+    from prepare_training_data import create_features, prepare_dataset
+
+    df = load_candles(dirs['labeled'], options['name'])
+    result = yield (create_features, (df,), {})
+
+    # Mesmo formato gravado por prepare_training_data.process_file
+    X, y, feature_columns = prepare_dataset(result)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y
+    )
+    os.makedirs(dirs['training'], exist_ok=True)
+    for suffix, values in (('X_train', X_train), ('X_test', X_test), ('y_train', y_train), ('y_test', y_test)):
+        np.save(os.path.join(dirs['training'], f"{options['name']}_{suffix}.npy"), values)
+    with open(os.path.join(dirs['training'], f"{options['name']}_features.txt"), 'w') as f:
+        f.write('\n'.join(feature_columns))
+    return len(df)
+
+
+def _stage_train(dirs, options):
+    from train_model import train_for_symbol_interval
+
+    os.makedirs(dirs['models'], exist_ok=True)
+    X_train = np.load(os.path.join(dirs['training'], f"{options['name']}_X_train.npy"), mmap_mode='r')
+    rows = len(X_train)
+    del X_train
+
+    yield (train_for_symbol_interval, (BENCH_SYMBOL, BENCH_INTERVAL), {'fast': options['fast_train']})
+    return rows
+
+
+def _stage_predict(dirs, options):
+    from predict import make_prediction
+
+    result = yield (make_prediction, (BENCH_SYMBOL, BENCH_INTERVAL), {})
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+    return 1
+
+
+def _stage_backtest(dirs, options):
+    from backtest import Backtester
+
+    backtester = Backtester(BENCH_SYMBOL, BENCH_INTERVAL)
+    start_index = min(1000, len(backtester.data) // 10)
+    vectorized = not options['backtest_loop']
+
+    def run():
+        # O estado do backtester é zerado para permitir repetições
+        backtester.balance = backtester.initial_balance
+        backtester.position = None
+        backtester.entry_price = 0
+        backtester.trades = []
+        return backtester.run(start_index=start_index, vectorized=vectorized)
+
+    yield (run, (), {})
+    return len(backtester.data) - start_index
+
+
+STAGE_FUNCTIONS = {
+    'indicators': _stage_indicators,
+    'labels': _stage_labels,
+    'features': _stage_features,
+    'train': _stage_train,
+    'predict': _stage_predict,
+    'backtest': _stage_backtest,
+}
+
+
+def _run_stage(stage, workspace, options):
+    """
+    Executa uma etapa no processo filho
+
+    Cada função de etapa prepara as entradas (fora da medição), entrega via
+    yield a chamada a medir e grava as saídas usadas pela etapa seguinte.
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    dirs = _configure_workspace(workspace)
+
+    generator = STAGE_FUNCTIONS[stage](dirs, options)
+    function, args, kwargs = next(generator)
+
+    wall_times, cpu_times = [], []
+    rss_before = current_rss_mb()
+    peak_reset = reset_peak_rss()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(options['repeat']):
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            result = function(*args, **kwargs)
+            wall_times.append(time.perf_counter() - wall_start)
+            cpu_times.append(time.process_time() - cpu_start)
+
+    peak = peak_rss_mb()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            generator.send(result)
+        except StopIteration as stop:
+            rows = stop.value
+
+    return {
+        'wall_seconds': min(wall_times),
+        'wall_seconds_mean': float(np.mean(wall_times)),
+        'cpu_seconds': min(cpu_times),
+        'peak_rss_mb': round(peak, 1),
+        # Sem reset do high-water mark o pico inclui o carregamento das entradas
+        'peak_increase_mb': round(max(0.0, peak - rss_before), 1) if peak_reset else None,
+        'rows': rows,
+        'repeat': options['repeat'],
+    }
+
+
+# ---------------------------------------------------------------------------
+# Execução
+# ---------------------------------------------------------------------------
+
+def prepare_workspace(workspace, num_candles, seed=42):
+    """Gera o dataset sintético direto como série histórica do diretório de trabalho"""
+    from generate_synthetic_data import generate_to_store
+
+    start = time.perf_counter()
+    generate_to_store(
+        f"{BENCH_SYMBOL}_{BENCH_INTERVAL}", BENCH_BASE_PRICE, BENCH_VOLATILITY, num_candles,
+        BENCH_INTERVAL_MINUTES, directory=os.path.join(workspace, 'data', 'historical'), seed=seed
+    )
+    return time.perf_counter() - start
+
+
+def run_benchmarks(sizes, stages, repeat=1, fast_train=True, backtest_loop=False, seed=42, keep_workspace=False):
+    """
+    Executa as etapas escolhidas para cada tamanho de dataset
+
+    Returns:
+        Dicionário com ambiente, configuração e uma linha por (tamanho, etapa)
+    """
+    import sklearn
+    import pandas as pd
+
+    options = {
+        'name': f"{BENCH_SYMBOL}_{BENCH_INTERVAL}",
+        'repeat': repeat,
+        'fast_train': fast_train,
+        'backtest_loop': backtest_loop,
+    }
+    context = multiprocessing.get_context('spawn')
+    results = []
+
+    for size in sizes:
+        workspace = tempfile.mkdtemp(prefix=f'benchmark_{size}_')
+        print(f"\n{size} velas (diretório de trabalho: {workspace})")
+
+        try:
+            generation = prepare_workspace(workspace, size, seed)
+            print(f"  {'geração':12s} {generation:10.3f} s")
+
+            failed = None
+            for stage in STAGES:
+                if stage not in stages:
+                    continue
+
+                entry = {'size': size, 'stage': stage}
+
+                if failed is not None:
+                    entry['error'] = f"skipped: {failed} failed"
+                    results.append(entry)
+                    print(f"  {stage:12s} {'ignorado':>10s}")
+                    continue
+
+                try:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        entry.update(executor.submit(_run_stage, stage, workspace, options).result())
+                    increase = entry['peak_increase_mb']
+                    print(f"  {stage:12s} {entry['wall_seconds']:10.3f} s  "
+                          f"CPU {entry['cpu_seconds']:9.3f} s  "
+                          f"pico {entry['peak_rss_mb']:9.1f} MB"
+                          + (f" (+{increase:.1f} MB)" if increase is not None else ""))
+                except Exception as e:
+                    entry['error'] = str(e)
+                    failed = stage
+                    print(f"  {stage:12s} ✗ {e}")
+
+                results.append(entry)
+        finally:
+            if keep_workspace:
+                print(f"  Diretório de trabalho mantido: {workspace}")
+            else:
+                shutil.rmtree(workspace, ignore_errors=True)
+
+    return {
+        'created_at': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'sklearn': sklearn.__version__,
+        },
+        'config': {
+            'sizes': sizes,
+            'stages': [stage for stage in STAGES if stage in stages],
+            'repeat': repeat,
+            'fast_train': fast_train,
+            'backtest_loop': backtest_loop,
+            'seed': seed,
+            'interval': BENCH_INTERVAL,
+        },
+        'results': results,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Comparação
+# ---------------------------------------------------------------------------
+
+def compare_results(baseline, current, tolerance=0.2, memory_tolerance=None):
+    """
+    Compara dois resultados e aponta regressões
+
+    Uma métrica regrediu quando piorou mais que a tolerância relativa e também
+    mais que o limite absoluto de ruído (MIN_TIME_DELTA / MIN_MEMORY_DELTA).
+
+    Returns:
+        Lista de dicionários, um por (tamanho, etapa, métrica) presente nos dois
+    """
+    memory_tolerance = tolerance if memory_tolerance is None else memory_tolerance
+    metrics = [
+        ('wall_seconds', tolerance, MIN_TIME_DELTA),
+        ('cpu_seconds', tolerance, MIN_TIME_DELTA),
+        ('peak_rss_mb', memory_tolerance, MIN_MEMORY_DELTA),
+    ]
+
+    previous = {(r['size'], r['stage']): r for r in baseline['results'] if 'error' not in r}
+    comparison = []
+
+    for entry in current['results']:
+        key = (entry['size'], entry['stage'])
+        if key not in previous or 'error' in entry:
+            continue
+
+        for metric, limit, min_delta in metrics:
+            old, new = previous[key].get(metric), entry.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            comparison.append({
+                'size': entry['size'],
+                'stage': entry['stage'],
+                'metric': metric,
+                'baseline': old,
+                'current': new,
+                'change': change,
+                'regression': change > limit and new - old > min_delta,
+            })
+
+    return comparison
+
+
+def print_comparison(comparison):
+    print(f"\n{'Tamanho':>10s} {'Etapa':12s} {'Métrica':14s} {'Baseline':>12s} {'Atual':>12s} {'Variação':>9s}")
+    print("-" * 74)
+    for row in comparison:
+        flag = "  ✗ REGRESSÃO" if row['regression'] else ""
+        print(f"{row['size']:>10d} {row['stage']:12s} {row['metric']:14s} "
+              f"{row['baseline']:12.3f} {row['current']:12.3f} {row['change']*100:+8.1f}%{flag}")
+
+    regressions = [row for row in comparison if row['regression']]
+    print("-" * 74)
+    if regressions:
+        print(f"✗ {len(regressions)} regressão(ões) detectada(s)")
+    else:
+        print("✓ Nenhuma regressão")
+    return regressions
+
+
+def load_results(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark das etapas do pipeline')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Executa o benchmark')
+    run_parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                            help='Tamanhos em velas, separados por vírgula (ex: 10k,100k,1m,5m)')
+    run_parser.add_argument('--stages', default=','.join(STAGES),
+                            help=f"Etapas, separadas por vírgula ({','.join(STAGES)})")
+    run_parser.add_argument('--repeat', type=int, default=1, help='Repetições por etapa (usa o menor tempo)')
+    run_parser.add_argument('--full-train', action='store_true',
+                            help='Treina todos os candidatos (padrão: modo rápido, RF + HGB)')
+    run_parser.add_argument('--backtest-loop', action='store_true',
+                            help='Mede o backtest em laço (padrão: vetorizado)')
+    run_parser.add_argument('--seed', type=int, default=42, help='Semente dos dados sintéticos')
+    run_parser.add_argument('--output', default=DEFAULT_OUTPUT, help='JSON de saída')
+    run_parser.add_argument('--baseline', help='Compara o resultado com este JSON ao final')
+    run_parser.add_argument('--tolerance', type=float, default=0.2, help='Piora relativa tolerada (0.2 = 20%%)')
+    run_parser.add_argument('--keep-workspace', action='store_true', help='Mantém os diretórios de trabalho')
+
+    compare_parser = subparsers.add_parser('compare', help='Compara dois resultados')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--tolerance', type=float, default=0.2, help='Piora relativa tolerada (0.2 = 20%%)')
+    compare_parser.add_argument('--memory-tolerance', type=float, default=None,
+                                help='Piora relativa tolerada para memória (padrão: --tolerance)')
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        regressions = print_comparison(compare_results(
+            load_results(args.baseline), load_results(args.current),
+            args.tolerance, args.memory_tolerance
+        ))
+        sys.exit(1 if regressions else 0)
+
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = sorted(set(stages) - set(STAGES))
+    if unknown:
+        parser.error(f"Etapas desconhecidas: {', '.join(unknown)}")
+
+    print("=" * 60)
+    print("BENCHMARK DO PIPELINE")
+    print("=" * 60)
+    print(f"Tamanhos: {', '.join(str(size) for size in sizes)}")
+    print(f"Etapas: {', '.join(stage for stage in STAGES if stage in stages)}")
+    print("=" * 60)
+
+    report = run_benchmarks(
+        sizes, stages,
+        repeat=args.repeat,
+        fast_train=not args.full_train,
+        backtest_loop=args.backtest_loop,
+        seed=args.seed,
+        keep_workspace=args.keep_workspace
+    )
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Resultados salvos em: {args.output}")
+
+    if args.baseline:
+        regressions = print_comparison(compare_results(load_results(args.baseline), report, args.tolerance))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
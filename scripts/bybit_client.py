@@ -6,18 +6,111 @@ Gerencia coleta de dados e execução de trades
 
 import os
 import sys
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pybit.unified_trading import HTTP
+import numpy as np
 import pandas as pd
 import time
 
+from profiling import span
+
+KLINE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover']
+MAX_KLINE_LIMIT = 1000
+
+# Mapear intervalo para milissegundos
+INTERVAL_MS = {
+    '1': 60 * 1000,
+    '3': 3 * 60 * 1000,
+    '5': 5 * 60 * 1000,
+    '15': 15 * 60 * 1000,
+    '30': 30 * 60 * 1000,
+    '60': 60 * 60 * 1000,
+    '120': 120 * 60 * 1000,
+    '240': 240 * 60 * 1000,
+    '360': 360 * 60 * 1000,
+    '720': 720 * 60 * 1000,
+    'D': 24 * 60 * 60 * 1000,
+    'W': 7 * 24 * 60 * 60 * 1000,
+}
+
+# Limites padrão de requisições de mercado (Bybit permite ~10 req/s por endpoint)
+DEFAULT_RATE_LIMIT = 10.0
+DEFAULT_BURST = 10
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF = 0.5
+
+
+class TokenBucket:
+    """
+    Limitador de taxa token-bucket compartilhado entre threads
+
+    Args:
+        rate: Tokens repostos por segundo
+        capacity: Máximo de tokens acumulados (rajada)
+    """
+
+    def __init__(self, rate=DEFAULT_RATE_LIMIT, capacity=DEFAULT_BURST):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(max(1, capacity))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Bloqueia até haver tokens disponíveis"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+
+                wait = (tokens - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+def split_windows(start_time, end_time, interval_ms, limit=MAX_KLINE_LIMIT):
+    """
+    Divide [start_time, end_time] em janelas disjuntas de até `limit` velas
+
+    Returns:
+        Lista de tuplas (start, end) em milissegundos, da mais antiga para a mais recente
+    """
+    span = interval_ms * limit
+    first = start_time - start_time % interval_ms
+
+    return [
+        (window_start, min(window_start + span - 1, end_time))
+        for window_start in range(first, end_time + 1, span)
+    ]
+
+
 class BybitClient:
-    def __init__(self, testnet=False):
+    def __init__(self, testnet=False, endpoint=None, rate_limit=DEFAULT_RATE_LIMIT,
+                 burst=DEFAULT_BURST, max_workers=DEFAULT_WORKERS,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF):
         """
         Inicializa cliente Bybit
         
         Args:
             testnet: Se True, usa testnet. Se False, usa produção.
+            endpoint: URL base alternativa (ex: servidor local de testes).
+                      Padrão: variável BYBIT_ENDPOINT, se definida.
+            rate_limit: Requisições por segundo permitidas na coleta histórica
+            burst: Rajada máxima de requisições do token bucket
+            max_workers: Janelas buscadas em paralelo
+            max_retries: Tentativas por janela antes de desistir
+            backoff: Espera base (s) do backoff exponencial entre tentativas
         """
         api_key = os.getenv('BYBIT_API_KEY')
         api_secret = os.getenv('BYBIT_API_SECRET')
@@ -31,7 +124,41 @@ class BybitClient:
             api_secret=api_secret
         )
         
+        endpoint = endpoint or os.getenv('BYBIT_ENDPOINT')
+        if endpoint:
+            self.session.endpoint = endpoint.rstrip('/')
+        
         self.testnet = testnet
+        self.rate_limiter = TokenBucket(rate_limit, burst)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+    
+    def _request_klines(self, symbol, interval, start_time=None, end_time=None, limit=200):
+        """Faz uma requisição de klines e retorna as linhas brutas (levanta exceção em erro)"""
+        response = self.session.get_kline(
+            category="spot",
+            symbol=symbol,
+            interval=interval,
+            start=start_time,
+            end=end_time,
+            limit=limit
+        )
+        
+        if response['retCode'] != 0:
+            raise Exception(f"Bybit API error: {response['retMsg']}")
+        
+        return response['result']['list']
+    
+    @staticmethod
+    def _klines_to_dataframe(klines):
+        """Converte linhas brutas (mais antigas primeiro) em DataFrame OHLCV"""
+        values = np.array(klines, dtype=np.float64).reshape(-1, len(KLINE_COLUMNS))
+        
+        df = pd.DataFrame(values, columns=KLINE_COLUMNS)
+        df['timestamp'] = pd.to_datetime(values[:, 0].astype(np.int64), unit='ms')
+        
+        return df
     
     def get_klines(self, symbol, interval, start_time=None, end_time=None, limit=200):
         """
@@ -48,29 +175,10 @@ class BybitClient:
             DataFrame com dados OHLCV
         """
         try:
-            response = self.session.get_kline(
-                category="spot",
-                symbol=symbol,
-                interval=interval,
-                start=start_time,
-                end=end_time,
-                limit=limit
-            )
-            
-            if response['retCode'] != 0:
-                raise Exception(f"Bybit API error: {response['retMsg']}")
-            
-            klines = response['result']['list']
+            klines = self._request_klines(symbol, interval, start_time, end_time, limit)
             
             # Converter para DataFrame
-            df = pd.DataFrame(klines, columns=[
-                'timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover'
-            ])
-            
-            # Converter tipos
-            df['timestamp'] = pd.to_datetime(df['timestamp'].astype(int), unit='ms')
-            for col in ['open', 'high', 'low', 'close', 'volume', 'turnover']:
-                df[col] = df[col].astype(float)
+            df = self._klines_to_dataframe(klines)
             
             # Ordenar por timestamp (mais antigo primeiro)
             df = df.sort_values('timestamp').reset_index(drop=True)
@@ -81,68 +189,79 @@ class BybitClient:
             print(f"Error fetching klines: {e}")
             return None
     
-    def get_historical_data(self, symbol, interval, days=365):
+    def _fetch_window(self, symbol, interval, window):
+        """
+        Busca uma janela com limitação de taxa e retry com backoff exponencial
+        
+        Returns:
+            Linhas brutas da janela, da mais antiga para a mais recente
+        """
+        start_time, end_time = window
+        
+        for attempt in range(self.max_retries):
+            self.rate_limiter.acquire()
+            try:
+                klines = self._request_klines(symbol, interval, start_time, end_time, MAX_KLINE_LIMIT)
+                # A Bybit retorna as velas da mais recente para a mais antiga
+                return [k for k in reversed(klines) if start_time <= int(k[0]) <= end_time]
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                print(f"  Window {start_time}-{end_time} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+    
+    def get_historical_data(self, symbol, interval, days=365, start_time=None, end_time=None):
         """
         Busca dados históricos completos
         
+        O intervalo é dividido em janelas independentes de até 1000 velas,
+        buscadas em paralelo sob o token bucket do cliente. A primeira janela
+        começa na abertura da vela que contém `start_time`.
+        
+        Cada janela é repetida até `max_retries` vezes com backoff; se ainda
+        assim falhar, a exceção é propagada. Diferente da versão anterior, que
+        parava no primeiro erro e retornava os dados já coletados, não há
+        retorno parcial (ver check_bybit_client.py).
+        
         Args:
             symbol: Par de trading
             interval: Intervalo das velas
             days: Número de dias para buscar
+            start_time: Início em milissegundos (opcional, substitui `days`)
+            end_time: Fim em milissegundos (opcional, padrão: agora)
         
         Returns:
-            DataFrame com dados históricos
-        """
-        print(f"Fetching {days} days of {symbol} {interval} data from Bybit...")
+            DataFrame com dados históricos, em ordem e sem velas repetidas
+            (None se o intervalo não tiver velas)
         
+        Raises:
+            Exception: erro da última tentativa de uma janela que falhou
+        """
         # Calcular timestamps
-        end_time = int(datetime.now().timestamp() * 1000)
-        start_time = int((datetime.now() - timedelta(days=days)).timestamp() * 1000)
+        if end_time is None:
+            end_time = int(datetime.now().timestamp() * 1000)
+        if start_time is None:
+            start_time = end_time - int(timedelta(days=days).total_seconds() * 1000)
         
-        all_data = []
-        current_end = end_time
+        interval_ms = INTERVAL_MS.get(interval, 60 * 60 * 1000)
+        windows = split_windows(start_time, end_time, interval_ms)
         
-        # Mapear intervalo para milissegundos
-        interval_ms = {
-            '1': 60 * 1000,
-            '3': 3 * 60 * 1000,
-            '5': 5 * 60 * 1000,
-            '15': 15 * 60 * 1000,
-            '30': 30 * 60 * 1000,
-            '60': 60 * 60 * 1000,
-            '120': 120 * 60 * 1000,
-            '240': 240 * 60 * 1000,
-            'D': 24 * 60 * 60 * 1000,
-        }.get(interval, 60 * 60 * 1000)
+        print(f"Fetching {symbol} {interval} data from Bybit "
+              f"({len(windows)} windows, {self.max_workers} workers)...")
         
-        # Buscar em lotes de 1000 velas
-        while current_end > start_time:
-            df = self.get_klines(symbol, interval, end_time=current_end, limit=1000)
-            
-            if df is None or len(df) == 0:
-                break
-            
-            all_data.append(df)
-            
-            # Atualizar current_end para buscar velas mais antigas
-            current_end = int(df['timestamp'].iloc[0].timestamp() * 1000) - 1
-            
-            print(f"  Fetched {len(df)} candles, oldest: {df['timestamp'].iloc[0]}")
-            
-            # Rate limiting
-            time.sleep(0.1)
+        with span('fetch', symbol=symbol, interval=interval, windows=len(windows)) as s:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # map preserva a ordem das janelas, que já são disjuntas e crescentes
+                results = list(executor.map(lambda w: self._fetch_window(symbol, interval, w), windows))
             
-            # Verificar se chegamos ao início
-            if current_end <= start_time:
-                break
+            klines = [k for window_klines in results for k in window_klines]
+            s.rows = len(klines)
         
-        if not all_data:
+        if not klines:
             return None
         
-        # Combinar todos os dados
-        result = pd.concat(all_data, ignore_index=True)
-        result = result.sort_values('timestamp').reset_index(drop=True)
-        result = result.drop_duplicates(subset=['timestamp']).reset_index(drop=True)
+        result = self._klines_to_dataframe(klines)
         
         print(f"✓ Total: {len(result)} candles from {result['timestamp'].iloc[0]} to {result['timestamp'].iloc[-1]}")
         
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Buffer circular de velas em memória fixa (NumPy structured array)
+
+Mantém as últimas `capacity` velas de um par sem concatenar, ordenar ou
+deduplicar DataFrames a cada atualização:
+
+- append da vela nova em O(1), sobrescrevendo a mais antiga quando cheio;
+- correção in-place da vela ainda em formação (mesmo timestamp);
+- last(n) devolve uma view das últimas n velas, contígua e sem cópia.
+
+Cada vela é gravada duas vezes (posições i e i + capacity) num array de
+2 * capacity linhas, de modo que qualquer janela das últimas n velas é uma
+fatia contígua, sem "dar a volta" no fim do buffer. A memória é fixa:
+2 * capacity * 48 bytes, independente de quanto tempo o bot roda.
+
+Um único escritor por buffer; leitores devem tratar as views como somente leitura.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Colunas OHLCV; timestamp em nanossegundos UTC (mesmo formato do candle_store)
+CANDLE_DTYPE = np.dtype([
+    ('timestamp', np.int64),
+    ('open', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('close', np.float64),
+    ('volume', np.float64),
+])
+CANDLE_FIELDS = CANDLE_DTYPE.names
+
+DEFAULT_CAPACITY = 1000
+
+
+def _to_ns(timestamp):
+    """Timestamp (pandas, datetime64, ISO ou int ns) -> int64 ns"""
+    if isinstance(timestamp, (int, np.integer)):
+        return int(timestamp)
+    return pd.Timestamp(timestamp).value
+
+
+class CandleBuffer:
+    """
+    Últimas `capacity` velas de uma série, em ordem cronológica
+
+    Args:
+        capacity: Número máximo de velas mantidas
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+
+        self.capacity = int(capacity)
+        self._data = np.zeros(2 * self.capacity, dtype=CANDLE_DTYPE)
+        self._next = 0
+        self._size = 0
+        self.forming = False
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    @property
+    def last_timestamp(self):
+        """Timestamp (ns) da vela mais recente, ou None se vazio"""
+        if not self._size:
+            return None
+        return int(self._data['timestamp'][self._next - 1 + self.capacity])
+
+    def _write(self, index, record):
+        self._data[index] = record
+        self._data[index + self.capacity] = record
+
+    def upsert(self, candle, closed=True):
+        """
+        Grava uma vela: nova (timestamp posterior) ou correção da última (mesmo timestamp)
+
+        Args:
+            candle: Mapeamento com as colunas OHLCV
+            closed: False enquanto a vela ainda está em formação
+
+        Returns:
+            False se a vela for anterior à última (ignorada), True caso contrário
+        """
+        timestamp = _to_ns(candle['timestamp'])
+        record = (timestamp, candle['open'], candle['high'], candle['low'], candle['close'], candle['volume'])
+        last = self.last_timestamp
+
+        if last is not None and timestamp == last:
+            self._write((self._next - 1) % self.capacity, record)
+        elif last is None or timestamp > last:
+            self._write(self._next, record)
+            self._next = (self._next + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+        else:
+            return False
+
+        self.forming = not closed
+        return True
+
+    def extend(self, df):
+        """
+        Acrescenta velas fechadas em lote (ex: carga inicial do candle_store)
+
+        Apenas velas posteriores à última são gravadas; se houver mais que
+        `capacity`, ficam as mais recentes.
+
+        Returns:
+            Número de velas gravadas
+        """
+        timestamps = pd.to_datetime(df['timestamp']).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        order = np.argsort(timestamps, kind='stable')
+        last = self.last_timestamp
+        if last is not None:
+            order = order[timestamps[order] > last]
+        if len(order) > 1:
+            order = order[np.concatenate([[True], np.diff(timestamps[order]) != 0])]
+        order = order[-self.capacity:]
+
+        count = len(order)
+        if not count:
+            return 0
+
+        records = np.empty(count, dtype=CANDLE_DTYPE)
+        records['timestamp'] = timestamps[order]
+        for field in CANDLE_FIELDS[1:]:
+            records[field] = np.asarray(df[field], dtype=np.float64)[order]
+
+        indices = (self._next + np.arange(count)) % self.capacity
+        self._data[indices] = records
+        self._data[indices + self.capacity] = records
+
+        self._next = (self._next + count) % self.capacity
+        self._size = min(self._size + count, self.capacity)
+        self.forming = False
+        return count
+
+    def last(self, n=None, closed_only=False):
+        """
+        View somente leitura das últimas n velas (todas, se n for None)
+
+        Args:
+            closed_only: Exclui a vela em formação, se houver
+
+        Returns:
+            Structured array (CANDLE_DTYPE), sem cópia; buf.last(50)['close'] também é view
+        """
+        skip = 1 if closed_only and self.forming and self._size else 0
+        available = self._size - skip
+        n = available if n is None else max(0, min(int(n), available))
+
+        end = self._next + self.capacity - skip
+        view = self._data[end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def latest(self):
+        """Vela mais recente (fechada ou em formação) como registro, ou None"""
+        if not self._size:
+            return None
+        return self._data[self._next - 1 + self.capacity].copy()
+
+    def to_frame(self, n=None, closed_only=False):
+        """Cópia das últimas n velas como DataFrame (timestamp em datetime64)"""
+        view = self.last(n, closed_only)
+        df = pd.DataFrame({field: view[field] for field in CANDLE_FIELDS[1:]})
+        df.insert(0, 'timestamp', view['timestamp'].view('datetime64[ns]'))
+        return df
+
+    @classmethod
+    def from_frame(cls, df, capacity=DEFAULT_CAPACITY):
+        buffer = cls(capacity)
+        buffer.extend(df)
+        return buffer
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""
+Armazenamento de séries de velas em formato colunar binário
+
+Cada série (ex: ETHUSDT_1h) é um diretório com um arquivo .npy por coluna
+e um manifest.json. Timestamps são gravados como int64 (nanossegundos UTC)
+e as demais colunas como float64. A leitura usa np.load(mmap_mode='r'),
+então o acesso às colunas não exige parsing nem cópia.
+
+    data/processed/ETHUSDT_1h/
+        manifest.json
+        timestamp.npy
+        open.npy
+        ...
+
+Séries ainda em CSV (<nome>.csv) continuam sendo lidas como fallback.
+
+Uso: python3 candle_store.py convert [diretório ...] [--remove-csv]
+     python3 candle_store.py info <diretório> <nome>
+"""
+
+import io
+import os
+import sys
+import json
+import shutil
+import hashlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORICAL_DIR = os.path.join(PROJECT_DIR, 'data', 'historical')
+PROCESSED_DIR = os.path.join(PROJECT_DIR, 'data', 'processed')
+
+STORE_FORMAT = 'columnar-v1'
+MANIFEST_FILE = 'manifest.json'
+TIMESTAMP_COLUMN = 'timestamp'
+
+# Tamanho do bloco lido a partir do fim do arquivo
+TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def _read_tail_lines(f, n, start, end):
+    """Lê as últimas n linhas do intervalo [start, end) de um arquivo binário"""
+    position = end
+    buffer = b''
+
+    # Ler blocos do fim para o início até ter n+1 quebras de linha
+    # (a linha mais antiga pode estar incompleta no início do buffer)
+    while position > start and buffer.count(b'\n') <= n:
+        read_size = min(TAIL_BLOCK_SIZE, position - start)
+        position -= read_size
+        f.seek(position)
+        buffer = f.read(read_size) + buffer
+
+    lines = buffer.rstrip(b'\r\n').split(b'\n')
+    return [line for line in lines[-n:] if line]
+
+
+def read_csv_tail(path, n=1, parse_dates=('timestamp',)):
+    """
+    Lê apenas as últimas n linhas de um CSV, sem percorrer o arquivo inteiro
+
+    O custo depende apenas de n, não do tamanho do histórico.
+
+    Args:
+        path: Caminho do arquivo CSV (com cabeçalho)
+        n: Número de linhas finais a retornar
+        parse_dates: Colunas a converter para datetime
+
+    Returns:
+        DataFrame com as últimas n linhas (ordem original do arquivo)
+    """
+    file_size = os.path.getsize(path)
+
+    with open(path, 'rb') as f:
+        header = f.readline()
+        header_size = f.tell()
+
+        lines = _read_tail_lines(f, n, header_size, file_size)
+
+    content = header + b'\n'.join(lines) + b'\n'
+    df = pd.read_csv(io.BytesIO(content))
+
+    for column in parse_dates:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column])
+
+    return df
+
+
+# ---------------------------------------------------------------------------
+# Formato colunar
+# ---------------------------------------------------------------------------
+
+def series_path(directory, name):
+    """Diretório da série colunar"""
+    return os.path.join(directory, name)
+
+
+def csv_path(directory, name):
+    """Caminho do CSV legado da série"""
+    return os.path.join(directory, f"{name}.csv")
+
+
+def is_columnar(directory, name):
+    """Indica se a série existe no formato colunar"""
+    return os.path.exists(os.path.join(series_path(directory, name), MANIFEST_FILE))
+
+
+def series_exists(directory, name):
+    """Indica se a série existe em qualquer formato"""
+    return is_columnar(directory, name) or os.path.exists(csv_path(directory, name))
+
+
+def list_series(directory):
+    """Lista nomes das séries de um diretório (colunares e CSV legados)"""
+    if not os.path.isdir(directory):
+        return []
+
+    names = set()
+    for entry in os.listdir(directory):
+        if entry.endswith('.csv'):
+            names.add(entry[:-len('.csv')])
+        elif entry.endswith(('.tmp', '.old')):
+            continue
+        elif os.path.exists(os.path.join(directory, entry, MANIFEST_FILE)):
+            names.add(entry)
+
+    return sorted(names)
+
+
+def read_manifest(directory, name):
+    """Lê o manifest de uma série colunar"""
+    with open(os.path.join(series_path(directory, name), MANIFEST_FILE), 'r') as f:
+        return json.load(f)
+
+
+def _write_manifest(path, manifest):
+    tmp_path = os.path.join(path, MANIFEST_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, MANIFEST_FILE))
+
+
+def _to_columns(df):
+    """Converte DataFrame em arrays por coluna (timestamp int64, resto float64)"""
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if column == TIMESTAMP_COLUMN:
+            values = pd.to_datetime(values).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        else:
+            values = values.to_numpy(dtype=np.float64)
+        columns[column] = np.ascontiguousarray(values)
+    return columns
+
+
+def _update_hash(previous_hash, columns):
+    """Hash encadeado do conteúdo: permite atualizar em O(linhas novas) no append"""
+    digest = hashlib.sha256(previous_hash.encode())
+    for column, values in columns.items():
+        digest.update(column.encode())
+        digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+def _build_manifest(columns, rows, content_hash, first_timestamp=None):
+    timestamps = columns.get(TIMESTAMP_COLUMN)
+    if first_timestamp is None and timestamps is not None and len(timestamps):
+        first_timestamp = int(timestamps[0])
+
+    return {
+        'format': STORE_FORMAT,
+        'rows': int(rows),
+        'columns': {column: str(values.dtype) for column, values in columns.items()},
+        'first_timestamp': first_timestamp,
+        'last_timestamp': int(timestamps[-1]) if timestamps is not None and len(timestamps) else None,
+        'content_hash': content_hash,
+        'updated_at': datetime.now().isoformat()
+    }
+
+
+def save_candles(df, directory, name):
+    """
+    Grava uma série completa no formato colunar (substitui a anterior)
+
+    A gravação é feita em um diretório temporário e trocada no final,
+    então leitores nunca veem a série pela metade.
+
+    Args:
+        df: DataFrame com coluna timestamp e colunas numéricas
+        directory: Diretório base (ex: data/processed)
+        name: Nome da série (ex: ETHUSDT_1h)
+
+    Returns:
+        Manifest gravado
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = series_path(directory, name)
+    tmp_path = path + '.tmp'
+    old_path = path + '.old'
+
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = _to_columns(df)
+    for column, values in columns.items():
+        np.save(os.path.join(tmp_path, f"{column}.npy"), values)
+
+    manifest = _build_manifest(columns, len(df), _update_hash('', columns))
+    _write_manifest(tmp_path, manifest)
+
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+    return manifest
+
+
+def _grown_npy_header(file_path, values, rows):
+    """
+    Cabeçalho de um .npy 1-D com `rows` + len(values) elementos
+
+    O cabeçalho do .npy reserva espaço para o crescimento do shape, então
+    normalmente ele pode ser reescrito no lugar.
+
+    Returns:
+        (cabeçalho, tamanho do cabeçalho), ou None se o novo cabeçalho não
+        couber no espaço original
+    """
+    with open(file_path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        header_size = f.tell()
+
+    if len(shape) != 1 or dtype != values.dtype:
+        return None
+
+    header = io.BytesIO()
+    d = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': fortran_order,
+         'shape': (rows + len(values),)}
+    if version == (1, 0):
+        np.lib.format.write_array_header_1_0(header, d)
+    else:
+        np.lib.format.write_array_header_2_0(header, d)
+    header = header.getvalue()
+
+    return (header, header_size) if len(header) == header_size else None
+
+
+def append_candles(df, directory, name):
+    """
+    Acrescenta velas novas ao fim de uma série
+
+    Apenas velas com timestamp posterior à última gravada são anexadas,
+    escrevendo somente os bytes novos de cada coluna. Se a série não existir
+    (ou estiver em CSV), ela é gravada por completo.
+
+    O manifest é o ponto de confirmação: cada coluna é escrita a partir da
+    posição dada por manifest['rows'] (descartando bytes de um append
+    interrompido) e os leitores só enxergam as linhas do manifest, que é
+    gravado por último.
+
+    Returns:
+        Número de velas anexadas
+    """
+    if not is_columnar(directory, name):
+        return merge_candles(df, directory, name)
+
+    manifest = read_manifest(directory, name)
+    columns = _to_columns(df)
+
+    if set(columns) != set(manifest['columns']):
+        raise ValueError(f"Columns do not match stored series {name}: {sorted(columns)}")
+
+    # Apenas velas posteriores à última gravada, em ordem cronológica
+    timestamps = columns[TIMESTAMP_COLUMN]
+    order = np.argsort(timestamps, kind='stable')
+    if manifest['last_timestamp'] is not None:
+        order = order[timestamps[order] > manifest['last_timestamp']]
+    if len(order) > 1:
+        order = order[np.concatenate([[True], np.diff(timestamps[order]) != 0])]
+
+    if len(order) == 0:
+        return 0
+
+    columns = {column: np.ascontiguousarray(columns[column][order]) for column in manifest['columns']}
+    path = series_path(directory, name)
+
+    rows = manifest['rows']
+    headers = {
+        column: _grown_npy_header(os.path.join(path, f"{column}.npy"), values, rows)
+        for column, values in columns.items()
+    }
+
+    if any(header is None for header in headers.values()):
+        # Cabeçalho sem espaço para crescer: reescrever a série inteira
+        combined = pd.concat([load_candles(directory, name), df.iloc[order]], ignore_index=True)
+        save_candles(combined, directory, name)
+        return len(order)
+
+    for column, values in columns.items():
+        header, header_size = headers[column]
+        with open(os.path.join(path, f"{column}.npy"), 'r+b') as f:
+            # Fim dos dados confirmados, não o fim do arquivo
+            f.seek(header_size + rows * values.itemsize)
+            f.write(values.tobytes())
+            f.truncate()
+            f.flush()
+            # Cabeçalho só depois dos dados: nunca aponta além do que foi escrito
+            f.seek(0)
+            f.write(header)
+
+    new_manifest = _build_manifest(
+        columns,
+        rows + len(order),
+        _update_hash(manifest['content_hash'], columns),
+        first_timestamp=manifest['first_timestamp']
+    )
+    _write_manifest(path, new_manifest)
+
+    return len(order)
+
+
+def merge_candles(df, directory, name):
+    """
+    Insere velas em qualquer posição da série (ex: preencher lacunas)
+
+    A série é reescrita por completo; velas já gravadas têm prioridade sobre
+    as novas com o mesmo timestamp. Para acrescentar ao fim use append_candles.
+
+    Returns:
+        Número de velas inseridas
+    """
+    existing = load_candles(directory, name) if series_exists(directory, name) else None
+    if existing is not None:
+        df = pd.concat([existing, df], ignore_index=True)
+    df = df.drop_duplicates(subset=[TIMESTAMP_COLUMN], keep='first')
+    df = df.sort_values(TIMESTAMP_COLUMN).reset_index(drop=True)
+    save_candles(df, directory, name)
+    return len(df) - (len(existing) if existing is not None else 0)
+
+
+def open_columns(directory, name, columns=None):
+    """
+    Abre as colunas de uma série colunar como arrays memory-mapped (zero-copy)
+
+    Args:
+        columns: Lista de colunas desejadas (padrão: todas)
+
+    Returns:
+        dict coluna -> np.memmap somente leitura, com manifest['rows'] linhas
+        (ignora linhas de um append em andamento ou interrompido)
+    """
+    manifest = read_manifest(directory, name)
+    path = series_path(directory, name)
+    columns = list(manifest['columns']) if columns is None else columns
+    rows = manifest['rows']
+
+    return {
+        column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode='r')[:rows]
+        for column in columns
+    }
+
+
+def load_candles(directory, name, columns=None, tail=None):
+    """
+    Carrega uma série como DataFrame (formato colunar ou CSV legado)
+
+    Args:
+        directory: Diretório base (ex: data/processed)
+        name: Nome da série (ex: ETHUSDT_1h)
+        columns: Colunas desejadas (padrão: todas)
+        tail: Se informado, retorna apenas as últimas N velas
+
+    Returns:
+        DataFrame com timestamp em datetime64[ns]
+    """
+    if is_columnar(directory, name):
+        arrays = open_columns(directory, name, columns)
+        data = {}
+        for column, values in arrays.items():
+            if tail is not None:
+                values = values[-tail:] if tail else values[:0]
+            if column == TIMESTAMP_COLUMN:
+                values = np.asarray(values).view('datetime64[ns]')
+            data[column] = values
+        return pd.DataFrame(data)
+
+    path = csv_path(directory, name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Data file not found: {series_path(directory, name)}")
+
+    if tail is not None:
+        df = read_csv_tail(path, n=tail)
+    else:
+        df = pd.read_csv(path)
+        df[TIMESTAMP_COLUMN] = pd.to_datetime(df[TIMESTAMP_COLUMN])
+
+    if columns is not None:
+        df = df[columns]
+
+    return df
+
+
+def count_candles(directory, name):
+    """Número de velas da série (sem carregar os dados)"""
+    if is_columnar(directory, name):
+        return read_manifest(directory, name)['rows']
+    with open(csv_path(directory, name)) as f:
+        return sum(1 for _ in f) - 1
+
+
+def series_size(directory, name):
+    """Tamanho em disco da série em bytes"""
+    if is_columnar(directory, name):
+        path = series_path(directory, name)
+        return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    return os.path.getsize(csv_path(directory, name))
+
+
+def convert_directory(directory, remove_csv=False):
+    """Converte todos os CSVs de um diretório para o formato colunar"""
+    converted = []
+
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.csv'):
+            continue
+
+        name = filename[:-len('.csv')]
+        df = pd.read_csv(os.path.join(directory, filename))
+        df[TIMESTAMP_COLUMN] = pd.to_datetime(df[TIMESTAMP_COLUMN])
+
+        manifest = save_candles(df, directory, name)
+        print(f"✓ {filename} -> {name}/ ({manifest['rows']} velas, {len(manifest['columns'])} colunas)")
+
+        if remove_csv:
+            os.remove(os.path.join(directory, filename))
+
+        converted.append(name)
+
+    return converted
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('convert', 'info'):
+        print("Usage: python3 candle_store.py convert [directory ...] [--remove-csv]")
+        print("       python3 candle_store.py info <directory> <name>")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    args = [arg for arg in sys.argv[2:] if not arg.startswith('--')]
+
+    if command == 'convert':
+        remove_csv = '--remove-csv' in sys.argv
+        directories = args or [HISTORICAL_DIR, PROCESSED_DIR]
+
+        print("=" * 60)
+        print("CONVERSÃO CSV -> FORMATO COLUNAR")
+        print("=" * 60)
+
+        for directory in directories:
+            print(f"\nDiretório: {directory}")
+            converted = convert_directory(directory, remove_csv=remove_csv)
+            if not converted:
+                print("  Nenhum CSV encontrado")
+
+    elif command == 'info':
+        if len(args) != 2:
+            print("Usage: python3 candle_store.py info <directory> <name>")
+            sys.exit(1)
+        print(json.dumps(read_manifest(args[0], args[1]), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Verificação da coleta histórica do BybitClient contra o servidor REST fake
+
+Sobe o fake_bybit_server.py em uma porta livre, aponta o session.endpoint
+do cliente para ele e confere:
+- janelas com respostas 429/5xx são repetidas com backoff até darem certo
+- o resultado remontado tem todas as velas do intervalo, em ordem, sem
+  duplicatas e com os valores de cada vela
+- o token bucket limita a taxa de requisições
+- uma janela que falha em todas as tentativas faz get_historical_data levantar
+
+Uso: python3 check_bybit_client.py [--windows 24] [--rate 10] [--burst 3]
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+from bybit_client import BybitClient, INTERVAL_MS, MAX_KLINE_LIMIT
+from fake_bybit_server import FakeBybitServer, kline_row
+
+INTERVAL = '60'
+START_TIME = int(pd.Timestamp('2022-01-01 00:30').value // 10**6)  # Não alinhado ao intervalo
+
+
+def make_client(server, rate, burst, max_retries=4):
+    # O servidor fake não autentica; o cliente só exige que as chaves existam
+    os.environ.setdefault('BYBIT_API_KEY', 'fake')
+    os.environ.setdefault('BYBIT_API_SECRET', 'fake')
+    return BybitClient(endpoint=server.url, rate_limit=rate, burst=burst, max_workers=8,
+                       max_retries=max_retries, backoff=0.01)
+
+
+def max_requests_per_second(times):
+    """Maior número de requisições em qualquer janela de 1 segundo"""
+    times = np.sort(np.asarray(times))
+    return int((np.searchsorted(times, times + 1.0, side='left') - np.arange(len(times))).max())
+
+
+def check(name, ok, detail=''):
+    print(f"{'✓' if ok else '✗'} {name}{f': {detail}' if detail else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verifica a coleta histórica do BybitClient')
+    parser.add_argument('--windows', type=int, default=24, help='Janelas de 1000 velas a buscar')
+    parser.add_argument('--rate', type=float, default=10.0, help='Requisições por segundo do token bucket')
+    parser.add_argument('--burst', type=int, default=3, help='Rajada do token bucket')
+    args = parser.parse_args()
+
+    interval_ms = INTERVAL_MS[INTERVAL]
+    end_time = START_TIME + int((args.windows - 0.5) * MAX_KLINE_LIMIT * interval_ms)
+    # split_windows alinha o início ao intervalo: inclui a vela que contém START_TIME
+    first = START_TIME - START_TIME % interval_ms
+    expected = np.arange(first, end_time + 1, interval_ms)
+
+    server = FakeBybitServer(broken_symbols={'BROKENUSDT'}).start_background()
+    passed = True
+
+    try:
+        client = make_client(server, args.rate, args.burst)
+        df = client.get_historical_data('ETHUSDT', INTERVAL, start_time=START_TIME, end_time=end_time)
+
+        statuses = server.statuses()
+        retried = {status: count for status, count in statuses.items() if status != 200}
+        passed &= check('429 e 5xx repetidos', 429 in retried and any(s >= 500 for s in retried),
+                        f"{retried} em {len(server.requests)} requisições")
+
+        timestamps = df['timestamp'].to_numpy(dtype='datetime64[ms]').view(np.int64)
+        passed &= check('ordem crescente', bool(np.all(np.diff(timestamps) > 0)))
+        passed &= check('sem duplicatas', len(np.unique(timestamps)) == len(timestamps))
+        passed &= check('velas completas', np.array_equal(timestamps, expected),
+                        f"{len(timestamps)} de {len(expected)}")
+
+        values = np.array([kline_row(int(t), interval_ms)[1:] for t in timestamps], dtype=np.float64)
+        passed &= check('valores por vela', np.allclose(df[['open', 'high', 'low', 'close', 'volume', 'turnover']]
+                                                       .to_numpy(), values))
+
+        peak = max_requests_per_second([t for t, *_ in server.requests])
+        passed &= check('token bucket', peak <= args.burst + args.rate,
+                        f"pico de {peak} req/s (limite {args.rate:g}/s, rajada {args.burst})")
+
+        broken_client = make_client(server, args.rate, args.burst, max_retries=2)
+        try:
+            broken_client.get_historical_data('BROKENUSDT', INTERVAL, start_time=START_TIME, end_time=end_time)
+        except Exception as e:
+            passed &= check('janela com falha levanta exceção', True, type(e).__name__)
+        else:
+            passed &= check('janela com falha levanta exceção', False, 'retornou dados parciais')
+    finally:
+        server.shutdown()
+
+    print(f"\n{'✓ Todas as verificações passaram' if passed else '✗ Verificações falharam'}")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 #!/usr/bin/env python3
 """
 Script para coletar dados históricos de criptomoedas
-Coleta 1 ano de dados para BTCUSDT, ETHUSDT e SOLUSDT
-com intervalos de 5m, 15m e 1h usando CCXT (Binance)
+Coleta 1 ano de dados para BTCUSDT, ETHUSDT e SOLUSDT usando CCXT (Binance)
+
+Apenas o intervalo base (5m) é baixado; 15m e 1h são derivados localmente
+por reamostragem (resample.py), o que reduz as requisições à exchange.
+
+A coleta é incremental: para cada série são detectados o último timestamp
+gravado e as lacunas internas, e apenas os intervalos faltantes são baixados.
+Lotes após a última vela são anexados assim que chegam; lotes de lacunas e
+do trecho anterior ao histórico são acumulados e inseridos na série de uma
+vez (cada inserção reescreve a série). O progresso fica em um checkpoint,
+então uma execução interrompida continua de onde parou.
 """
 
 import os
@@ -10,99 +19,245 @@ import sys
 import time
 import json
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
 import ccxt
 
+from candle_store import (
+    append_candles, merge_candles, load_candles, series_exists,
+    count_candles, series_size
+)
+from resample import BASE_INTERVAL, DERIVED_INTERVALS, update_derived
+
 # Configurações
 SYMBOLS = ['BTC/USDT', 'ETH/USDT', 'SOL/USDT']
 SYMBOL_NAMES = {'BTC/USDT': 'BTCUSDT', 'ETH/USDT': 'ETHUSDT', 'SOL/USDT': 'SOLUSDT'}
-INTERVALS = ['5m', '15m', '1h']
+INTERVALS = [BASE_INTERVAL] + DERIVED_INTERVALS
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'historical')
+CHECKPOINT_FILE = os.path.join(DATA_DIR, 'collect_checkpoint.json')
+BATCH_LIMIT = 1000
+MAX_NETWORK_RETRIES = 5
+
+# Velas de lacunas acumuladas antes de inserir na série (limita o que se
+# perde se a coleta for interrompida sem chegar ao fim dos intervalos)
+MERGE_BUFFER_ROWS = 100_000
 
 # Criar diretório de dados se não existir
 os.makedirs(DATA_DIR, exist_ok=True)
 
-def collect_data_for_symbol(exchange, symbol, timeframe, days=365):
+def load_checkpoint():
+    """Carrega o checkpoint da coleta (vazio se não existir)"""
+    if not os.path.exists(CHECKPOINT_FILE):
+        return {'series': {}}
+    
+    with open(CHECKPOINT_FILE, 'r') as f:
+        return json.load(f)
+
+def save_checkpoint(checkpoint):
+    """Grava o checkpoint de forma atômica"""
+    tmp_path = CHECKPOINT_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, CHECKPOINT_FILE)
+
+def stored_timestamps(name):
+    """Timestamps (ms) já gravados para a série, em ordem crescente"""
+    if not series_exists(DATA_DIR, name):
+        return np.array([], dtype=np.int64)
+    
+    df = load_candles(DATA_DIR, name, columns=['timestamp'])
+    timestamps = df['timestamp'].to_numpy(dtype='datetime64[ms]').view(np.int64)
+    return np.unique(timestamps)
+
+def find_missing_ranges(timestamps, start, end, interval_ms):
+    """
+    Intervalos [início, fim] (ms) sem velas entre start e end
+    
+    Inclui o trecho anterior à primeira vela gravada, as lacunas internas
+    e o trecho posterior à última vela.
+    """
+    start = -(-start // interval_ms) * interval_ms
+    timestamps = timestamps[(timestamps >= start) & (timestamps <= end)]
+    
+    if len(timestamps) == 0:
+        return [(start, end)] if start <= end else []
+    
+    ranges = []
+    
+    if timestamps[0] - start >= interval_ms:
+        ranges.append((start, int(timestamps[0]) - interval_ms))
+    
+    gaps = np.flatnonzero(np.diff(timestamps) > interval_ms)
+    for i in gaps:
+        ranges.append((int(timestamps[i]) + interval_ms, int(timestamps[i + 1]) - interval_ms))
+    
+    if end - timestamps[-1] >= interval_ms:
+        ranges.append((int(timestamps[-1]) + interval_ms, end))
+    
+    return ranges
+
+def is_unavailable(range_, unavailable):
+    """Verifica se o intervalo já foi consultado antes sem retornar dados"""
+    start, end = range_
+    return any(u_start <= start and end <= u_end for u_start, u_end in unavailable)
+
+def fetch_range(exchange, symbol, timeframe, start, end, on_batch):
+    """
+    Baixa as velas de [start, end] em lotes, entregando cada lote a on_batch
+    
+    Returns:
+        Número de velas recebidas
+    """
+    since = start
+    total = 0
+    retries = 0
+    
+    while since <= end:
+        try:
+            ohlcv = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=BATCH_LIMIT)
+            retries = 0
+        except ccxt.NetworkError as e:
+            retries += 1
+            if retries > MAX_NETWORK_RETRIES:
+                raise
+            print(f"  Erro de rede: {e}. Tentando novamente...")
+            time.sleep(5)
+            continue
+        
+        batch = [row for row in ohlcv if since <= row[0] <= end]
+        if not batch:
+            break
+        
+        df = pd.DataFrame(batch, columns=[
+            'timestamp', 'open', 'high', 'low', 'close', 'volume'
+        ])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        for col in ['open', 'high', 'low', 'close', 'volume']:
+            df[col] = df[col].astype(float)
+        
+        on_batch(df)
+        total += len(df)
+        
+        # Atualizar since para o próximo batch
+        since = batch[-1][0] + 1
+        
+        print(f"  Coletadas {len(df)} velas até {df['timestamp'].iloc[-1]}. Total: {total}")
+        
+        # Se recebemos menos que o limite, chegamos ao fim
+        if len(ohlcv) < BATCH_LIMIT:
+            break
+        
+        # Rate limiting
+        time.sleep(exchange.rateLimit / 1000)
+    
+    return total
+
+def collect_data_for_symbol(exchange, symbol, timeframe, days=365, checkpoint=None):
     """
-    Coleta dados históricos para um símbolo e intervalo específicos
+    Coleta apenas as velas que faltam para um símbolo e intervalo específicos
     
     Args:
         exchange: Instância da exchange (ccxt)
         symbol: Símbolo da cripto (ex: BTC/USDT)
         timeframe: Intervalo (5m, 15m, 1h)
-        days: Número de dias para coletar (padrão: 365)
+        days: Janela de histórico desejada (padrão: 365)
+        checkpoint: Checkpoint da coleta (atualizado e gravado a cada lote)
     
     Returns:
-        DataFrame com os dados coletados
+        Número de velas novas gravadas
     """
     symbol_name = SYMBOL_NAMES[symbol]
+    name = f"{symbol_name}_{timeframe}"
     print(f"\nColetando dados para {symbol_name} - Intervalo: {timeframe}")
     
-    # Calcular timestamps
-    since = exchange.parse8601((datetime.now() - timedelta(days=days)).isoformat())
+    if checkpoint is None:
+        checkpoint = load_checkpoint()
+    state = checkpoint['series'].setdefault(name, {'unavailable': []})
+    
+    interval_ms = exchange.parse_timeframe(timeframe) * 1000
+    end = exchange.milliseconds() // interval_ms * interval_ms - interval_ms  # última vela fechada
+    start = exchange.parse8601((datetime.now() - timedelta(days=days)).isoformat())
+    
+    timestamps = stored_timestamps(name)
+    last_timestamp = int(timestamps[-1]) if len(timestamps) else None
+    ranges = [
+        r for r in find_missing_ranges(timestamps, start, end, interval_ms)
+        if not is_unavailable(r, state['unavailable'])
+    ]
+    
+    if not ranges:
+        print(f"✓ Série completa ({len(timestamps)} velas)")
+        return 0
+    
+    missing = sum((e - s) // interval_ms + 1 for s, e in ranges)
+    print(f"  {len(ranges)} intervalo(s) faltando, até {missing} velas")
+    
+    added = 0
+    failed = False
+    pending = []  # Lotes de lacunas ainda não inseridos na série
     
-    all_ohlcv = []
+    def update_state(df):
+        state['status'] = 'in_progress'
+        state['cursor'] = int(df['timestamp'].iloc[-1].value // 10**6)
+        state['updated_at'] = datetime.now().isoformat()
+        save_checkpoint(checkpoint)
+    
+    def flush_pending():
+        """Insere os lotes acumulados com uma única reescrita da série"""
+        nonlocal added
+        if not pending:
+            return
+        df = pd.concat(pending, ignore_index=True)
+        pending.clear()
+        merged = merge_candles(df, DATA_DIR, name)
+        added += merged
+        if merged:
+            # Velas no meio da série: as derivadas precisam ser recalculadas
+            state['rebuild_derived'] = True
+        update_state(df)
     
     try:
-        # Coletar dados em chunks
-        while True:
-            try:
-                ohlcv = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=1000)
-                
-                if not ohlcv:
-                    break
-                
-                all_ohlcv.extend(ohlcv)
-                
-                # Atualizar since para o próximo batch
-                since = ohlcv[-1][0] + 1
-                
-                print(f"  Coletadas {len(ohlcv)} velas. Total: {len(all_ohlcv)}")
-                
-                # Se recebemos menos que o limite, chegamos ao fim
-                if len(ohlcv) < 1000:
-                    break
-                
-                # Rate limiting
-                time.sleep(exchange.rateLimit / 1000)
-                
-            except ccxt.NetworkError as e:
-                print(f"  Erro de rede: {e}. Tentando novamente...")
-                time.sleep(5)
-                continue
-            except ccxt.ExchangeError as e:
-                print(f"  Erro da exchange: {e}")
-                break
-        
-        # Converter para DataFrame
-        if all_ohlcv:
-            df = pd.DataFrame(all_ohlcv, columns=[
-                'timestamp', 'open', 'high', 'low', 'close', 'volume'
-            ])
-            
-            # Converter timestamp para datetime
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        for range_start, range_end in ranges:
+            # Trecho após a última vela: append in-place; lacunas: inserção na série
+            at_tail = last_timestamp is None or range_start > last_timestamp
             
-            # Converter tipos numéricos
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                df[col] = df[col].astype(float)
+            if at_tail:
+                # O append exige que as lacunas anteriores já estejam gravadas
+                flush_pending()
             
-            # Remover duplicatas
-            df = df.drop_duplicates(subset=['timestamp']).reset_index(drop=True)
+            def on_batch(df):
+                nonlocal added
+                if at_tail:
+                    added += append_candles(df, DATA_DIR, name)
+                    update_state(df)
+                    return
+                pending.append(df)
+                if sum(len(batch) for batch in pending) >= MERGE_BUFFER_ROWS:
+                    flush_pending()
             
-            # Ordenar por timestamp
-            df = df.sort_values('timestamp').reset_index(drop=True)
-            
-            print(f"✓ Coletadas {len(df)} velas de {df['timestamp'].min()} até {df['timestamp'].max()}")
-            
-            return df
-        else:
-            print(f"✗ Nenhum dado coletado para {symbol_name} - {timeframe}")
-            return pd.DataFrame()
+            try:
+                received = fetch_range(exchange, symbol, timeframe, range_start, range_end, on_batch)
+            except ccxt.ExchangeError as e:
+                print(f"  Erro da exchange: {e}")
+                failed = True
+                continue
             
-    except Exception as e:
-        print(f"✗ Erro ao coletar dados: {e}")
-        return pd.DataFrame()
+            if received == 0:
+                # A exchange não tem velas nesse trecho: não consultar de novo
+                state['unavailable'].append([range_start, range_end])
+                save_checkpoint(checkpoint)
+    finally:
+        # Lotes já recebidos são gravados mesmo se a coleta for interrompida
+        flush_pending()
+    
+    # Intervalos que falharam são tentados de novo na próxima execução
+    state['status'] = 'partial' if failed else 'complete'
+    state['updated_at'] = datetime.now().isoformat()
+    save_checkpoint(checkpoint)
+    
+    print(f"✓ {added} velas novas gravadas ({count_candles(DATA_DIR, name)} no total)")
+    
+    return added
 
 def main():
     """Função principal para coletar todos os dados"""
@@ -110,7 +265,7 @@ def main():
     print("COLETA DE DADOS HISTÓRICOS DE CRIPTOMOEDAS")
     print("=" * 60)
     print(f"Símbolos: {', '.join([SYMBOL_NAMES[s] for s in SYMBOLS])}")
-    print(f"Intervalos: {', '.join(INTERVALS)}")
+    print(f"Intervalos: {BASE_INTERVAL} (derivados: {', '.join(DERIVED_INTERVALS)})")
     print(f"Período: 1 ano")
     print(f"Fonte: Binance (via CCXT)")
     print(f"Diretório de saída: {DATA_DIR}")
@@ -136,24 +291,37 @@ def main():
         print(f"✗ Erro ao inicializar exchange: {e}")
         return
     
-    # Coletar dados para cada combinação de símbolo e intervalo
+    # Coletar apenas o que falta para cada combinação de símbolo e intervalo
+    checkpoint = load_checkpoint()
     collected_files = []
     
     for symbol in SYMBOLS:
+        symbol_name = SYMBOL_NAMES[symbol]
+        base_name = f"{symbol_name}_{BASE_INTERVAL}"
+        
+        try:
+            collect_data_for_symbol(exchange, symbol, BASE_INTERVAL, days=365, checkpoint=checkpoint)
+        except Exception as e:
+            # Lotes já recebidos ficam gravados; a próxima execução retoma daqui
+            print(f"✗ Erro ao coletar dados: {e}")
+        
+        # Intervalos maiores derivados da série base: recalculados por inteiro só
+        # se lacunas no meio dela foram preenchidas (a marca fica no checkpoint,
+        # inclusive se a coleta falhou); senão apenas os buckets novos
+        if series_exists(DATA_DIR, base_name):
+            state = checkpoint['series'].get(base_name, {})
+            rebuild = state.get('rebuild_derived', False)
+            derived = update_derived(symbol_name, DERIVED_INTERVALS, DATA_DIR, rebuild=rebuild)
+            if rebuild:
+                del state['rebuild_derived']
+                save_checkpoint(checkpoint)
+            for interval, count in derived.items():
+                print(f"  ✓ {symbol_name} {interval} derivado de {BASE_INTERVAL}: {count} velas novas")
+        
         for timeframe in INTERVALS:
-            df = collect_data_for_symbol(exchange, symbol, timeframe, days=365)
-            
-            if not df.empty:
-                # Salvar em CSV
-                symbol_name = SYMBOL_NAMES[symbol]
-                filename = f"{symbol_name}_{timeframe}.csv"
-                filepath = os.path.join(DATA_DIR, filename)
-                df.to_csv(filepath, index=False)
-                print(f"✓ Dados salvos em: {filepath}")
-                collected_files.append((filename, filepath))
-            
-            # Pausa entre requisições
-            time.sleep(1)
+            name = f"{symbol_name}_{timeframe}"
+            if series_exists(DATA_DIR, name):
+                collected_files.append(name)
     
     print("\n" + "=" * 60)
     print("COLETA CONCLUÍDA!")
@@ -161,12 +329,11 @@ def main():
     
     # Resumo dos arquivos criados
     if collected_files:
-        print("\nArquivos criados:")
-        for filename, filepath in collected_files:
-            if os.path.exists(filepath):
-                size = os.path.getsize(filepath) / 1024  # KB
-                num_lines = sum(1 for _ in open(filepath)) - 1  # -1 para header
-                print(f"  - {filename} ({size:.2f} KB, {num_lines} velas)")
+        print("\nSéries disponíveis:")
+        for name in collected_files:
+            size = series_size(DATA_DIR, name) / 1024  # KB
+            num_lines = count_candles(DATA_DIR, name)
+            print(f"  - {name} ({size:.2f} KB, {num_lines} velas)")
     else:
         print("\n✗ Nenhum arquivo foi criado. Verifique os erros acima.")
 
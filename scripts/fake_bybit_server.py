@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Servidor HTTP local que imita o endpoint de klines REST da Bybit (v5)
+
+Permite testar BybitClient.get_historical_data sem rede: o cliente é
+apontado para o servidor via `endpoint` (session.endpoint do pybit).
+Responde GET /v5/market/kline com velas determinísticas (o preço é função
+do timestamp, então o resultado remontado pode ser conferido vela a vela)
+e injeta falhas por janela: respostas HTTP 429/5xx nas primeiras tentativas
+de algumas janelas, e falha permanente para os símbolos em `broken_symbols`.
+
+Implementado apenas com a biblioteca padrão (http.server).
+
+Uso: python3 fake_bybit_server.py [--port 8766]
+     BYBIT_ENDPOINT=http://127.0.0.1:8766 python3 bybit_client.py klines ETHUSDT 60 30
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from bybit_client import INTERVAL_MS, MAX_KLINE_LIMIT
+
+KLINE_PATH = '/v5/market/kline'
+
+# Status HTTP das tentativas que falham, por janela (ciclo pelo número da janela)
+DEFAULT_FAILURES = [[429], [], [503, 502], [], [500]]
+
+
+def kline_row(open_ms, interval_ms):
+    """Vela determinística aberta em open_ms, no formato da Bybit (strings)"""
+    n = open_ms // interval_ms
+    open_price = 100.0 + (n % 1000) / 10
+    close = open_price + ((n * 7) % 11 - 5) / 10
+    volume = 10.0 + n % 97
+    return [
+        str(open_ms),
+        f"{open_price:.2f}",
+        f"{max(open_price, close) + 0.5:.2f}",
+        f"{min(open_price, close) - 0.5:.2f}",
+        f"{close:.2f}",
+        f"{volume:.2f}",
+        f"{volume * close:.2f}",
+    ]
+
+
+class FakeBybitServer:
+    """
+    Servidor REST de klines local
+
+    Args:
+        host, port: Endereço (port=0 escolhe uma porta livre; ver .url)
+        failures: Lista de listas de status HTTP; a janela n recebe, nas
+                  primeiras tentativas, os status de failures[n % len(failures)]
+        broken_symbols: Símbolos cujas requisições sempre falham com 503
+        overlap: Inclui a vela anterior ao início da janela na resposta,
+                 para exercitar o filtro de bordas do cliente
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, failures=DEFAULT_FAILURES, broken_symbols=(), overlap=True):
+        self.failures = [list(statuses) for statuses in failures] or [[]]
+        self.broken_symbols = set(broken_symbols)
+        self.overlap = overlap
+
+        # Requisições recebidas: (instante monotônico, símbolo, start, end, status)
+        self.requests = []
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    def start_background(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def statuses(self):
+        """Contagem de respostas por status HTTP"""
+        counts = {}
+        for *_, status in self.requests:
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def _status_for(self, symbol, interval_ms, start):
+        """Status da próxima tentativa da janela que começa em `start`"""
+        if symbol in self.broken_symbols:
+            return 503
+
+        window = start // (interval_ms * MAX_KLINE_LIMIT)
+        planned = self.failures[window % len(self.failures)]
+
+        with self._lock:
+            attempt = self._attempts.get((symbol, start), 0)
+            self._attempts[(symbol, start)] = attempt + 1
+
+        return planned[attempt] if attempt < len(planned) else 200
+
+    def _handle(self, handler):
+        url = urlparse(handler.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if url.path != KLINE_PATH:
+            self._send(handler, 404, {'retCode': 10001, 'retMsg': f'Unknown path {url.path}'})
+            return
+
+        symbol = params.get('symbol', '')
+        interval_ms = INTERVAL_MS.get(params.get('interval'))
+        if interval_ms is None:
+            self._send(handler, 200, {'retCode': 10001, 'retMsg': 'Invalid interval'})
+            return
+
+        end = int(params.get('end', time.time() * 1000))
+        limit = min(int(params.get('limit', 200)), MAX_KLINE_LIMIT)
+        start = int(params.get('start', end - interval_ms * limit))
+
+        status = self._status_for(symbol, interval_ms, start)
+        with self._lock:
+            self.requests.append((time.monotonic(), symbol, start, end, status))
+
+        if status != 200:
+            self._send(handler, status, {'retCode': 10000 + status, 'retMsg': f'HTTP {status}'})
+            return
+
+        # As `limit` velas mais recentes de [start, end], da mais recente para a mais antiga
+        first = start + (-start) % interval_ms
+        opens = list(range(first, end + 1, interval_ms))[-limit:]
+        if self.overlap and opens:
+            opens.insert(0, opens[0] - interval_ms)
+        rows = [kline_row(open_ms, interval_ms) for open_ms in reversed(opens)]
+
+        self._send(handler, 200, {
+            'retCode': 0,
+            'retMsg': 'OK',
+            'result': {'category': params.get('category', 'spot'), 'symbol': symbol, 'list': rows},
+            'retExtInfo': {},
+            'time': int(time.time() * 1000),
+        })
+
+    @staticmethod
+    def _send(handler, status, body):
+        payload = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor REST de klines fake (Bybit v5)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--no-failures', action='store_true', help='Não injeta respostas 429/5xx')
+    args = parser.parse_args()
+
+    server = FakeBybitServer(args.host, args.port, failures=[[]] if args.no_failures else DEFAULT_FAILURES)
+    print(f"Fake Bybit REST server em {server.url}", file=sys.stderr, flush=True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Servidor WebSocket local que imita o tópico kline público da Bybit (v5)
+
+Permite testar o stream_klines.py sem rede. Responde às assinaturas e ao
+ping do pybit e publica, para cada tópico assinado, velas sintéticas em
+tempo acelerado: `--updates` mensagens da vela em formação (confirm=false)
+seguidas da vela fechada (confirm=true), uma vela a cada `--period` segundos.
+
+Implementado apenas com a biblioteca padrão (handshake e frames RFC 6455).
+
+Uso: python3 fake_kline_server.py [--port 8765] [--period 0.2] [--start 2025-01-01T00:00]
+     python3 stream_klines.py ETHUSDT:5m --url ws://127.0.0.1:8765
+"""
+
+import sys
+import json
+import time
+import base64
+import socket
+import struct
+import hashlib
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+
+from resample import interval_ns
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# Atraso da confirmação de assinatura (s), como a latência de uma conexão real
+SUBSCRIBE_DELAY = 0.05
+
+# Intervalo Bybit -> nosso formato
+BYBIT_TO_INTERVAL = {'1': '1m', '5': '5m', '15': '15m', '30': '30m', '60': '1h', '240': '4h', 'D': '1d'}
+
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        data += chunk
+    return data
+
+
+def read_frame(sock):
+    """Lê um frame do cliente (sempre mascarado). Retorna (opcode, payload)"""
+    first, second = _recv_exact(sock, 2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+
+    if length == 126:
+        length = struct.unpack('>H', _recv_exact(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', _recv_exact(sock, 8))[0]
+
+    mask = _recv_exact(sock, 4) if second & 0x80 else None
+    payload = _recv_exact(sock, length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+    return opcode, payload
+
+
+def encode_frame(payload, opcode=OP_TEXT):
+    """Frame do servidor (sem máscara)"""
+    if isinstance(payload, str):
+        payload = payload.encode()
+
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 1 << 16:
+        header += bytes([126]) + struct.pack('>H', length)
+    else:
+        header += bytes([127]) + struct.pack('>Q', length)
+
+    return header + payload
+
+
+def handshake(sock):
+    """Responde ao upgrade HTTP -> WebSocket"""
+    request = b''
+    while b'\r\n\r\n' not in request:
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise ConnectionError('connection closed during handshake')
+        request += chunk
+
+    key = None
+    for line in request.decode('latin-1').split('\r\n'):
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'sec-websocket-key':
+            key = value.strip()
+
+    if key is None:
+        raise ConnectionError('missing Sec-WebSocket-Key')
+
+    accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+    sock.sendall((
+        'HTTP/1.1 101 Switching Protocols\r\n'
+        'Upgrade: websocket\r\n'
+        'Connection: Upgrade\r\n'
+        f'Sec-WebSocket-Accept: {accept}\r\n\r\n'
+    ).encode())
+
+
+class SyntheticKlines:
+    """Passeio aleatório de velas para um tópico, a partir de `start`"""
+
+    def __init__(self, interval, start, price=100.0, seed=0):
+        self.step_ms = interval_ns(interval) // 10**6
+        start_ms = pd.Timestamp(start).value // 10**6
+        self.start_ms = start_ms - start_ms % self.step_ms
+        self.price = price
+        self.rng = np.random.default_rng(seed)
+
+    def candle(self, updates):
+        """Gera as mensagens de uma vela: `updates` parciais + a confirmada"""
+        open_price = self.price
+        path = open_price * np.exp(np.cumsum(self.rng.normal(0, 0.002, updates + 1)))
+        volume = self.rng.uniform(10, 100, updates + 1).cumsum()
+
+        klines = []
+        for i, close in enumerate(path):
+            klines.append({
+                'start': self.start_ms,
+                'end': self.start_ms + self.step_ms - 1,
+                'open': f"{open_price:.4f}",
+                'close': f"{close:.4f}",
+                'high': f"{max(open_price, path[:i + 1].max()):.4f}",
+                'low': f"{min(open_price, path[:i + 1].min()):.4f}",
+                'volume': f"{volume[i]:.4f}",
+                'turnover': f"{volume[i] * close:.4f}",
+                'confirm': i == updates,
+            })
+
+        self.price = float(path[-1])
+        self.start_ms += self.step_ms
+        return klines
+
+
+class FakeKlineServer:
+    """
+    Servidor kline local
+
+    Args:
+        host, port: Endereço (port=0 escolhe uma porta livre; ver .url)
+        period: Segundos entre velas fechadas de cada tópico
+        updates: Mensagens da vela em formação antes da confirmada
+        start: Abertura da primeira vela (padrão: agora, alinhado ao intervalo)
+        max_candles: Velas fechadas por tópico antes de parar de publicar (None = sem limite)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, period=0.2, updates=2, start=None, max_candles=None, seed=0):
+        self.period = period
+        self.updates = updates
+        self.start = start
+        self.max_candles = max_candles
+        self.seed = seed
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen()
+        self.url = f"ws://{host}:{self.sock.getsockname()[1]}"
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start_background(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.sock.settimeout(0.2)
+        while not self._stop.is_set():
+            try:
+                conn, _ = self.sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._client, args=(conn,), daemon=True).start()
+
+    def shutdown(self):
+        self._stop.set()
+        self.sock.close()
+
+    def _client(self, conn):
+        lock = threading.Lock()
+
+        def send(message, opcode=OP_TEXT):
+            with lock:
+                conn.sendall(encode_frame(message if opcode != OP_TEXT else json.dumps(message), opcode))
+
+        try:
+            conn.settimeout(None)
+            handshake(conn)
+
+            while not self._stop.is_set():
+                opcode, payload = read_frame(conn)
+
+                if opcode == OP_CLOSE:
+                    send(payload, OP_CLOSE)
+                    break
+                if opcode == OP_PING:
+                    send(payload, OP_PONG)
+                    continue
+                if opcode != OP_TEXT:
+                    continue
+
+                request = json.loads(payload)
+                op = request.get('op')
+
+                if op == 'ping':
+                    send({'success': True, 'ret_msg': 'pong', 'conn_id': 'fake', 'op': 'ping'})
+                elif op == 'subscribe':
+                    # O pybit só registra o req_id depois de enviar a assinatura; sem a
+                    # latência de rede, uma resposta imediata chega antes e é perdida
+                    time.sleep(SUBSCRIBE_DELAY)
+                    send({'success': True, 'ret_msg': '', 'conn_id': 'fake',
+                          'req_id': request.get('req_id'), 'op': 'subscribe'})
+                    for topic in request.get('args', []):
+                        threading.Thread(target=self._publish, args=(topic, send), daemon=True).start()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def _publish(self, topic, send):
+        """Publica as velas de um tópico 'kline.<intervalo>.<símbolo>'"""
+        _, bybit_interval, symbol = topic.split('.', 2)
+        interval = BYBIT_TO_INTERVAL[bybit_interval]
+        start = self.start or pd.Timestamp.now('UTC').tz_localize(None)
+        seed = [self.seed, int(hashlib.sha1(topic.encode()).hexdigest()[:8], 16)]
+        klines = SyntheticKlines(interval, start, seed=seed)
+
+        published = 0
+        try:
+            while not self._stop.is_set() and (self.max_candles is None or published < self.max_candles):
+                messages = klines.candle(self.updates)
+                for kline in messages:
+                    time.sleep(self.period / len(messages))
+                    # Instante do envio: com o tempo acelerado, o fim nominal das velas
+                    # fica à frente do relógio; o cliente mede a latência a partir daqui
+                    sent_at = int(time.time() * 1000)
+                    kline['timestamp'] = sent_at
+                    send({'topic': topic, 'data': [kline], 'ts': sent_at, 'type': 'snapshot'})
+                published += 1
+        except OSError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor WebSocket kline fake (Bybit v5)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--period', type=float, default=0.2, help='Segundos entre velas fechadas')
+    parser.add_argument('--updates', type=int, default=2, help='Atualizações da vela em formação por vela')
+    parser.add_argument('--start', help='Abertura da primeira vela (padrão: agora)')
+    parser.add_argument('--max-candles', type=int, help='Velas por tópico')
+    args = parser.parse_args()
+
+    server = FakeKlineServer(args.host, args.port, args.period, args.updates,
+                             start=args.start, max_candles=args.max_candles)
+    print(f"Fake kline server em {server.url}", file=sys.stderr, flush=True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Armazenamento de features endereçado por conteúdo
+
+A matriz completa de features de uma série processada (indicadores e
+features derivadas de prepare_training_data.compute_features) é calculada uma
+única vez e gravada em disco, identificada por (hash dos dados de origem,
+versão do conjunto de features). Treino, predição e backtesting leem fatias
+da mesma matriz, então as features vistas pelo modelo em produção são
+as mesmas do treino.
+
+    data/features/ETHUSDT_1h/<chave>/
+        manifest.json
+        features.npy      (linhas x features, float64; NaN onde não há histórico)
+        timestamp.npy     (int64, ns)
+
+A versão da série de origem é lida do manifest colunar (linhas, última vela
+e hash encadeado) ou do tamanho e mtime do CSV legado, sem percorrer os
+dados. Quando ela muda (ex: velas novas anexadas), a matriz é recalculada
+na próxima leitura completa; entradas antigas da série são removidas. A
+predição não espera por esse recálculo: latest_features calcula a última
+linha a partir das FEATURE_LOOKBACK velas finais.
+
+Uso: python3 feature_store.py build [SÉRIE ...]
+     python3 feature_store.py info <SÉRIE>
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from candle_store import (
+    PROCESSED_DIR, TIMESTAMP_COLUMN, is_columnar, read_manifest, csv_path,
+    list_series, load_candles
+)
+from prepare_training_data import FEATURE_COLUMNS, FEATURE_LOOKBACK, compute_features
+from profiling import span
+
+# Incrementar quando o cálculo de alguma feature mudar
+FEATURE_SET_VERSION = 1
+
+STORE_FORMAT = 'feature-store-v1'
+MANIFEST_FILE = 'manifest.json'
+# Diretórios temporários de entradas em construção (um por processo)
+TMP_PREFIX = '.tmp-'
+
+# Conjuntos já abertos neste processo: (diretório, série) -> FeatureSet
+_OPEN = {}
+
+
+def store_dir_for(directory):
+    """Diretório do armazenamento de features ao lado do diretório de dados (data/features)"""
+    return os.path.join(os.path.dirname(os.path.abspath(directory)), 'features')
+
+
+def source_version(directory, name):
+    """
+    Versão da série de origem, em custo constante
+
+    Série colunar: linhas, última vela e hash encadeado do manifest.
+    CSV legado: tamanho e mtime do arquivo.
+    """
+    if is_columnar(directory, name):
+        manifest = read_manifest(directory, name)
+        return f"columnar:{manifest['rows']}:{manifest['last_timestamp']}:{manifest['content_hash']}"
+
+    path = csv_path(directory, name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Data file not found: {os.path.join(directory, name)}")
+
+    stat = os.stat(path)
+    return f"csv:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def feature_key(version):
+    """Chave da entrada: versão da origem + versão e lista de features"""
+    digest = hashlib.sha256()
+    digest.update(version.encode())
+    digest.update(f"{FEATURE_SET_VERSION}:{','.join(FEATURE_COLUMNS)}".encode())
+    return digest.hexdigest()[:24]
+
+
+class FeatureSet:
+    """Matriz de features de uma série, alinhada linha a linha com a série processada"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, MANIFEST_FILE), 'r') as f:
+            self.manifest = json.load(f)
+
+        self.path = path
+        self.key = self.manifest['key']
+        self.columns = list(self.manifest['columns'])
+        self.X = np.load(os.path.join(path, 'features.npy'), mmap_mode='r')
+        self.timestamps = np.load(os.path.join(path, 'timestamp.npy'), mmap_mode='r')
+        self._index = {column: i for i, column in enumerate(self.columns)}
+
+    def __len__(self):
+        return len(self.X)
+
+    def matrix(self, feature_names=None, start=None, stop=None):
+        """
+        Fatia da matriz com as colunas na ordem de feature_names
+
+        Raises:
+            KeyError: se alguma feature não existir no conjunto
+        """
+        rows = slice(start, stop)
+        if feature_names is None:
+            return self.X[rows]
+
+        missing = [name for name in feature_names if name not in self._index]
+        if missing:
+            raise KeyError(f"Features not in feature set v{FEATURE_SET_VERSION}: {', '.join(missing)}")
+
+        return self.X[rows][:, [self._index[name] for name in feature_names]]
+
+    def frame(self, start=None, stop=None):
+        """Fatia como DataFrame (timestamp + features)"""
+        rows = slice(start, stop)
+        df = pd.DataFrame(np.asarray(self.X[rows]), columns=self.columns)
+        df.insert(0, TIMESTAMP_COLUMN, np.asarray(self.timestamps[rows]).view('datetime64[ns]'))
+        return df
+
+    def latest(self):
+        """Features da última vela como Series"""
+        return self.frame(-1).iloc[-1]
+
+
+def build_features(directory, name, path, version):
+    """
+    Calcula a matriz completa e grava a entrada de forma atômica
+
+    Cada chamada grava num diretório temporário próprio, então processos que
+    constroem a mesma entrada ao mesmo tempo não se atrapalham; o primeiro a
+    terminar instala a entrada e os demais descartam a sua.
+    """
+    df = load_candles(directory, name)
+    with span('features', rows=len(df), series=name, source='feature_store'):
+        features = compute_features(df)[FEATURE_COLUMNS]
+        X = np.ascontiguousarray(features.replace([np.inf, -np.inf], np.nan).to_numpy(dtype=np.float64))
+    timestamps = pd.to_datetime(df[TIMESTAMP_COLUMN]).to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+    tmp_path = tempfile.mkdtemp(prefix=TMP_PREFIX, dir=os.path.dirname(path))
+    try:
+        np.save(os.path.join(tmp_path, 'features.npy'), X)
+        np.save(os.path.join(tmp_path, 'timestamp.npy'), timestamps)
+        with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as f:
+            json.dump({
+                'format': STORE_FORMAT,
+                'series': name,
+                'key': os.path.basename(path),
+                'source_version': version,
+                'feature_set_version': FEATURE_SET_VERSION,
+                'columns': list(FEATURE_COLUMNS),
+                'rows': len(X),
+                'created_at': datetime.now().isoformat(),
+            }, f, indent=2)
+
+        if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            shutil.rmtree(path, ignore_errors=True)  # Entrada incompleta
+            try:
+                os.replace(tmp_path, path)
+            except OSError:
+                # Outro processo instalou a entrada entre a verificação e o replace
+                if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+                    raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_features(name, directory=PROCESSED_DIR, store_dir=None):
+    """
+    Retorna o FeatureSet da série, calculando e gravando se ainda não existir
+
+    Args:
+        name: Nome da série (ex: ETHUSDT_1h)
+        directory: Diretório da série processada
+        store_dir: Diretório do armazenamento (padrão: data/features ao lado de directory)
+    """
+    store_dir = store_dir or store_dir_for(directory)
+    version = source_version(directory, name)
+    key = feature_key(version)
+
+    cached = _OPEN.get((store_dir, name))
+    if cached is not None and cached.key == key:
+        return cached
+
+    series_dir = os.path.join(store_dir, name)
+    path = os.path.join(series_dir, key)
+
+    if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        os.makedirs(series_dir, exist_ok=True)
+        build_features(directory, name, path, version)
+
+        # Entradas de versões anteriores da série não são mais alcançáveis
+        for entry in os.listdir(series_dir):
+            if entry != key and not entry.startswith(TMP_PREFIX):
+                shutil.rmtree(os.path.join(series_dir, entry), ignore_errors=True)
+
+    feature_set = FeatureSet(path)
+    _OPEN[(store_dir, name)] = feature_set
+    return feature_set
+
+
+def latest_features(name, directory=PROCESSED_DIR, store_dir=None):
+    """
+    Features da última vela da série como Series (timestamp + features)
+
+    Usa a matriz gravada se ela estiver atualizada; senão calcula só a última
+    linha a partir das FEATURE_LOOKBACK velas finais, sem reconstruir a
+    matriz completa (que fica para a próxima chamada de load_features).
+    """
+    store_dir = store_dir or store_dir_for(directory)
+    key = feature_key(source_version(directory, name))
+
+    cached = _OPEN.get((store_dir, name))
+    if cached is not None and cached.key == key:
+        return cached.latest()
+
+    path = os.path.join(store_dir, name, key)
+    if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        feature_set = FeatureSet(path)
+        _OPEN[(store_dir, name)] = feature_set
+        return feature_set.latest()
+
+    df = load_candles(directory, name, tail=FEATURE_LOOKBACK)
+    if df.empty:
+        raise ValueError(f"Data file is empty: {name}")
+
+    with span('features', rows=len(df), series=name, source='tail'):
+        features = compute_features(df)[FEATURE_COLUMNS].iloc[-1:].reset_index(drop=True)
+        features = features.replace([np.inf, -np.inf], np.nan).astype(np.float64)
+
+    features.insert(0, TIMESTAMP_COLUMN, pd.to_datetime(df[TIMESTAMP_COLUMN].iloc[-1:]).to_numpy(dtype='datetime64[ns]'))
+    return features.iloc[-1]
+
+
+def attach_features(df, feature_set):
+    """
+    Acrescenta a df (mesmas linhas da série processada) as colunas do conjunto que faltam
+
+    Raises:
+        ValueError: se as linhas não corresponderem às da matriz
+    """
+    timestamps = pd.to_datetime(df[TIMESTAMP_COLUMN]).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    if len(timestamps) != len(feature_set) or not np.array_equal(timestamps, feature_set.timestamps):
+        raise ValueError("Rows do not match the feature set (series changed?)")
+
+    df = df.copy()
+    for column in feature_set.columns:
+        if column not in df.columns:
+            df[column] = feature_set.matrix([column])[:, 0]
+    return df
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'info'):
+        print(__doc__)
+        sys.exit(1)
+
+    names = sys.argv[2:] or list_series(PROCESSED_DIR)
+
+    for name in names:
+        feature_set = load_features(name)
+        if sys.argv[1] == 'info':
+            print(json.dumps(dict(feature_set.manifest, path=feature_set.path), indent=2))
+        else:
+            print(f"✓ {name}: {len(feature_set)} linhas x {len(feature_set.columns)} features ({feature_set.key})")
+
+
+if __name__ == "__main__":
+    main()
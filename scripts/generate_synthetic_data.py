@@ -2,13 +2,28 @@
 """
 Script para gerar dados sintéticos realistas de criptomoedas
 Simula 1 ano de dados para BTCUSDT, ETHUSDT e SOLUSDT
-com intervalos de 5m, 15m e 1h
+no intervalo base de 5m; 15m e 1h são derivados por reamostragem,
+então as séries dos diferentes intervalos são consistentes entre si
+
+A geração é vetorizada e feita em blocos de velas gravados direto no
+armazenamento colunar, então a memória usada depende do tamanho do bloco e
+não da duração. O resultado é determinístico para a mesma semente e o mesmo
+tamanho de bloco.
+
+Uso: python3 generate_synthetic_data.py [--symbols 50] [--interval 1m] [--days 730]
+                                        [--seed 42] [--chunk-size 500000] [--workers 4]
 """
 
 import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from scipy.signal import lfilter
+
+from candle_store import save_candles, append_candles, count_candles, series_size, series_exists
+from resample import BASE_INTERVAL, DERIVED_INTERVALS, interval_ns, update_derived
 
 # Configurações
 SYMBOLS = {
@@ -17,132 +32,241 @@ SYMBOLS = {
     'SOLUSDT': {'base_price': 100, 'volatility': 0.03}
 }
 
-INTERVALS = {
-    '5m': 5,
-    '15m': 15,
-    '1h': 60
-}
+INTERVALS = [BASE_INTERVAL] + DERIVED_INTERVALS
+
+DEFAULT_SEED = 42
+DEFAULT_CHUNK_SIZE = 500_000
+DEFAULT_DAYS = 365
+
+# Reversão à média do log-preço por vela e amplitude dos ciclos (em log-preço):
+# mantêm o preço em uma faixa realista para qualquer número de velas
+MEAN_REVERSION = 1e-3
+CYCLE_AMPLITUDE = 0.5
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'historical')
 os.makedirs(DATA_DIR, exist_ok=True)
 
-def generate_realistic_ohlcv(base_price, volatility, num_candles, interval_minutes):
+def symbol_configs(count, seed=DEFAULT_SEED):
+    """
+    Configuração de `count` símbolos: os de SYMBOLS e, além deles, símbolos
+    sintéticos (SYN001USDT, ...) com preço base e volatilidade sorteados
+    """
+    configs = dict(list(SYMBOLS.items())[:count])
+    rng = np.random.default_rng([seed, count])
+    
+    for i in range(len(configs), count):
+        configs[f"SYN{i - len(SYMBOLS) + 1:03d}USDT"] = {
+            'base_price': round(float(10 ** rng.uniform(1, 4.5)), 2),
+            'volatility': round(float(rng.uniform(0.015, 0.035)), 4),
+        }
+    
+    return configs
+
+def generate_ohlcv_chunks(base_price, volatility, num_candles, interval_minutes,
+                          seed=DEFAULT_SEED, chunk_size=DEFAULT_CHUNK_SIZE, end_time=None):
     """
-    Gera dados OHLCV realistas usando movimento browniano geométrico
+    Gera dados OHLCV realistas (movimento browniano geométrico) em blocos
+    
+    O log-preço é um passeio aleatório com leve reversão à média, somado a
+    uma tendência sutil e a ciclos de mercado que dependem da posição da vela
+    na série inteira. O estado do passeio passa de um bloco ao seguinte, então
+    a concatenação dos blocos forma uma única série contínua.
     
     Args:
         base_price: Preço base inicial
         volatility: Volatilidade (desvio padrão dos retornos)
         num_candles: Número de velas a gerar
         interval_minutes: Intervalo em minutos entre velas
+        seed: Semente (int ou sequência de ints)
+        chunk_size: Velas por bloco
+        end_time: Timestamp da última vela (padrão: fronteira do intervalo atual, UTC)
     
-    Returns:
-        DataFrame com colunas: timestamp, open, high, low, close, volume
+    Yields:
+        DataFrames com colunas: timestamp, open, high, low, close, volume
     """
-    np.random.seed(42)  # Para reprodutibilidade
-    
-    # Gerar timestamps
-    end_time = datetime.now()
-    start_time = end_time - timedelta(minutes=interval_minutes * num_candles)
-    timestamps = pd.date_range(start=start_time, end=end_time, periods=num_candles)
-    
-    # Gerar preços usando movimento browniano geométrico
-    returns = np.random.normal(0, volatility, num_candles)
-    
-    # Adicionar tendência sutil (mercado ligeiramente altista)
-    trend = np.linspace(0, 0.3, num_candles)
-    returns += trend / num_candles
+    rng = np.random.default_rng(seed)
     
-    # Adicionar ciclos de mercado (simulando bull/bear markets)
-    cycle = np.sin(np.linspace(0, 4 * np.pi, num_candles)) * volatility * 0.5
-    returns += cycle
+    # Timestamps alinhados às fronteiras do intervalo (UTC), como os da exchange
+    step = interval_minutes * 60 * 10**9
+    if end_time is None:
+        end_time = pd.Timestamp.now(tz='UTC').tz_localize(None).floor(pd.Timedelta(minutes=interval_minutes))
+    first_timestamp = pd.Timestamp(end_time).value - (num_candles - 1) * step
     
-    # Calcular preços de fechamento
-    price_multipliers = np.exp(np.cumsum(returns))
-    close_prices = base_price * price_multipliers
+    last_span = max(num_candles - 1, 1)
+    walk_state = np.zeros(1)
+    previous_close = float(base_price)
     
-    # Gerar open, high, low baseado em close
-    data = []
-    
-    for i in range(num_candles):
-        close = close_prices[i]
+    for offset in range(0, num_candles, chunk_size):
+        size = min(chunk_size, num_candles - offset)
+        position = np.arange(offset, offset + size, dtype=np.float64) / last_span
+        
+        # Passeio aleatório com reversão à média (filtro recursivo, vetorizado)
+        returns = rng.normal(0, volatility, size)
+        walk, walk_state = lfilter([1.0], [1.0, -(1 - MEAN_REVERSION)], returns, zi=walk_state)
+        
+        # Tendência sutil (mercado ligeiramente altista) e ciclos de mercado
+        # (simulando bull/bear markets)
+        log_prices = walk + 0.15 * position ** 2 + CYCLE_AMPLITUDE * np.sin(4 * np.pi * position)
+        close = base_price * np.exp(log_prices)
         
-        # Open é o close anterior (ou base_price para primeira vela)
-        open_price = close_prices[i-1] if i > 0 else base_price
+        # Open é o close anterior (base_price na primeira vela)
+        open_ = np.empty(size)
+        open_[0] = previous_close
+        open_[1:] = close[:-1]
+        previous_close = float(close[-1])
         
         # High e Low com variação intra-candle realista
-        intra_volatility = volatility * np.random.uniform(0.3, 0.7)
-        high = max(open_price, close) * (1 + abs(np.random.normal(0, intra_volatility)))
-        low = min(open_price, close) * (1 - abs(np.random.normal(0, intra_volatility)))
+        intra_volatility = volatility * rng.uniform(0.3, 0.7, size)
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 1, size) * intra_volatility))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 1, size) * intra_volatility))
         
         # Volume com padrão realista (maior em movimentos grandes)
-        price_change = abs(close - open_price) / open_price
-        base_volume = base_price * np.random.uniform(10, 50)
-        volume = base_volume * (1 + price_change * 10)
+        price_change = np.abs(close - open_) / open_
+        volume = base_price * rng.uniform(10, 50, size) * (1 + price_change * 10)
         
-        data.append({
-            'timestamp': timestamps[i],
-            'open': round(open_price, 2),
-            'high': round(high, 2),
-            'low': round(low, 2),
-            'close': round(close, 2),
-            'volume': round(volume, 4)
+        timestamps = first_timestamp + np.arange(offset, offset + size, dtype=np.int64) * step
+        
+        yield pd.DataFrame({
+            'timestamp': timestamps.view('datetime64[ns]'),
+            'open': np.round(open_, 2),
+            'high': np.round(high, 2),
+            'low': np.round(low, 2),
+            'close': np.round(close, 2),
+            'volume': np.round(volume, 4)
         })
+
+def generate_realistic_ohlcv(base_price, volatility, num_candles, interval_minutes,
+                             seed=DEFAULT_SEED, chunk_size=DEFAULT_CHUNK_SIZE, end_time=None):
+    """
+    Gera dados OHLCV realistas em memória
+    
+    Returns:
+        DataFrame com colunas: timestamp, open, high, low, close, volume
+    """
+    chunks = generate_ohlcv_chunks(base_price, volatility, num_candles, interval_minutes,
+                                   seed=seed, chunk_size=chunk_size, end_time=end_time)
+    return pd.concat(chunks, ignore_index=True)
+
+def generate_to_store(name, base_price, volatility, num_candles, interval_minutes, directory=DATA_DIR,
+                      seed=DEFAULT_SEED, chunk_size=DEFAULT_CHUNK_SIZE, end_time=None):
+    """
+    Gera a série bloco a bloco gravando direto no armazenamento colunar
+    
+    O primeiro bloco substitui a série existente e os seguintes são anexados,
+    então apenas um bloco fica em memória por vez.
+    
+    Returns:
+        Resumo (velas, primeiro/último timestamp e close)
+    """
+    chunks = generate_ohlcv_chunks(base_price, volatility, num_candles, interval_minutes,
+                                   seed=seed, chunk_size=chunk_size, end_time=end_time)
+    summary = {'candles': 0}
     
-    return pd.DataFrame(data)
+    for i, chunk in enumerate(chunks):
+        if i == 0:
+            save_candles(chunk, directory, name)
+            summary['first_timestamp'] = chunk['timestamp'].iloc[0]
+            summary['first_close'] = chunk['close'].iloc[0]
+        else:
+            append_candles(chunk, directory, name)
+        summary['candles'] += len(chunk)
+        summary['last_timestamp'] = chunk['timestamp'].iloc[-1]
+        summary['last_close'] = chunk['close'].iloc[-1]
+    
+    return summary
+
+def generate_symbol(symbol, config, interval, num_candles, derived, directory, seed, chunk_size, end_time):
+    """Gera a série base de um símbolo e deriva os intervalos maiores"""
+    start = time.perf_counter()
+    interval_minutes = interval_ns(interval) // (60 * 10**9)
+    
+    summary = generate_to_store(
+        f"{symbol}_{interval}",
+        base_price=config['base_price'],
+        volatility=config['volatility'],
+        num_candles=num_candles,
+        interval_minutes=interval_minutes,
+        directory=directory,
+        seed=seed,
+        chunk_size=chunk_size,
+        end_time=end_time
+    )
+    
+    if derived:
+        update_derived(symbol, derived, directory, base_interval=interval, rebuild=True)
+    
+    summary['seconds'] = time.perf_counter() - start
+    return summary
 
 def main():
     """Gera dados sintéticos para todos os símbolos e intervalos"""
+    parser = argparse.ArgumentParser(description='Gera dados sintéticos de criptomoedas')
+    parser.add_argument('--symbols', type=int, default=len(SYMBOLS),
+                        help=f'Número de símbolos (além dos {len(SYMBOLS)} padrão são criados SYN001USDT, ...)')
+    parser.add_argument('--interval', default=BASE_INTERVAL, help='Intervalo gerado (ex: 1m, 5m, 1h)')
+    parser.add_argument('--days', type=float, default=DEFAULT_DAYS, help='Duração em dias')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Velas por bloco')
+    parser.add_argument('--workers', type=int, default=1, help='Processos (um símbolo por processo)')
+    parser.add_argument('--no-derive', action='store_true', help='Não deriva os intervalos maiores')
+    parser.add_argument('--output-dir', default=DATA_DIR, help='Diretório de saída')
+    args = parser.parse_args()
+    
+    step = interval_ns(args.interval)
+    num_candles = int(args.days * 24 * 60 * 60 * 10**9 // step)
+    derived = [] if args.no_derive else [
+        interval for interval in DERIVED_INTERVALS
+        if interval_ns(interval) > step and interval_ns(interval) % step == 0
+    ]
+    configs = symbol_configs(args.symbols, args.seed)
+    
+    # Mesmo fim para todos os símbolos, para que as séries fiquem alinhadas
+    end_time = pd.Timestamp.now(tz='UTC').tz_localize(None).floor(pd.Timedelta(step))
+    
     print("=" * 60)
     print("GERAÇÃO DE DADOS SINTÉTICOS DE CRIPTOMOEDAS")
     print("=" * 60)
-    print(f"Símbolos: {', '.join(SYMBOLS.keys())}")
-    print(f"Intervalos: {', '.join(INTERVALS.keys())}")
-    print(f"Período: 1 ano")
-    print(f"Diretório de saída: {DATA_DIR}")
+    print(f"Símbolos: {len(configs)} ({', '.join(list(configs)[:5])}{', ...' if len(configs) > 5 else ''})")
+    print(f"Intervalos: {args.interval}" + (f" (derivados: {', '.join(derived)})" if derived else ""))
+    print(f"Período: {args.days:g} dias ({num_candles} velas por símbolo)")
+    print(f"Semente: {args.seed} | Bloco: {args.chunk_size} velas")
+    print(f"Diretório de saída: {args.output_dir}")
     print("=" * 60)
     
-    for symbol, config in SYMBOLS.items():
-        for interval_name, interval_minutes in INTERVALS.items():
-            # Calcular número de velas para 1 ano
-            minutes_per_year = 365 * 24 * 60
-            num_candles = minutes_per_year // interval_minutes
-            
-            print(f"\nGerando {symbol} - {interval_name} ({num_candles} velas)")
-            
-            # Gerar dados
-            df = generate_realistic_ohlcv(
-                base_price=config['base_price'],
-                volatility=config['volatility'],
-                num_candles=num_candles,
-                interval_minutes=interval_minutes
-            )
-            
-            # Salvar em CSV
-            filename = f"{symbol}_{interval_name}.csv"
-            filepath = os.path.join(DATA_DIR, filename)
-            df.to_csv(filepath, index=False)
-            
-            print(f"✓ Dados salvos: {filepath}")
-            print(f"  - Período: {df['timestamp'].min()} até {df['timestamp'].max()}")
-            print(f"  - Preço inicial: ${df['close'].iloc[0]:.2f}")
-            print(f"  - Preço final: ${df['close'].iloc[-1]:.2f}")
-            print(f"  - Variação: {((df['close'].iloc[-1] / df['close'].iloc[0] - 1) * 100):.2f}%")
+    os.makedirs(args.output_dir, exist_ok=True)
+    start = time.perf_counter()
+    
+    # Cada símbolo tem sua própria semente, então o resultado não depende de --workers
+    jobs = [
+        (symbol, config, args.interval, num_candles, derived, args.output_dir,
+         [args.seed, i], args.chunk_size, end_time)
+        for i, (symbol, config) in enumerate(configs.items())
+    ]
+    
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {job[0]: executor.submit(generate_symbol, *job) for job in jobs}
+        
+        for symbol, future in futures.items():
+            summary = future.result()
+            print(f"\n✓ {symbol} - {args.interval}: {summary['candles']} velas em {summary['seconds']:.2f}s")
+            print(f"  - Período: {summary['first_timestamp']} até {summary['last_timestamp']}")
+            print(f"  - Preço inicial: ${summary['first_close']:.2f}")
+            print(f"  - Preço final: ${summary['last_close']:.2f}")
+            print(f"  - Variação: {((summary['last_close'] / summary['first_close'] - 1) * 100):.2f}%")
     
     print("\n" + "=" * 60)
-    print("GERAÇÃO CONCLUÍDA!")
+    print(f"GERAÇÃO CONCLUÍDA em {time.perf_counter() - start:.2f}s!")
     print("=" * 60)
     
     # Resumo
     print("\nArquivos criados:")
-    for symbol in SYMBOLS.keys():
-        for interval_name in INTERVALS.keys():
-            filename = f"{symbol}_{interval_name}.csv"
-            filepath = os.path.join(DATA_DIR, filename)
-            if os.path.exists(filepath):
-                size = os.path.getsize(filepath) / 1024
-                num_lines = sum(1 for _ in open(filepath)) - 1
-                print(f"  - {filename} ({size:.2f} KB, {num_lines} velas)")
+    for symbol in configs:
+        for interval_name in [args.interval] + derived:
+            name = f"{symbol}_{interval_name}"
+            if series_exists(args.output_dir, name):
+                size = series_size(args.output_dir, name) / 1024
+                num_lines = count_candles(args.output_dir, name)
+                print(f"  - {name} ({size:.2f} KB, {num_lines} velas)")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Bundle de modelo versionado em arquivo único
+Guarda modelo, scaler, lista de features, metadados e hash do conteúdo,
+além da versão do modelo exportada em arrays de nós (tree_inference)
+
+O bundle é gravado com joblib sem compressão, então os arrays numpy ficam
+alinhados no arquivo e são abertos com memory-mapping, sem cópia e com
+páginas compartilhadas entre processos. Exceção: as árvores do scikit-learn
+copiam seus nós para um buffer próprio ao serem desserializadas; a versão
+em arrays (chave 'packed') é a que fica de fato compartilhada.
+
+Uso:
+    python3 model_bundle.py migrate [models_dir] [--remove-legacy]
+    python3 model_bundle.py info <SYMBOL_INTERVAL>
+    python3 model_bundle.py verify <SYMBOL_INTERVAL>
+    python3 model_bundle.py check
+"""
+
+import os
+import sys
+import json
+import tempfile
+from datetime import datetime
+import joblib
+import numpy as np
+from joblib.hashing import NumpyHasher
+from numpy.lib import recfunctions
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_DIR = os.path.join(PROJECT_DIR, 'models')
+
+BUNDLE_FORMAT = 'model-bundle-v1'
+BUNDLE_SUFFIX = '_bundle.joblib'
+
+# Arquivos do formato antigo (um por componente)
+LEGACY_SUFFIXES = {
+    'model': '_model.pkl',
+    'scaler': '_scaler.pkl',
+    'features': '_features.txt',
+    'metadata': '_metadata.json',
+}
+
+
+def bundle_path(symbol, interval, models_dir=MODELS_DIR):
+    return os.path.join(models_dir, f"{symbol}_{interval}{BUNDLE_SUFFIX}")
+
+
+def legacy_path(symbol, interval, component, models_dir=MODELS_DIR):
+    return os.path.join(models_dir, f"{symbol}_{interval}{LEGACY_SUFFIXES[component]}")
+
+
+def model_file(symbol, interval, models_dir=MODELS_DIR):
+    """Arquivo que identifica o modelo atual: o bundle, ou o .pkl antigo se ainda não migrado"""
+    path = bundle_path(symbol, interval, models_dir)
+    if os.path.exists(path):
+        return path
+    return legacy_path(symbol, interval, 'model', models_dir)
+
+
+class ContentHasher(NumpyHasher):
+    """
+    Hasher do joblib que depende só do conteúdo, não da forma como os objetos
+    estão em memória
+
+    - Os nós das árvores do scikit-learn são structs com bytes de padding não
+      inicializados, que mudam a cada desserialização; o hash usa só os campos.
+    - Arrays vazios têm strides arbitrários (views após a desserialização).
+    - Sem memo do pickle (modo fast): objetos repetidos são hasheados pelo
+      conteúdo, então referências compartilhadas no estimador recém-treinado
+      e cópias na versão desserializada dão o mesmo hash.
+    - Arrays memory-mapped são tratados como arrays comuns.
+    """
+
+    def __init__(self, hash_name='sha1'):
+        NumpyHasher.__init__(self, hash_name=hash_name, coerce_mmap=True)
+        self.fast = True
+
+    def save(self, obj):
+        if isinstance(obj, np.ndarray):
+            if obj.dtype.names:
+                obj = recfunctions.repack_fields(obj)
+            if obj.size == 0:
+                obj = np.empty(obj.shape, dtype=obj.dtype)
+        NumpyHasher.save(self, obj)
+
+
+def content_hash(model, scaler, feature_names):
+    """Hash do conteúdo do bundle (o mesmo antes de gravar e depois de carregar)"""
+    payload = {'model': model, 'scaler': scaler, 'features': list(feature_names)}
+    return ContentHasher(hash_name='sha1').hash(payload)
+
+
+def save_bundle(path, model, scaler, feature_names, metadata=None):
+    """
+    Grava o bundle de forma atômica, com o hash calculado sobre os objetos em memória
+
+    Returns:
+        Hash do conteúdo gravado
+    """
+    from tree_inference import pack_model
+
+    feature_names = list(feature_names)
+
+    try:
+        packed = pack_model(model, scaler)
+    except ValueError:
+        packed = None  # Tipo de modelo sem exportação para arrays
+
+    digest = content_hash(model, scaler, feature_names)
+
+    bundle = {
+        'format': BUNDLE_FORMAT,
+        'model': model,
+        'scaler': scaler,
+        'feature_names': feature_names,
+        'metadata': dict(metadata or {}),
+        'packed': packed,
+        'content_hash': digest,
+        'created_at': datetime.now().isoformat(),
+    }
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    # Sem compressão: requisito para memory-mapping no carregamento
+    joblib.dump(bundle, tmp_path, compress=0)
+    os.replace(tmp_path, path)
+
+    return digest
+
+
+def load_bundle(path, mmap=True):
+    """
+    Carrega um bundle
+
+    Args:
+        mmap: Abre os arrays numpy como memory-mapped (somente leitura)
+
+    Returns:
+        Dicionário com model, scaler, feature_names, metadata e content_hash
+    """
+    bundle = joblib.load(path, mmap_mode='r' if mmap else None)
+
+    if not isinstance(bundle, dict) or bundle.get('format') != BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported model bundle format: {path}")
+
+    return bundle
+
+
+def load_legacy(symbol, interval, models_dir=MODELS_DIR):
+    """Carrega os arquivos separados do formato antigo"""
+    model_path = legacy_path(symbol, interval, 'model', models_dir)
+
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model not found: {model_path}")
+
+    model = joblib.load(model_path)
+    scaler = joblib.load(legacy_path(symbol, interval, 'scaler', models_dir))
+
+    with open(legacy_path(symbol, interval, 'features', models_dir), 'r') as f:
+        feature_names = [line.strip() for line in f.readlines()]
+
+    metadata = {}
+    metadata_path = legacy_path(symbol, interval, 'metadata', models_dir)
+    if os.path.exists(metadata_path):
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+
+    return model, scaler, feature_names, metadata
+
+
+def load_model(symbol, interval, models_dir=MODELS_DIR, mmap=True, packed=False):
+    """
+    Carrega (model, scaler, feature_names) do bundle, ou dos arquivos antigos se não migrado
+
+    Args:
+        packed: Se True, retorna também o PackedModel (arrays do bundle, ou
+                exportado na hora; None se o tipo de modelo não for suportado)
+    """
+    path = bundle_path(symbol, interval, models_dir)
+
+    if os.path.exists(path):
+        bundle = load_bundle(path, mmap=mmap)
+        model, scaler, feature_names = bundle['model'], bundle['scaler'], bundle['feature_names']
+        arrays = bundle.get('packed')
+    else:
+        model, scaler, feature_names, _ = load_legacy(symbol, interval, models_dir)
+        arrays = None
+
+    if not packed:
+        return model, scaler, feature_names
+
+    from tree_inference import PACKED_FORMAT, PackedModel
+    if arrays is not None and arrays.get('format') == PACKED_FORMAT:
+        packed_model = PackedModel(arrays)
+    else:
+        packed_model = PackedModel.from_estimator(model, scaler)
+
+    return model, scaler, feature_names, packed_model
+
+
+def verify_bundle(path):
+    """Recalcula o hash do conteúdo e compara com o gravado"""
+    bundle = load_bundle(path, mmap=False)
+    digest = content_hash(bundle['model'], bundle['scaler'], bundle['feature_names'])
+    return digest == bundle['content_hash'], digest
+
+
+def check_candidates(rows=600, n_features=8):
+    """
+    Treina cada candidato de train_model.CANDIDATES em dados sintéticos,
+    grava o bundle e confere que verify_bundle aceita o hash gravado
+
+    Returns:
+        True se todos os bundles passaram
+    """
+    from train_model import CANDIDATES, identity_scaler
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(rows, n_features)).astype(np.float32)
+    y = rng.integers(0, 2, size=rows)
+    split = int(rows * 0.8)
+    feature_names = [f'feature_{i}' for i in range(n_features)]
+
+    passed = True
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for key, (name, train_fn, _) in CANDIDATES.items():
+            model, _ = train_fn(X[:split], y[:split], X[split:], y[split:], n_jobs=1)
+            path = os.path.join(tmp_dir, f"{key}{BUNDLE_SUFFIX}")
+            saved = save_bundle(path, model, identity_scaler(n_features), feature_names)
+            ok, digest = verify_bundle(path)
+            ok = ok and digest == saved
+            passed = passed and ok
+            print(f"{'✓' if ok else '✗'} {name}: {digest}")
+
+    return passed
+
+
+def migrate_directory(models_dir=MODELS_DIR, remove_legacy=False):
+    """
+    Converte todos os modelos no formato antigo de models_dir em bundles
+
+    Returns:
+        Lista de nomes (SYMBOL_INTERVAL) migrados
+    """
+    migrated = []
+    suffix = LEGACY_SUFFIXES['model']
+
+    for filename in sorted(os.listdir(models_dir)):
+        if not filename.endswith(suffix):
+            continue
+
+        name = filename[:-len(suffix)]
+        symbol, interval = name.rsplit('_', 1)
+        path = bundle_path(symbol, interval, models_dir)
+
+        # Bundle já existente é sempre o modelo mais recente (o treino só grava bundles)
+        if os.path.exists(path):
+            print(f"  - {name}: bundle já existe, ignorado")
+            continue
+
+        try:
+            model, scaler, feature_names, metadata = load_legacy(symbol, interval, models_dir)
+        except Exception as e:
+            print(f"  ✗ {name}: não foi possível carregar ({e})")
+            continue
+
+        digest = save_bundle(path, model, scaler, feature_names, metadata)
+        migrated.append(name)
+        print(f"  ✓ {name} -> {os.path.basename(path)} ({digest[:12]})")
+
+        if remove_legacy:
+            for component in LEGACY_SUFFIXES:
+                legacy = legacy_path(symbol, interval, component, models_dir)
+                if os.path.exists(legacy):
+                    os.remove(legacy)
+
+    return migrated
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    command = sys.argv[1]
+
+    if command == 'migrate':
+        args = [a for a in sys.argv[2:] if not a.startswith('--')]
+        models_dir = args[0] if args else MODELS_DIR
+        print(f"Migrando modelos em {models_dir}...")
+        migrated = migrate_directory(models_dir, remove_legacy='--remove-legacy' in sys.argv)
+        print(f"✓ {len(migrated)} modelo(s) migrado(s)")
+
+    elif command == 'check':
+        sys.exit(0 if check_candidates() else 1)
+
+    elif command in ('info', 'verify') and len(sys.argv) >= 3:
+        symbol, interval = sys.argv[2].rsplit('_', 1)
+        path = bundle_path(symbol, interval)
+
+        if command == 'info':
+            bundle = load_bundle(path)
+            print(json.dumps({
+                'path': path,
+                'format': bundle['format'],
+                'model': type(bundle['model']).__name__,
+                'features': len(bundle['feature_names']),
+                'content_hash': bundle['content_hash'],
+                'created_at': bundle['created_at'],
+                'metadata': {k: v for k, v in bundle['metadata'].items() if k != 'features'},
+            }, indent=2))
+        else:
+            ok, digest = verify_bundle(path)
+            print(f"{'✓' if ok else '✗'} {sys.argv[2]}: {digest}")
+            sys.exit(0 if ok else 1)
+
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
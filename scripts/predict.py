@@ -2,73 +2,89 @@
 """
 Script para fazer predições usando modelos treinados
 Uso: python3 predict.py <symbol> <interval>
+     python3 predict.py --batch <SYMBOL:INTERVAL> [SYMBOL:INTERVAL ...]
+     echo '[{"symbol": "ETHUSDT", "interval": "1h"}]' | python3 predict.py --batch
 Exemplo: python3 predict.py ETHUSDT 1h
+         python3 predict.py --batch ETHUSDT:1h SOLUSDT:1h
+
+No modo --batch todos os pares são processados no mesmo processo e o
+resultado é um array JSON (na ordem dos pares) com o tempo de cada um.
 """
 
 import sys
 import os
 import json
+import time
 import numpy as np
 import pandas as pd
-import joblib
 from datetime import datetime, timedelta
 
+import model_bundle
+from candle_store import load_candles
+from feature_store import latest_features
+from profiling import span
+
 # Adicionar path do projeto
 PROJECT_DIR = os.path.dirname(os.path.dirname(__file__))
 MODELS_DIR = os.path.join(PROJECT_DIR, 'models')
 DATA_DIR = os.path.join(PROJECT_DIR, 'data', 'processed')
 
+def get_model_path(symbol, interval):
+    """Caminho do arquivo do modelo treinado (bundle, ou .pkl antigo se não migrado)"""
+    return model_bundle.model_file(symbol, interval, MODELS_DIR)
+
 def load_model(symbol, interval):
-    """Carrega modelo e scaler treinados"""
-    model_path = os.path.join(MODELS_DIR, f"{symbol}_{interval}_model.pkl")
-    scaler_path = os.path.join(MODELS_DIR, f"{symbol}_{interval}_scaler.pkl")
-    features_path = os.path.join(MODELS_DIR, f"{symbol}_{interval}_features.txt")
-    
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"Model not found: {model_path}")
-    
-    model = joblib.load(model_path)
-    scaler = joblib.load(scaler_path)
-    
-    with open(features_path, 'r') as f:
-        feature_names = [line.strip() for line in f.readlines()]
-    
-    return model, scaler, feature_names
+    """Carrega modelo, scaler e features treinados"""
+    return model_bundle.load_model(symbol, interval, MODELS_DIR)
+
+def load_predictor(symbol, interval):
+    """Como load_model, mais o PackedModel para inferência rápida (ou None)"""
+    return model_bundle.load_model(symbol, interval, MODELS_DIR, packed=True)
 
 def get_latest_data(symbol, interval):
-    """Busca dados mais recentes do arquivo processado"""
-    data_path = os.path.join(DATA_DIR, f"{symbol}_{interval}.csv")
+    """Busca dados mais recentes do arquivo processado, com as features derivadas"""
+    name = f"{symbol}_{interval}"
     
-    if not os.path.exists(data_path):
-        raise FileNotFoundError(f"Data file not found: {data_path}")
+    # Ler apenas a última vela (custo constante, independente do histórico)
+    df = load_candles(DATA_DIR, name, tail=1)
     
-    df = pd.read_csv(data_path)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    if df.empty:
+        raise ValueError(f"Data file is empty: {name}")
     
     # Pegar última linha (dados mais recentes)
-    latest = df.iloc[-1]
+    latest = df.iloc[-1].copy()
+    
+    # Features derivadas do feature_store: as mesmas usadas no treino
+    features = latest_features(name, DATA_DIR)
+    if features['timestamp'] != latest['timestamp']:
+        raise ValueError(f"Feature store is out of date for {name}")
+    
+    for column, value in features.drop('timestamp').items():
+        if column not in latest.index:
+            latest[column] = value
     
     return latest
 
-def make_prediction(symbol, interval):
-    """Faz predição para um símbolo e intervalo"""
-    try:
-        # Carregar modelo
-        model, scaler, feature_names = load_model(symbol, interval)
-        
-        # Buscar dados mais recentes
-        latest_data = get_latest_data(symbol, interval)
-        
-        # Preparar features
-        features = []
-        for feature_name in feature_names:
-            if feature_name in latest_data:
-                features.append(latest_data[feature_name])
-            else:
-                features.append(0)  # Default value if feature missing
-        
-        X = np.array([features])
-        
+def predict_from_data(model, scaler, feature_names, latest_data, symbol, interval, packed=None):
+    """
+    Faz predição a partir de um modelo já carregado e da última vela
+    
+    Se `packed` (PackedModel com o scaler embutido) for informado, classe e
+    probabilidades saem de uma única passada pelos arrays de nós.
+    """
+    # Preparar features
+    features = []
+    for feature_name in feature_names:
+        value = latest_data[feature_name] if feature_name in latest_data else 0
+        # Sem histórico suficiente para a feature (NaN): mesmo default de feature ausente
+        features.append(0 if pd.isna(value) else value)
+    
+    X = np.array([features])
+    
+    if packed is not None:
+        prediction, probabilities = packed.predict_row(X[0])
+        confidence = int(max(probabilities) * 100)
+    else:
         # Normalizar
         X_scaled = scaler.transform(X)
         
@@ -81,31 +97,41 @@ def make_prediction(symbol, interval):
             confidence = int(max(probabilities) * 100)
         else:
             confidence = 75  # Default confidence if model doesn't support probabilities
-        
-        # Mapear predição para ação
-        action_map = {-1: 'sell', 0: 'hold', 1: 'buy'}
-        action = action_map.get(prediction, 'hold')
-        
-        # Preparar indicadores para retorno
-        indicators = {
-            'ema_9': float(latest_data.get('ema_9', 0)),
-            'ema_21': float(latest_data.get('ema_21', 0)),
-            'rsi': float(latest_data.get('rsi', 0)),
-            'macd': float(latest_data.get('macd', 0)),
-            'macd_signal': float(latest_data.get('macd_signal', 0)),
-        }
-        
-        result = {
-            'symbol': symbol,
-            'interval': interval,
-            'prediction': action,
-            'confidence': confidence,
-            'currentPrice': float(latest_data['close']),
-            'indicators': indicators,
-            'timestamp': latest_data['timestamp'].isoformat() if hasattr(latest_data['timestamp'], 'isoformat') else str(latest_data['timestamp'])
-        }
-        
-        return result
+    
+    # Mapear predição para ação
+    action_map = {-1: 'sell', 0: 'hold', 1: 'buy'}
+    action = action_map.get(prediction, 'hold')
+    
+    # Preparar indicadores para retorno
+    indicators = {
+        'ema_9': float(latest_data.get('ema_9', 0)),
+        'ema_21': float(latest_data.get('ema_21', 0)),
+        'rsi': float(latest_data.get('rsi', 0)),
+        'macd': float(latest_data.get('macd', 0)),
+        'macd_signal': float(latest_data.get('macd_signal', 0)),
+    }
+    
+    return {
+        'symbol': symbol,
+        'interval': interval,
+        'prediction': action,
+        'confidence': confidence,
+        'currentPrice': float(latest_data['close']),
+        'indicators': indicators,
+        'timestamp': latest_data['timestamp'].isoformat() if hasattr(latest_data['timestamp'], 'isoformat') else str(latest_data['timestamp'])
+    }
+
+def make_prediction(symbol, interval):
+    """Faz predição para um símbolo e intervalo"""
+    try:
+        with span('inference', rows=1, symbol=symbol, interval=interval):
+            # Carregar modelo
+            model, scaler, feature_names, packed = load_predictor(symbol, interval)
+            
+            # Buscar dados mais recentes
+            latest_data = get_latest_data(symbol, interval)
+            
+            return predict_from_data(model, scaler, feature_names, latest_data, symbol, interval, packed)
         
     except Exception as e:
         return {
@@ -114,9 +140,91 @@ def make_prediction(symbol, interval):
             'interval': interval
         }
 
+def parse_pairs(items):
+    """
+    Normaliza a lista de pares: strings "SYMBOL:INTERVAL" ou dicts {symbol, interval}
+    
+    Raises:
+        ValueError: se algum item não for um par válido
+    """
+    pairs = []
+    for item in items:
+        if isinstance(item, str):
+            symbol, _, interval = item.partition(':')
+        elif isinstance(item, dict):
+            symbol, interval = item.get('symbol'), item.get('interval')
+        else:
+            symbol = interval = None
+        
+        if not symbol or not interval:
+            raise ValueError(f"Invalid pair: {item!r} (expected SYMBOL:INTERVAL)")
+        pairs.append((symbol, interval))
+    return pairs
+
+def predict_batch(pairs, get_predictor=load_predictor):
+    """
+    Faz predições para vários pares no mesmo processo
+    
+    Pares que compartilham o arquivo de dados (mesmo símbolo e intervalo) leem
+    a última vela e carregam o modelo uma única vez. Cada resultado traz
+    `latencyMs`: inferência, mais leitura e carga no primeiro par do grupo.
+    
+    Args:
+        pairs: Lista de (symbol, interval)
+        get_predictor: Função (symbol, interval) -> (model, scaler, feature_names, packed)
+    
+    Returns:
+        Lista de resultados na ordem de `pairs` (com 'error' nos que falharem)
+    """
+    # (symbol, interval) -> (latest_data, predictor) ou a exceção da carga
+    groups = {}
+    results = []
+    
+    with span('inference', rows=len(pairs), mode='batch'):
+        for symbol, interval in pairs:
+            start = time.perf_counter()
+            try:
+                key = (symbol, interval)
+                if key not in groups:
+                    try:
+                        groups[key] = (get_latest_data(symbol, interval), get_predictor(symbol, interval))
+                    except Exception as e:
+                        groups[key] = e
+                
+                if isinstance(groups[key], Exception):
+                    raise groups[key]
+                
+                latest_data, (model, scaler, feature_names, packed) = groups[key]
+                result = predict_from_data(model, scaler, feature_names, latest_data, symbol, interval, packed)
+            except Exception as e:
+                result = {
+                    'error': str(e),
+                    'symbol': symbol,
+                    'interval': interval
+                }
+            
+            result['latencyMs'] = round((time.perf_counter() - start) * 1000, 3)
+            results.append(result)
+    
+    return results
+
 def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == '--batch':
+        try:
+            # Pares pela linha de comando ou como array JSON no stdin
+            items = sys.argv[2:] or json.load(sys.stdin)
+            if not isinstance(items, list):
+                raise ValueError("Expected a JSON array of pairs")
+            pairs = parse_pairs(items)
+        except ValueError as e:
+            print(json.dumps({'error': str(e)}))
+            sys.exit(1)
+        
+        print(json.dumps(predict_batch(pairs)))
+        return
+    
     if len(sys.argv) != 3:
-        print(json.dumps({'error': 'Usage: python3 predict.py <symbol> <interval>'}))
+        print(json.dumps({'error': 'Usage: python3 predict.py <symbol> <interval> | --batch [SYMBOL:INTERVAL ...]'}))
         sys.exit(1)
     
     symbol = sys.argv[1]
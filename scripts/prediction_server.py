@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Serviço de predição persistente
+Mantém modelos carregados em memória e responde requisições em JSON-lines via stdin/stdout
+
+Uso: python3 prediction_server.py
+
+Protocolo (uma mensagem JSON por linha):
+    -> {"id": 1, "symbol": "ETHUSDT", "interval": "1h"}
+    <- {"id": 1, "result": {...}, "latencyMs": 2.41}
+
+    -> {"id": 2, "cmd": "batch", "pairs": [{"symbol": "ETHUSDT", "interval": "1h"}, ...]}
+    <- {"id": 2, "result": [{..., "latencyMs": 1.2}, ...], "latencyMs": 2.9}
+
+    -> {"id": 3, "cmd": "stats"}
+    <- {"id": 3, "result": {"requests": 10, "avgMs": 2.1, ...}, "latencyMs": 0.02}
+
+Comandos: predict (padrão), batch, stats, reload, ping
+"""
+
+import os
+import sys
+import json
+import time
+
+from predict import (
+    load_predictor, get_latest_data, get_model_path, predict_from_data, parse_pairs, predict_batch
+)
+from profiling import span
+
+# Quantidade de latências mantidas para cálculo de percentis
+LATENCY_WINDOW = 1000
+
+
+class ModelCache:
+    """Cache de modelos carregados, invalidado quando o arquivo do modelo muda"""
+
+    def __init__(self):
+        self._models = {}
+
+    def get(self, symbol, interval):
+        """Retorna (model, scaler, feature_names, packed), recarregando se o modelo foi retreinado"""
+        key = (symbol, interval)
+        model_path = get_model_path(symbol, interval)
+        mtime = os.path.getmtime(model_path) if os.path.exists(model_path) else None
+
+        cached = self._models.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        loaded = load_predictor(symbol, interval)
+        self._models[key] = (mtime, loaded)
+        return loaded
+
+    def clear(self):
+        self._models.clear()
+
+    def keys(self):
+        return [f"{symbol}_{interval}" for symbol, interval in self._models]
+
+
+class PredictionServer:
+    def __init__(self):
+        self.cache = ModelCache()
+        self.latencies = []
+        self.requests = 0
+        self.errors = 0
+        self.started_at = time.time()
+
+    def predict(self, symbol, interval):
+        """Equivalente a predict.make_prediction, reaproveitando modelos em memória"""
+        try:
+            with span('inference', rows=1, symbol=symbol, interval=interval):
+                model, scaler, feature_names, packed = self.cache.get(symbol, interval)
+                latest_data = get_latest_data(symbol, interval)
+                return predict_from_data(model, scaler, feature_names, latest_data, symbol, interval, packed)
+        except Exception as e:
+            return {
+                'error': str(e),
+                'symbol': symbol,
+                'interval': interval
+            }
+
+    def stats(self):
+        """Estatísticas de latência das requisições de predição"""
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+
+        def percentile(p):
+            if not count:
+                return 0.0
+            return latencies[min(count - 1, int(p * count))]
+
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'uptimeSeconds': round(time.time() - self.started_at, 1),
+            'loadedModels': self.cache.keys(),
+            'avgMs': round(sum(latencies) / count, 3) if count else 0.0,
+            'p50Ms': round(percentile(0.50), 3),
+            'p95Ms': round(percentile(0.95), 3),
+            'maxMs': round(latencies[-1], 3) if count else 0.0,
+        }
+
+    def handle(self, request):
+        """Processa uma requisição e retorna o resultado (sem o envelope)"""
+        cmd = request.get('cmd', 'predict')
+
+        if cmd == 'predict':
+            symbol = request.get('symbol')
+            interval = request.get('interval')
+            if not symbol or not interval:
+                return {'error': 'symbol and interval are required'}
+            return self.predict(symbol, interval)
+
+        if cmd == 'batch':
+            try:
+                pairs = parse_pairs(request.get('pairs') or [])
+            except ValueError as e:
+                return {'error': str(e)}
+            return predict_batch(pairs, self.cache.get)
+
+        if cmd == 'stats':
+            return self.stats()
+
+        if cmd == 'reload':
+            self.cache.clear()
+            return {'reloaded': True}
+
+        if cmd == 'ping':
+            return {'pong': True}
+
+        return {'error': f'Unknown command: {cmd}'}
+
+    def record(self, result, latency_ms):
+        """Contabiliza uma predição nas estatísticas"""
+        self.requests += 1
+        if 'error' in result:
+            self.errors += 1
+        self.latencies.append(latency_ms)
+        if len(self.latencies) > LATENCY_WINDOW:
+            self.latencies = self.latencies[-LATENCY_WINDOW:]
+
+    def handle_line(self, line):
+        """Processa uma linha JSON e retorna a resposta serializada"""
+        start = time.perf_counter()
+
+        # Só requisições despachadas entram nas estatísticas
+        dispatched = False
+
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            request = {}
+            result = {'error': f'Invalid JSON: {e}'}
+        else:
+            if not isinstance(request, dict):
+                result = {'error': f'Request must be a JSON object, got {type(request).__name__}'}
+                request = {}
+            else:
+                dispatched = True
+                # Uma requisição com problema não pode derrubar o loop do servidor
+                try:
+                    result = self.handle(request)
+                except Exception as e:
+                    result = {'error': f'{type(e).__name__}: {e}'}
+
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        if dispatched:
+            cmd = request.get('cmd', 'predict')
+            if cmd == 'predict':
+                self.record(result, latency_ms)
+            elif cmd == 'batch' and isinstance(result, list):
+                # Cada par do lote conta como uma predição, com a própria latência
+                for item in result:
+                    self.record(item, item.get('latencyMs', 0.0))
+
+        response = {
+            'id': request.get('id'),
+            'result': result,
+            'latencyMs': round(latency_ms, 3)
+        }
+        return json.dumps(response)
+
+    def serve(self, stdin=sys.stdin, stdout=sys.stdout):
+        """Loop principal: lê requisições até EOF no stdin"""
+        for line in stdin:
+            line = line.strip()
+            if not line:
+                continue
+            stdout.write(self.handle_line(line) + '\n')
+            stdout.flush()
+
+
+def main():
+    print("Prediction server ready", file=sys.stderr, flush=True)
+    PredictionServer().serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,9 +6,15 @@ Define estratégia de labeling baseada em lucro futuro
 
 import os
 import pandas as pd
+import sys
+import time
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from sklearn.model_selection import train_test_split
 
+from candle_store import list_series, load_candles
+from profiling import span
+
 # Diretórios
 PROCESSED_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'processed')
 TRAINING_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'training')
@@ -20,6 +26,31 @@ PROFIT_THRESHOLD = 0.005  # 0.5% de lucro mínimo para considerar trade válido
 LOSS_THRESHOLD = -0.003   # -0.3% de perda máxima (stop-loss)
 FUTURE_CANDLES = 10       # Número de velas futuras para avaliar resultado
 
+# Tipo das matrizes de treino gravadas: as árvores do scikit-learn convertem X
+# para float32 no ajuste, então não há perda, e os arquivos (abertos com
+# memory-mapping no treino) ocupam metade do espaço de float64
+TRAINING_DTYPE = np.float32
+
+# Features usadas pelo modelo
+FEATURE_COLUMNS = [
+    # Indicadores técnicos originais
+    'ema_9', 'ema_21', 'ema_50',
+    'sma_20', 'sma_50', 'sma_200',
+    'rsi', 'macd', 'macd_signal', 'macd_diff',
+    'bb_upper', 'bb_middle', 'bb_lower',
+    'volume_sma', 'volatility',
+    
+    # Features derivadas
+    'ema_trend_short', 'ema_trend_medium',
+    'bb_position', 'rsi_momentum', 'macd_strength',
+    'volume_ratio', 'price_to_sma20', 'price_to_sma50',
+    'volatility_norm'
+]
+
+# Velas de histórico que compute_features usa para calcular uma linha
+# (maior janela: média móvel de 50 períodos da volatilidade)
+FEATURE_LOOKBACK = 50
+
 def create_labels(df, profit_threshold=PROFIT_THRESHOLD, loss_threshold=LOSS_THRESHOLD, future_candles=FUTURE_CANDLES):
     """
     Cria labels para o dataset baseado em lucro futuro
@@ -29,6 +60,57 @@ def create_labels(df, profit_threshold=PROFIT_THRESHOLD, loss_threshold=LOSS_THR
     - -1 (SELL): Preço cai mais que loss_threshold nas próximas velas
     - 0 (HOLD): Não atende critérios de buy ou sell
     
+    Implementação vetorizada: as janelas futuras de cada vela são uma view
+    (sliding_window_view) sobre o array de fechamentos, sem cópia por linha.
+    
+    Args:
+        df: DataFrame com dados processados
+        profit_threshold: Percentual mínimo de lucro para BUY
+        loss_threshold: Percentual máximo de perda para SELL
+        future_candles: Número de velas futuras para avaliar
+    
+    Returns:
+        DataFrame com coluna 'label' adicionada
+    """
+    df = df.copy()
+    close = df['close'].to_numpy(dtype=np.float64)
+    labels = np.zeros(len(close), dtype=np.int64)
+    
+    # Para as últimas velas, não temos dados futuros suficientes (HOLD)
+    num_labeled = len(close) - future_candles
+    
+    if num_labeled > 0:
+        # Janela i = close[i+1 : i+future_candles+1]
+        future_prices = sliding_window_view(close[1:], future_candles)[:num_labeled]
+        current_price = close[:num_labeled, np.newaxis]
+        
+        # Calcular retornos percentuais futuros
+        returns = (future_prices - current_price) / current_price
+        
+        max_return = returns.max(axis=1)
+        min_return = returns.min(axis=1)
+        
+        # BUY tem prioridade sobre SELL, como na estratégia original
+        labels[:num_labeled] = np.select(
+            [max_return >= profit_threshold, min_return <= loss_threshold],
+            [1, -1],
+            default=0
+        )
+    
+    df['label'] = labels
+    return df
+
+def create_labels_loop(df, profit_threshold=PROFIT_THRESHOLD, loss_threshold=LOSS_THRESHOLD, future_candles=FUTURE_CANDLES):
+    """
+    Versão original (laço linha a linha) de create_labels
+    
+    Mantida como referência para validar e medir a versão vetorizada.
+    
+    Labels:
+    - 1 (BUY): Preço sobe mais que profit_threshold nas próximas velas
+    - -1 (SELL): Preço cai mais que loss_threshold nas próximas velas
+    - 0 (HOLD): Não atende critérios de buy ou sell
+    
     Args:
         df: DataFrame com dados processados
         profit_threshold: Percentual mínimo de lucro para BUY
@@ -70,9 +152,12 @@ def create_labels(df, profit_threshold=PROFIT_THRESHOLD, loss_threshold=LOSS_THR
     df['label'] = labels
     return df
 
-def create_features(df):
+def compute_features(df):
     """
-    Cria features adicionais para o modelo
+    Calcula as features derivadas, mantendo todas as linhas
+    
+    Linhas sem histórico suficiente (janelas móveis) ficam com NaN e
+    divisões por zero com ±inf.
     
     Args:
         df: DataFrame com dados e indicadores
@@ -107,11 +192,39 @@ def create_features(df):
     # 8. Volatilidade normalizada
     df['volatility_norm'] = df['volatility'] / df['volatility'].rolling(window=50).mean()
     
+    return df
+
+def create_features(df):
+    """
+    Cria features adicionais para o modelo
+    
+    Args:
+        df: DataFrame com dados e indicadores
+    
+    Returns:
+        DataFrame com features adicionadas (sem linhas com NaN ou infinitos)
+    """
+    df = compute_features(df)
+    
     # Remover NaN e infinitos
+    return drop_invalid_rows(df)
+
+def drop_invalid_rows(df):
+    """Remove linhas com NaN ou infinitos"""
     df = df.replace([np.inf, -np.inf], np.nan)
-    df = df.dropna().reset_index(drop=True)
+    return df.dropna().reset_index(drop=True)
+
+def attach_stored_features(df, base_name):
+    """
+    Acrescenta as features do feature_store (calculadas uma vez por versão da
+    série e compartilhadas com predição e backtesting)
     
-    return df
+    Args:
+        df: Série processada completa (mesmas linhas, ex: após create_labels)
+    """
+    from feature_store import load_features, attach_features
+    
+    return attach_features(df, load_features(base_name, PROCESSED_DIR))
 
 def prepare_dataset(df):
     """
@@ -124,42 +237,69 @@ def prepare_dataset(df):
         X (features), y (labels)
     """
     # Selecionar features para o modelo
-    feature_columns = [
-        # Indicadores técnicos originais
-        'ema_9', 'ema_21', 'ema_50',
-        'sma_20', 'sma_50', 'sma_200',
-        'rsi', 'macd', 'macd_signal', 'macd_diff',
-        'bb_upper', 'bb_middle', 'bb_lower',
-        'volume_sma', 'volatility',
-        
-        # Features derivadas
-        'ema_trend_short', 'ema_trend_medium',
-        'bb_position', 'rsi_momentum', 'macd_strength',
-        'volume_ratio', 'price_to_sma20', 'price_to_sma50',
-        'volatility_norm'
-    ]
-    
-    X = df[feature_columns].values
+    feature_columns = list(FEATURE_COLUMNS)
+    
+    X = df[feature_columns].to_numpy(dtype=TRAINING_DTYPE)
     y = df['label'].values
     
     return X, y, feature_columns
 
+def matrix_paths(base_name, directory=TRAINING_DIR):
+    """Arquivos da matriz completa (ordem cronológica) usada pelo walk-forward"""
+    return {
+        'X': os.path.join(directory, f'{base_name}_X.npy'),
+        'y': os.path.join(directory, f'{base_name}_y.npy'),
+        'timestamps': os.path.join(directory, f'{base_name}_timestamps.npy'),
+        'features': os.path.join(directory, f'{base_name}_features.txt'),
+    }
+
+def build_feature_matrix(base_name, future_candles=FUTURE_CANDLES):
+    """
+    Monta a matriz de features completa de uma série, em ordem cronológica
+    
+    As últimas future_candles velas não têm futuro suficiente para o label
+    (ficariam como HOLD) e são descartadas. As matrizes são gravadas em .npy
+    para serem abertas com memory-mapping pelos folds.
+    
+    Returns:
+        Dicionário com os caminhos gravados e o número de amostras
+    """
+    df = load_candles(PROCESSED_DIR, base_name)
+    with span('labeling', rows=len(df), series=base_name):
+        df = create_labels(df, future_candles=future_candles)
+    
+    with span('features', rows=len(df), series=base_name):
+        df = attach_stored_features(df, base_name)
+        df = drop_invalid_rows(df.iloc[:len(df) - future_candles])
+        X, y, feature_columns = prepare_dataset(df)
+    timestamps = pd.to_datetime(df['timestamp']).to_numpy(dtype='datetime64[ns]')
+    
+    paths = matrix_paths(base_name)
+    np.save(paths['X'], np.ascontiguousarray(X, dtype=TRAINING_DTYPE))
+    np.save(paths['y'], y)
+    np.save(paths['timestamps'], timestamps)
+    with open(paths['features'], 'w') as f:
+        f.write('\n'.join(feature_columns))
+    
+    return {'paths': paths, 'samples': len(X), 'features': feature_columns}
+
 def process_file(filename):
-    """Processa um arquivo individual"""
-    print(f"\nProcessando: {filename}")
+    """Processa uma série individual (ex: ETHUSDT_1h)"""
+    base_name = filename.replace('.csv', '')
+    print(f"\nProcessando: {base_name}")
     
     # Ler dados processados
-    input_path = os.path.join(PROCESSED_DIR, filename)
-    df = pd.read_csv(input_path)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df = load_candles(PROCESSED_DIR, base_name)
     
     print(f"  - Velas originais: {len(df)}")
     
     # Criar labels
-    df = create_labels(df)
+    with span('labeling', rows=len(df), series=base_name):
+        df = create_labels(df)
     
-    # Criar features adicionais
-    df = create_features(df)
+    # Features do armazenamento compartilhado com predição e backtesting
+    with span('features', rows=len(df), series=base_name):
+        df = drop_invalid_rows(attach_stored_features(df, base_name))
     
     print(f"  - Velas após labeling: {len(df)}")
     
@@ -185,8 +325,6 @@ def process_file(filename):
     print(f"  - Teste: {len(X_test)} amostras")
     
     # Salvar datasets
-    base_name = filename.replace('.csv', '')
-    
     # Salvar em formato numpy
     np.save(os.path.join(TRAINING_DIR, f'{base_name}_X_train.npy'), X_train)
     np.save(os.path.join(TRAINING_DIR, f'{base_name}_X_test.npy'), X_test)
@@ -200,7 +338,7 @@ def process_file(filename):
     print(f"✓ Dados de treinamento salvos para {base_name}")
     
     return {
-        'filename': filename,
+        'filename': base_name,
         'total_samples': len(X),
         'train_samples': len(X_train),
         'test_samples': len(X_test),
@@ -209,6 +347,31 @@ def process_file(filename):
         'sell_pct': label_counts.get(-1, 0)/len(df)*100
     }
 
+def benchmark_labels():
+    """Compara create_labels (vetorizado) com a versão original em laço"""
+    print("=" * 60)
+    print("BENCHMARK: create_labels")
+    print("=" * 60)
+    
+    for name in list_series(PROCESSED_DIR):
+        df = load_candles(PROCESSED_DIR, name)
+        
+        start = time.perf_counter()
+        expected = create_labels_loop(df)['label'].to_numpy()
+        loop_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        labels = create_labels(df)['label'].to_numpy()
+        vectorized_time = time.perf_counter() - start
+        
+        identical = np.array_equal(labels, expected)
+        
+        print(f"\n{name} ({len(df)} velas)")
+        print(f"  Laço:       {loop_time*1000:10.1f} ms")
+        print(f"  Vetorizado: {vectorized_time*1000:10.1f} ms")
+        print(f"  Speedup:    {loop_time / vectorized_time:10.1f}x")
+        print(f"  Labels idênticos: {'✓' if identical else '✗'}")
+
 def main():
     """Processa todos os arquivos"""
     print("=" * 60)
@@ -222,17 +385,17 @@ def main():
     print(f"  - Velas futuras analisadas: {FUTURE_CANDLES}")
     print("=" * 60)
     
-    # Listar arquivos
-    csv_files = [f for f in os.listdir(PROCESSED_DIR) if f.endswith('.csv')]
+    # Listar séries
+    series_names = list_series(PROCESSED_DIR)
     
-    if not csv_files:
+    if not series_names:
         print("✗ Nenhum arquivo encontrado")
         return
     
     results = []
     
-    for filename in csv_files:
-        result = process_file(filename)
+    for name in series_names:
+        result = process_file(name)
         results.append(result)
     
     print("\n" + "=" * 60)
@@ -248,4 +411,7 @@ def main():
         print(f"  BUY: {result['buy_pct']:.1f}% | HOLD: {result['hold_pct']:.1f}% | SELL: {result['sell_pct']:.1f}%")
 
 if __name__ == "__main__":
-    main()
+    if '--benchmark-labels' in sys.argv:
+        benchmark_labels()
+    else:
+        main()
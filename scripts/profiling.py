@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Instrumentação das etapas do pipeline (spans)
+
+    with span('fit', symbol='ETHUSDT', interval='1h', rows=len(X_train)) as s:
+        model.fit(X_train, y_train)
+        s.set(model='rf')
+
+Cada span mede tempo de parede, tempo de CPU (do processo, inclui threads),
+pico de RSS durante o span e número de linhas, e é gravado como uma linha
+JSON no arquivo indicado por PIPELINE_SPANS_FILE. Sem essa variável (e sem
+profiling pedido) os spans não medem nada, então o custo no caminho quente
+(ex: servidor de predição) é desprezível.
+
+Etapas: fetch, indicators, labeling, features, fit, inference, backtest
+
+O pico de RSS usa o high-water mark do kernel (VmHWM), zerado no início de
+cada span; spans aninhados repassam o próprio pico ao span externo. Sem
+/proc (ex: macOS) o valor é o pico do processo inteiro (ru_maxrss).
+
+PIPELINE_PROFILE=<etapa>[,<etapa>] roda a etapa sob cProfile: o .prof vai
+para logs/profiles/ e as funções mais caras são impressas no stderr.
+
+Uso: python3 profiling.py summary [arquivo.jsonl]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import resource
+import threading
+from datetime import datetime
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOGS_DIR = os.path.join(PROJECT_DIR, 'logs')
+DEFAULT_SPANS_FILE = os.path.join(LOGS_DIR, 'spans.jsonl')
+PROFILES_DIR = os.path.join(LOGS_DIR, 'profiles')
+
+SPANS_ENV = 'PIPELINE_SPANS_FILE'
+PROFILE_ENV = 'PIPELINE_PROFILE'
+RUN_ID_ENV = 'PIPELINE_RUN_ID'
+
+STAGES = ['fetch', 'indicators', 'labeling', 'features', 'fit', 'inference', 'backtest']
+
+# Funções listadas no resumo do cProfile
+PROFILE_TOP = 25
+
+_local = threading.local()
+_profiling = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+# Medição de memória
+# ---------------------------------------------------------------------------
+
+def _read_status_mb(field):
+    """Valor de /proc/self/status em MB (None se indisponível)"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Zera o high-water mark do RSS do processo (Linux); retorna se foi possível"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def current_rss_mb():
+    rss = _read_status_mb('VmRSS')
+    return rss if rss is not None else peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = _read_status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+# ---------------------------------------------------------------------------
+# Spans
+# ---------------------------------------------------------------------------
+
+def spans_file():
+    """Arquivo de saída dos spans (None = desativado)"""
+    return os.environ.get(SPANS_ENV) or None
+
+
+def profiled_stages():
+    return {stage.strip() for stage in os.environ.get(PROFILE_ENV, '').split(',') if stage.strip()}
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def emit(record, path=None):
+    """Acrescenta um registro como linha JSON (uma única escrita, segura entre processos)"""
+    path = path or spans_file()
+    if not path:
+        return
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    line = (json.dumps(record, default=str) + '\n').encode()
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+class Span:
+    """Span de uma etapa; use via span(...)"""
+
+    def __init__(self, stage, rows=None, **attrs):
+        self.stage = stage
+        self.rows = rows
+        self.attrs = attrs
+        self.record = None
+        self._enabled = spans_file() is not None
+        self._profile = stage in profiled_stages()
+
+    def set(self, **attrs):
+        """Acrescenta atributos ao registro (ex: linhas conhecidas só no fim)"""
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self):
+        if not (self._enabled or self._profile):
+            return self
+
+        stack = _stack()
+        if stack:
+            # O pico até aqui pertence ao span externo; o reset abaixo o apagaria
+            stack[-1]._child_peak = max(stack[-1]._child_peak, peak_rss_mb())
+        stack.append(self)
+
+        self._child_peak = 0.0
+        self._peak_reset = reset_peak_rss()
+        self._started_at = datetime.now().isoformat()
+        self._profiler = None
+
+        if self._profile and _profiling.acquire(blocking=False):
+            import cProfile
+            self._profiler = cProfile.Profile()
+
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        if self._profiler is not None:
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not (self._enabled or self._profile):
+            return False
+
+        if self._profiler is not None:
+            self._profiler.disable()
+
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        peak = max(peak_rss_mb(), self._child_peak)
+
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if stack:
+            stack[-1]._child_peak = max(stack[-1]._child_peak, peak)
+
+        record = {
+            'stage': self.stage,
+            'started_at': self._started_at,
+            'wall_seconds': round(wall, 6),
+            'cpu_seconds': round(cpu, 6),
+            'peak_rss_mb': round(peak, 1),
+            'peak_scope': 'span' if self._peak_reset else 'process',
+            'rows': self.rows,
+            **self.attrs,
+            'parent': stack[-1].stage if stack else None,
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'run_id': os.environ.get(RUN_ID_ENV),
+            'ok': exc_type is None,
+        }
+        if exc_type is not None:
+            record['error'] = f"{exc_type.__name__}: {exc}"
+
+        if self._profiler is not None:
+            record['profile'] = self._dump_profile()
+            _profiling.release()
+
+        self.record = record
+        if self._enabled:
+            emit(record)
+        return False
+
+    def _dump_profile(self):
+        """Grava o .prof e imprime as funções mais caras (tempo acumulado) no stderr"""
+        import pstats
+
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        path = os.path.join(PROFILES_DIR, f"{self.stage}-{datetime.now().strftime('%Y%m%d_%H%M%S')}-{os.getpid()}.prof")
+        self._profiler.dump_stats(path)
+
+        print(f"\n[profile] {self.stage}: {path}", file=sys.stderr)
+        pstats.Stats(self._profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        return path
+
+
+def span(stage, rows=None, **attrs):
+    """
+    Context manager que mede uma etapa
+
+    Args:
+        stage: Nome da etapa (ver STAGES)
+        rows: Linhas processadas (pode ser definido depois: s.rows = n)
+        **attrs: Atributos extras do registro (symbol, interval, model, ...)
+    """
+    return Span(stage, rows, **attrs)
+
+
+# ---------------------------------------------------------------------------
+# Leitura e resumo
+# ---------------------------------------------------------------------------
+
+def read_spans(path=DEFAULT_SPANS_FILE, offset=0):
+    """
+    Lê os spans gravados a partir de `offset` (bytes)
+
+    Returns:
+        (lista de registros, offset do fim do arquivo)
+    """
+    if not os.path.exists(path):
+        return [], offset
+
+    records = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+
+    # Ignora uma última linha incompleta (escrita em andamento)
+    end = data.rfind(b'\n') + 1
+    for line in data[:end].splitlines():
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+
+    return records, offset + end
+
+
+def summarize(records):
+    """Agrega spans de topo por etapa: contagem, tempos somados, pico máximo e linhas"""
+    summary = {}
+    for record in records:
+        if record.get('parent') == record['stage']:
+            continue
+
+        stage = summary.setdefault(record['stage'], {
+            'count': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_rss_mb': 0.0, 'rows': 0, 'errors': 0
+        })
+        stage['count'] += 1
+        stage['wall_seconds'] = round(stage['wall_seconds'] + record['wall_seconds'], 6)
+        stage['cpu_seconds'] = round(stage['cpu_seconds'] + record['cpu_seconds'], 6)
+        stage['peak_rss_mb'] = max(stage['peak_rss_mb'], record['peak_rss_mb'])
+        stage['rows'] += record.get('rows') or 0
+        stage['errors'] += 0 if record.get('ok', True) else 1
+
+    order = {stage: i for i, stage in enumerate(STAGES)}
+    return dict(sorted(summary.items(), key=lambda item: order.get(item[0], len(order))))
+
+
+def print_summary(summary):
+    print(f"{'Etapa':<12} {'N':>5} {'Parede (s)':>11} {'CPU (s)':>10} {'Pico (MB)':>10} {'Linhas':>12}")
+    print("-" * 64)
+    for stage, values in summary.items():
+        print(f"{stage:<12} {values['count']:>5} {values['wall_seconds']:>11.3f} {values['cpu_seconds']:>10.3f} "
+              f"{values['peak_rss_mb']:>10.1f} {values['rows']:>12}")
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'summary':
+        print(__doc__)
+        sys.exit(1)
+
+    path = sys.argv[2] if len(sys.argv) > 2 else (spans_file() or DEFAULT_SPANS_FILE)
+    records, _ = read_spans(path)
+    if not records:
+        print(f"Nenhum span em {path}")
+        sys.exit(1)
+
+    print_summary(summarize(records))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Reamostragem vetorizada de velas OHLCV
+Constrói os intervalos maiores (15m, 1h, ...) a partir da série base de 5m
+
+Cada vela agregada cobre um bucket alinhado a fronteiras UTC (múltiplos do
+intervalo desde a época Unix): open = primeiro, high = máximo, low = mínimo,
+close = último, volume (e demais colunas) = soma. Apenas buckets completos
+são gerados, então a vela ainda em formação só aparece quando fecha.
+
+Uso: python3 resample.py [SYMBOL ...]
+"""
+
+import sys
+import numpy as np
+import pandas as pd
+
+from candle_store import (
+    HISTORICAL_DIR, TIMESTAMP_COLUMN, series_exists, is_columnar, load_candles, open_columns,
+    save_candles, append_candles, count_candles
+)
+
+BASE_INTERVAL = '5m'
+DERIVED_INTERVALS = ['15m', '1h']
+
+_UNIT_NS = {
+    'm': 60 * 10**9,
+    'h': 60 * 60 * 10**9,
+    'd': 24 * 60 * 60 * 10**9,
+}
+
+
+def interval_ns(interval):
+    """Duração de um intervalo ('5m', '1h', '1d') em nanossegundos"""
+    unit = interval[-1].lower()
+    if unit not in _UNIT_NS or not interval[:-1].isdigit():
+        raise ValueError(f"Unsupported interval: {interval}")
+    return int(interval[:-1]) * _UNIT_NS[unit]
+
+
+def resample_ohlcv(df, interval, base_interval=BASE_INTERVAL, complete_only=True):
+    """
+    Agrega velas em um intervalo maior
+
+    Args:
+        df: Velas da série base ordenadas por timestamp
+        interval: Intervalo de destino (múltiplo do intervalo base)
+        base_interval: Intervalo das velas de entrada
+        complete_only: Descarta buckets com velas faltando (inclusive o em formação)
+
+    Returns:
+        DataFrame com as mesmas colunas de df
+    """
+    step = interval_ns(interval)
+    base_step = interval_ns(base_interval)
+    if step % base_step:
+        raise ValueError(f"{interval} is not a multiple of {base_interval}")
+
+    if len(df) == 0:
+        return df.iloc[:0].copy()
+
+    timestamps = pd.to_datetime(df[TIMESTAMP_COLUMN]).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    buckets = timestamps - timestamps % step
+
+    # Início de cada bucket (a série está ordenada, então buckets são contíguos)
+    starts = np.flatnonzero(np.concatenate([[True], buckets[1:] != buckets[:-1]]))
+    ends = np.append(starts[1:], len(df)) - 1
+
+    # Agregação sobre todos os buckets; reduceat vai de um início ao próximo
+    result = {TIMESTAMP_COLUMN: buckets[starts]}
+    for column in df.columns:
+        if column == TIMESTAMP_COLUMN:
+            continue
+        values = df[column].to_numpy(dtype=np.float64)
+        if column == 'open':
+            result[column] = values[starts]
+        elif column == 'close':
+            result[column] = values[ends]
+        elif column == 'high':
+            result[column] = np.maximum.reduceat(values, starts)
+        elif column == 'low':
+            result[column] = np.minimum.reduceat(values, starts)
+        else:
+            result[column] = np.add.reduceat(values, starts)
+
+    if complete_only:
+        complete = (ends - starts + 1) == step // base_step
+        result = {column: values[complete] for column, values in result.items()}
+
+    result[TIMESTAMP_COLUMN] = pd.to_datetime(result[TIMESTAMP_COLUMN])
+    return pd.DataFrame(result, columns=df.columns)
+
+
+def derive_candles(symbol, interval, directory=HISTORICAL_DIR, after=None, base_interval=BASE_INTERVAL):
+    """
+    Velas completas de `interval` derivadas da série base armazenada
+
+    Args:
+        after: Retorna apenas velas com timestamp posterior (lê só a cauda da base)
+
+    Returns:
+        DataFrame (vazio se a série base não existir)
+    """
+    base_name = f"{symbol}_{base_interval}"
+    if not series_exists(directory, base_name):
+        return pd.DataFrame()
+
+    if after is None:
+        base = load_candles(directory, base_name)
+    else:
+        # Primeiro bucket ainda não derivado começa um intervalo após `after`
+        first_bucket = pd.Timestamp(after).value + interval_ns(interval)
+        if is_columnar(directory, base_name):
+            timestamps = open_columns(directory, base_name, [TIMESTAMP_COLUMN])[TIMESTAMP_COLUMN]
+            start = int(np.searchsorted(timestamps, first_bucket))
+            base = load_candles(directory, base_name, tail=len(timestamps) - start)
+        else:
+            base = load_candles(directory, base_name)
+            base = base[base[TIMESTAMP_COLUMN] >= pd.Timestamp(first_bucket)].reset_index(drop=True)
+
+    return resample_ohlcv(base, interval, base_interval)
+
+
+def update_derived(symbol, intervals=DERIVED_INTERVALS, directory=HISTORICAL_DIR,
+                   base_interval=BASE_INTERVAL, rebuild=False):
+    """
+    Atualiza as séries derivadas de um símbolo a partir da série base
+
+    Apenas buckets posteriores à última vela de cada série derivada são
+    calculados e anexados.
+
+    Args:
+        rebuild: Recalcula as séries inteiras (necessário quando lacunas no
+                 meio da série base foram preenchidas)
+
+    Returns:
+        Dicionário intervalo -> número de velas anexadas
+    """
+    appended = {}
+
+    for interval in intervals:
+        name = f"{symbol}_{interval}"
+        after = None
+        if not rebuild and series_exists(directory, name):
+            last = load_candles(directory, name, columns=[TIMESTAMP_COLUMN], tail=1)
+            after = last[TIMESTAMP_COLUMN].iloc[-1] if len(last) else None
+
+        candles = derive_candles(symbol, interval, directory, after=after, base_interval=base_interval)
+
+        if len(candles) == 0:
+            appended[interval] = 0
+        elif after is None:
+            previous = count_candles(directory, name) if series_exists(directory, name) else 0
+            save_candles(candles, directory, name)
+            appended[interval] = max(0, len(candles) - previous)
+        else:
+            appended[interval] = append_candles(candles, directory, name)
+
+    return appended
+
+
+def main():
+    symbols = sys.argv[1:] or ['BTCUSDT', 'ETHUSDT', 'SOLUSDT']
+
+    print("=" * 60)
+    print(f"REAMOSTRAGEM {BASE_INTERVAL} -> {', '.join(DERIVED_INTERVALS)}")
+    print("=" * 60)
+
+    for symbol in symbols:
+        if not series_exists(HISTORICAL_DIR, f"{symbol}_{BASE_INTERVAL}"):
+            print(f"✗ {symbol}: série base {BASE_INTERVAL} não encontrada")
+            continue
+
+        appended = update_derived(symbol)
+        for interval, count in appended.items():
+            total = count_candles(HISTORICAL_DIR, f"{symbol}_{interval}")
+            print(f"✓ {symbol} {interval}: {count} velas novas ({total} no total)")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,103 +2,475 @@
 """
 Script para retreinamento de modelos de IA
 Pode ser executado manualmente ou via agendamento
+
+Uso: python3 retrain.py [SYMBOL:INTERVAL ...] [--update-data] [--force] [--jobs N] [--fast]
+                        [--incremental [--retire]] [--profile ETAPA]
+
+O retreinamento é um grafo de etapas por par (símbolo/intervalo), executado
+no próprio processo Python (sem subprocessos por etapa):
+
+    update (opcional) -> prepare -> train
+
+Antes de rodar uma etapa, suas entradas são resumidas num fingerprint:
+
+- prepare: hash da série processada (content_hash do manifest) e do código
+  de labeling/features (prepare_training_data.py, feature_store.py, onde
+  ficam os parâmetros de labeling);
+- train: hash das matrizes de treino/teste e do código de treino
+  (train_model.py, model_bundle.py, onde ficam os hiperparâmetros), além
+  do modo --fast.
+
+Se o fingerprint é igual ao da última execução bem-sucedida (retrain_state.json)
+e as saídas ainda existem, a etapa é pulada. Como o prepare é determinístico,
+um par cujos dados não mudaram não é retreinado. Os ramos dos pares são
+independentes e rodam em paralelo (ProcessPoolExecutor); as atualizações do
+mesmo símbolo são encadeadas porque gravam o mesmo histórico base.
+
+O módulo só importa a biblioteca padrão: os scripts das etapas (pandas,
+scikit-learn) são importados nos workers, então uma execução sem mudanças
+termina em frações de segundo.
+
+--incremental troca o treino completo pelo warm start do train_model
+(árvores novas ajustadas nas velas chegadas desde o último treino).
+
+A saída de cada etapa vai para logs/retrain/<run_id>/<etapa>.log. Os spans
+(profiling.py) são gravados em logs/spans.jsonl e resumidos por etapa em
+retrain_log.json. --profile roda a etapa indicada (ex: fit, features) sob
+cProfile.
 """
 
 import os
 import sys
 import json
+import time
+import shutil
+import hashlib
+import argparse
+import contextlib
 from datetime import datetime
-import subprocess
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from profiling import (
+    DEFAULT_SPANS_FILE, LOGS_DIR, SPANS_ENV, PROFILE_ENV, RUN_ID_ENV, STAGES, read_spans, summarize, print_summary
+)
 
-PROJECT_DIR = os.path.dirname(os.path.dirname(__file__))
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SCRIPTS_DIR = os.path.join(PROJECT_DIR, 'scripts')
+PROCESSED_DIR = os.path.join(PROJECT_DIR, 'data', 'processed')
+TRAINING_DIR = os.path.join(PROJECT_DIR, 'data', 'training')
+
+LOG_FILE = os.path.join(PROJECT_DIR, 'retrain_log.json')
+STATE_FILE = os.path.join(PROJECT_DIR, 'retrain_state.json')
+RUN_LOGS_DIR = os.path.join(LOGS_DIR, 'retrain')
+
+# Código cujas constantes (parâmetros de labeling, hiperparâmetros) definem cada etapa
+STAGE_CODE = {
+    'prepare': ['prepare_training_data.py', 'feature_store.py'],
+    'train': ['train_model.py', 'model_bundle.py'],
+}
+
+# Arquivos gravados pelo prepare e lidos pelo train
+TRAINING_FILES = ['X_train.npy', 'X_test.npy', 'y_train.npy', 'y_test.npy', 'features.txt']
+
+# Execuções mantidas em logs/retrain e em retrain_log.json
+KEEP_RUNS = 50
+
+# Linhas finais do log impressas quando uma etapa falha
+FAILURE_TAIL_LINES = 20
+
+
+# ---------------------------------------------------------------------------
+# Fingerprints
+# ---------------------------------------------------------------------------
+
+def file_digest(path, cache):
+    """
+    SHA-256 do conteúdo de um arquivo
+
+    O hash é reaproveitado enquanto tamanho e mtime não mudarem (cache
+    persistido no estado), então arquivos grandes não são relidos a cada execução.
+    """
+    stat = os.stat(path)
+    key = [stat.st_size, stat.st_mtime_ns]
+    entry = cache.get(path)
+    if entry and entry[:2] == key:
+        return entry[2]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+    cache[path] = key + [digest.hexdigest()]
+    return cache[path][2]
+
+
+def series_digest(name, cache):
+    """Hash da série processada: content_hash do manifest colunar, ou do CSV legado"""
+    manifest = os.path.join(PROCESSED_DIR, name, 'manifest.json')
+    if os.path.exists(manifest):
+        with open(manifest, 'r') as f:
+            return json.load(f)['content_hash']
+    return file_digest(os.path.join(PROCESSED_DIR, f"{name}.csv"), cache)
+
+
+def training_paths(name):
+    return [os.path.join(TRAINING_DIR, f"{name}_{suffix}") for suffix in TRAINING_FILES]
+
+
+def node_fingerprint(node, options, cache):
+    """
+    Fingerprint das entradas de uma etapa (None = sempre executar)
+
+    Raises:
+        OSError: se alguma entrada não existir (a etapa é executada e reporta o erro)
+    """
+    kind = node['kind']
+    if kind == 'update':
+        # Fonte externa (Bybit): não há como saber se mudou sem buscar
+        return None
+
+    name = f"{node['symbol']}_{node['interval']}"
+    inputs = {
+        'stage': kind,
+        'code': {filename: file_digest(os.path.join(SCRIPTS_DIR, filename), cache) for filename in STAGE_CODE[kind]},
+    }
+
+    if kind == 'prepare':
+        inputs['data'] = series_digest(name, cache)
+    else:
+        inputs['data'] = [file_digest(path, cache) for path in training_paths(name)]
+        inputs['fast'] = options['fast']
+
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Grafo
+# ---------------------------------------------------------------------------
+
+def discover_pairs():
+    """Pares com série processada (ex: ETHUSDT_1h -> ('ETHUSDT', '1h'))"""
+    if not os.path.isdir(PROCESSED_DIR):
+        return []
+
+    names = set()
+    for entry in os.listdir(PROCESSED_DIR):
+        if entry.endswith('.csv'):
+            names.add(entry[:-len('.csv')])
+        elif os.path.exists(os.path.join(PROCESSED_DIR, entry, 'manifest.json')):
+            names.add(entry)
+
+    pairs = []
+    for name in sorted(names):
+        symbol, _, interval = name.rpartition('_')
+        if symbol and interval:
+            pairs.append((symbol, interval))
+    return pairs
+
+
+def build_graph(pairs, update_data=False):
+    """
+    Monta o grafo de etapas
+
+    Returns:
+        Dicionário ordenado id -> {'kind', 'symbol', 'interval', 'deps'}
+    """
+    nodes = {}
+    last_update = {}
+
+    for symbol, interval in pairs:
+        deps = []
+        if update_data:
+            node_id = f"update:{symbol}_{interval}"
+            # Atualizações do mesmo símbolo anexam ao mesmo histórico base
+            nodes[node_id] = {'kind': 'update', 'symbol': symbol, 'interval': interval,
+                              'deps': [last_update[symbol]] if symbol in last_update else []}
+            last_update[symbol] = node_id
+            deps = [node_id]
+
+        prepare_id = f"prepare:{symbol}_{interval}"
+        nodes[prepare_id] = {'kind': 'prepare', 'symbol': symbol, 'interval': interval, 'deps': deps}
+        nodes[f"train:{symbol}_{interval}"] = {'kind': 'train', 'symbol': symbol, 'interval': interval,
+                                               'deps': [prepare_id]}
+
+    return nodes
+
+
+def run_node(kind, symbol, interval, options, log_path):
+    """
+    Executa uma etapa (no worker); a saída vai para log_path
+
+    Returns:
+        Lista dos arquivos de saída da etapa
+    """
+    name = f"{symbol}_{interval}"
+
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        if kind == 'update':
+            from update_data import update_symbol_data
+
+            if not update_symbol_data(symbol, interval):
+                raise RuntimeError(f"data update failed for {name}")
+            return []
+
+        if kind == 'prepare':
+            from prepare_training_data import process_file
+
+            process_file(name)
+            return training_paths(name)
+
+        if kind == 'train':
+            import model_bundle
+            from train_model import MODELS_DIR, train_for_symbol_interval, train_incremental
+
+            if options['incremental']:
+                train_incremental(symbol, interval, retire=options['retire'], fast=options['fast'],
+                                  n_jobs=options['n_jobs'])
+            else:
+                train_for_symbol_interval(symbol, interval, fast=options['fast'], n_jobs=options['n_jobs'])
+            return [model_bundle.bundle_path(symbol, interval, MODELS_DIR)]
+
+    raise ValueError(f"Unknown stage: {kind}")
+
 
-def run_command(cmd, description):
-    """Executa comando e mostra progresso"""
-    print(f"\n{'='*60}")
-    print(f"{description}")
-    print(f"{'='*60}")
-    
-    result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-    
-    if result.returncode != 0:
-        print(f"✗ Erro: {result.stderr}")
-        return False
-    
-    print(result.stdout)
-    print(f"✓ {description} concluído!")
-    return True
-
-def retrain_all(update_data=False):
+# ---------------------------------------------------------------------------
+# Estado e logs
+# ---------------------------------------------------------------------------
+
+def load_state():
+    if os.path.exists(STATE_FILE):
+        try:
+            with open(STATE_FILE, 'r') as f:
+                state = json.load(f)
+            state.setdefault('nodes', {})
+            state.setdefault('files', {})
+            return state
+        except (OSError, ValueError):
+            pass
+    return {'nodes': {}, 'files': {}}
+
+
+def save_state(state):
+    """Grava o estado de forma atômica (uma execução interrompida não o corrompe)"""
+    tmp_path = STATE_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def print_log_tail(path, lines=FAILURE_TAIL_LINES):
+    try:
+        with open(path, 'r') as f:
+            tail = f.readlines()[-lines:]
+    except OSError:
+        return
+    for line in tail:
+        print(f"      {line.rstrip()}")
+
+
+def prune_run_logs(keep=KEEP_RUNS):
+    if not os.path.isdir(RUN_LOGS_DIR):
+        return
+    for run_id in sorted(os.listdir(RUN_LOGS_DIR))[:-keep]:
+        shutil.rmtree(os.path.join(RUN_LOGS_DIR, run_id), ignore_errors=True)
+
+
+def append_log(log_entry):
+    """Acrescenta a execução ao retrain_log.json (mantém as últimas KEEP_RUNS)"""
+    logs = []
+    if os.path.exists(LOG_FILE):
+        with open(LOG_FILE, 'r') as f:
+            try:
+                logs = json.load(f)
+            except ValueError:
+                logs = []
+
+    logs.append(log_entry)
+
+    with open(LOG_FILE, 'w') as f:
+        json.dump(logs[-KEEP_RUNS:], f, indent=2)
+
+
+# ---------------------------------------------------------------------------
+# Execução
+# ---------------------------------------------------------------------------
+
+def run_graph(nodes, state, options, run_dir, workers):
+    """
+    Executa o grafo: etapas prontas com fingerprint inalterado são puladas,
+    as demais vão para o pool assim que suas dependências terminam
+
+    Returns:
+        Lista de resultados por etapa, na ordem de conclusão
     """
-    Retreina todos os modelos
-    
+    pending = dict(nodes)
+    status = {}
+    results = []
+    running = {}
+    executor = None
+
+    def finish(node_id, result):
+        status[node_id] = result['status']
+        results.append(dict(result, step=node_id, timestamp=datetime.now().isoformat()))
+
+    try:
+        while pending or running:
+            # Agendar tudo o que estiver pronto (pular uma etapa pode liberar a seguinte)
+            progress = True
+            while progress:
+                progress = False
+                for node_id, node in list(pending.items()):
+                    if any(status.get(dep) in ('failed', 'blocked') for dep in node['deps']):
+                        del pending[node_id]
+                        finish(node_id, {'status': 'blocked', 'success': False, 'wall_seconds': 0.0})
+                        print(f"  - {node_id}: não executada (dependência falhou)")
+                        progress = True
+                        continue
+
+                    if not all(status.get(dep) in ('ran', 'skipped') for dep in node['deps']):
+                        continue
+
+                    del pending[node_id]
+                    progress = True
+
+                    try:
+                        fingerprint = node_fingerprint(node, options, state['files'])
+                    except OSError:
+                        fingerprint = None
+
+                    previous = state['nodes'].get(node_id)
+                    if (not options['force'] and fingerprint is not None and previous
+                            and previous['fingerprint'] == fingerprint
+                            and all(os.path.exists(path) for path in previous['outputs'])):
+                        finish(node_id, {'status': 'skipped', 'success': True, 'wall_seconds': 0.0})
+                        print(f"  = {node_id}: sem mudanças")
+                        continue
+
+                    if executor is None:
+                        executor = ProcessPoolExecutor(max_workers=workers)
+
+                    log_path = os.path.join(run_dir, f"{node_id.replace(':', '_')}.log")
+                    future = executor.submit(run_node, node['kind'], node['symbol'], node['interval'],
+                                             options, log_path)
+                    running[future] = (node_id, fingerprint, log_path, time.perf_counter())
+                    print(f"  > {node_id}")
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                node_id, fingerprint, log_path, start = running.pop(future)
+                seconds = round(time.perf_counter() - start, 3)
+                result = {'wall_seconds': seconds, 'log': log_path}
+
+                try:
+                    outputs = future.result()
+                except Exception as e:
+                    finish(node_id, dict(result, status='failed', success=False, error=str(e)))
+                    print(f"  ✗ {node_id}: {e} ({seconds:.1f}s, log: {log_path})")
+                    print_log_tail(log_path)
+                    continue
+
+                finish(node_id, dict(result, status='ran', success=True))
+                print(f"  ✓ {node_id} ({seconds:.1f}s)")
+
+                # Estado gravado a cada etapa: uma execução interrompida não refaz o que já terminou
+                if fingerprint is not None:
+                    state['nodes'][node_id] = {
+                        'fingerprint': fingerprint,
+                        'outputs': outputs,
+                        'finished_at': datetime.now().isoformat(),
+                        'wall_seconds': seconds,
+                    }
+                    save_state(state)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return results
+
+
+def retrain_all(update_data=False, profile=None, pairs=None, force=False, jobs=None, fast=False,
+                incremental=False, retire=False):
+    """
+    Retreina os modelos cujas entradas mudaram
+
     Args:
         update_data: Se True, atualiza dados antes de retreinar
+        profile: Etapa(s) a rodar sob cProfile (ex: 'fit' ou 'fit,features')
+        pairs: Lista de (symbol, interval) (padrão: todas as séries processadas)
+        force: Reexecuta todas as etapas, ignorando os fingerprints
+        jobs: Ramos executados em paralelo (padrão: um por núcleo, até o número de pares)
+        fast: Modo rápido do train_model (Hist Gradient Boosting)
+        incremental: Estende os modelos salvos (warm start) em vez de treinar do zero
+        retire: No modo incremental, descarta as árvores mais antigas (Random Forest)
     """
     print(f"\n{'#'*60}")
     print(f"RETREINAMENTO DE MODELOS - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"{'#'*60}")
-    
-    steps = []
-    
-    if update_data:
-        steps.append({
-            'cmd': f'python3 {os.path.join(SCRIPTS_DIR, "update_data.py")}',
-            'desc': 'Atualizando dados das últimas 24h'
-        })
-    
-    steps.extend([
-        {
-            'cmd': f'python3 {os.path.join(SCRIPTS_DIR, "prepare_training_data.py")}',
-            'desc': 'Preparando dados de treinamento'
-        },
-        {
-            'cmd': f'python3 {os.path.join(SCRIPTS_DIR, "train_model.py")}',
-            'desc': 'Treinando modelos de IA'
-        }
-    ])
-    
-    results = []
-    for step in steps:
-        success = run_command(step['cmd'], step['desc'])
-        results.append({
-            'step': step['desc'],
-            'success': success,
-            'timestamp': datetime.now().isoformat()
-        })
-        
-        if not success:
-            print(f"\n✗ Retreinamento falhou na etapa: {step['desc']}")
-            break
-    
-    # Salvar log do retreinamento
-    log_file = os.path.join(PROJECT_DIR, 'retrain_log.json')
-    
+
+    start = time.perf_counter()
+    pairs = pairs or discover_pairs()
+    nodes = build_graph(pairs, update_data=update_data)
+
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(jobs or cpus, len(pairs) or 1))
+    options = {'force': force, 'fast': fast, 'incremental': incremental, 'retire': retire,
+               'n_jobs': max(1, cpus // workers)}
+    print(f"{len(pairs)} par(es), {len(nodes)} etapa(s), até {workers} em paralelo\n")
+
+    # Os workers gravam seus spans no mesmo arquivo, marcados com o run_id
+    run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+    spans_path = os.environ.get(SPANS_ENV) or DEFAULT_SPANS_FILE
+    os.environ[SPANS_ENV] = spans_path
+    os.environ[RUN_ID_ENV] = run_id
+    if profile:
+        os.environ[PROFILE_ENV] = profile
+    offset = os.path.getsize(spans_path) if os.path.exists(spans_path) else 0
+
+    run_dir = os.path.join(RUN_LOGS_DIR, run_id)
+    os.makedirs(run_dir, exist_ok=True)
+
+    state = load_state()
+    results = run_graph(nodes, state, options, run_dir, workers)
+    save_state(state)
+
+    spans, _ = read_spans(spans_path, offset)
+    run_spans = [record for record in spans if record.get('run_id') == run_id]
+
+    if not any(result['status'] != 'skipped' for result in results):
+        # Nada executado: não guardar um diretório de logs vazio
+        shutil.rmtree(run_dir, ignore_errors=True)
+    prune_run_logs()
+
     log_entry = {
         'timestamp': datetime.now().isoformat(),
+        'run_id': run_id,
         'update_data': update_data,
+        'incremental': incremental,
+        'wall_seconds': round(time.perf_counter() - start, 3),
         'steps': results,
-        'success': all(r['success'] for r in results)
+        'ran': sum(result['status'] == 'ran' for result in results),
+        'skipped': sum(result['status'] == 'skipped' for result in results),
+        'stages': summarize(run_spans),
+        'profiles': [record['profile'] for record in run_spans if record.get('profile')],
+        'spans_file': spans_path,
+        'success': all(result['success'] for result in results)
     }
-    
-    # Carregar logs existentes
-    logs = []
-    if os.path.exists(log_file):
-        with open(log_file, 'r') as f:
-            try:
-                logs = json.load(f)
-            except:
-                logs = []
-    
-    logs.append(log_entry)
-    
-    # Manter apenas últimos 50 logs
-    logs = logs[-50:]
-    
-    with open(log_file, 'w') as f:
-        json.dump(logs, f, indent=2)
-    
+    append_log(log_entry)
+
+    if run_spans:
+        print(f"\n{'#'*60}")
+        print("TEMPO E MEMÓRIA POR ETAPA")
+        print(f"{'#'*60}")
+        print_summary(log_entry['stages'])
+
+    print(f"\nEtapas executadas: {log_entry['ran']} | sem mudanças: {log_entry['skipped']} "
+          f"| tempo total: {log_entry['wall_seconds']:.2f}s")
+
     if log_entry['success']:
         print(f"\n{'#'*60}")
         print("✓ RETREINAMENTO CONCLUÍDO COM SUCESSO!")
@@ -107,14 +479,34 @@ def retrain_all(update_data=False):
         print(f"\n{'#'*60}")
         print("✗ RETREINAMENTO FALHOU")
         print(f"{'#'*60}\n")
-    
+
     return log_entry
 
 def main():
-    update_data = '--update-data' in sys.argv or '-u' in sys.argv
-    
-    result = retrain_all(update_data=update_data)
-    
+    parser = argparse.ArgumentParser(description='Retreina os modelos cujas entradas mudaram')
+    parser.add_argument('pairs', nargs='*', help='Pares SYMBOL:INTERVAL (padrão: todas as séries processadas)')
+    parser.add_argument('--update-data', '-u', action='store_true', help='Atualizar dados antes de retreinar')
+    parser.add_argument('--force', action='store_true', help='Reexecutar todas as etapas')
+    parser.add_argument('--jobs', type=int, default=None, help='Ramos em paralelo (padrão: núcleos disponíveis)')
+    parser.add_argument('--fast', action='store_true', help='Modo rápido do treino (Hist Gradient Boosting)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Estende os modelos com as velas novas (warm start) em vez de treinar do zero')
+    parser.add_argument('--retire', action='store_true',
+                        help='Incremental: descarta as árvores mais antigas (Random Forest)')
+    parser.add_argument('--profile', metavar='ETAPA', help=f"Etapa(s) sob cProfile ({', '.join(STAGES)})")
+    args = parser.parse_args()
+
+    pairs = []
+    for item in args.pairs:
+        symbol, _, interval = item.partition(':')
+        if not symbol or not interval:
+            parser.error(f"Par inválido: {item} (formato SYMBOL:INTERVAL)")
+        pairs.append((symbol, interval))
+
+    result = retrain_all(update_data=args.update_data, profile=args.profile, pairs=pairs,
+                         force=args.force, jobs=args.jobs, fast=args.fast,
+                         incremental=args.incremental, retire=args.retire)
+
     # Retornar código de saída apropriado
     sys.exit(0 if result['success'] else 1)
 
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Ingestão de velas em tempo real via WebSocket da Bybit (tópico kline)
+
+Assina kline.<intervalo>.<símbolo> de vários pares numa única conexão. Cada
+vela confirmada (confirm=true) é gravada direto nas séries armazenadas:
+histórico bruto e, com os indicadores incrementais, o dataset processado.
+Em seguida o callback de fechamento é chamado (ex: predição), sem esperar
+a próxima execução do update_data.
+
+As mensagens chegam na thread do WebSocket, que atualiza o CandleBuffer do
+par (vela em formação corrigida in-place) e enfileira as velas confirmadas;
+a gravação e os callbacks rodam na thread que chamou run(), em ordem.
+
+Uso: python3 stream_klines.py <SYMBOL:INTERVAL> [...] [--predict] [--url URL]
+Exemplo: python3 stream_klines.py ETHUSDT:1h SOLUSDT:1h --predict
+         python3 stream_klines.py ETHUSDT:5m --url ws://127.0.0.1:8765  (fake_kline_server.py)
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from datetime import datetime
+import pandas as pd
+
+from pybit.unified_trading import WebSocket
+
+from candle_buffer import CandleBuffer, DEFAULT_CAPACITY
+from candle_store import HISTORICAL_DIR, PROCESSED_DIR, series_exists, load_candles, append_candles
+from resample import BASE_INTERVAL, interval_ns
+from streaming_indicators import OHLCV_COLUMNS, StreamingIndicators, load_or_bootstrap, state_path
+
+# Intervalo no formato Bybit
+BYBIT_INTERVALS = {
+    '1m': '1',
+    '5m': '5',
+    '15m': '15',
+    '30m': '30',
+    '1h': '60',
+    '4h': '240',
+    '1d': 'D',
+}
+INTERVAL_NAMES = {value: key for key, value in BYBIT_INTERVALS.items()}
+
+DEFAULT_CHANNEL = 'linear'
+
+# Campo acrescentado à linha entregue a on_close: envio da confirmação (ms, campo ts da mensagem)
+CONFIRMED_AT = 'confirmed_at'
+
+
+class KlineWebSocket(WebSocket):
+    """WebSocket do pybit com endereço substituível (ex: servidor fake local)"""
+
+    def __init__(self, channel_type=DEFAULT_CHANNEL, url=None, **kwargs):
+        self.url_override = url
+        super().__init__(channel_type, **kwargs)
+
+    def _connect(self, url):
+        super()._connect(self.url_override or url)
+
+
+def parse_topic(topic):
+    """'kline.60.ETHUSDT' -> ('ETHUSDT', '1h')"""
+    _, bybit_interval, symbol = topic.split('.', 2)
+    return symbol, INTERVAL_NAMES.get(bybit_interval, bybit_interval)
+
+
+def kline_to_candle(kline):
+    """Converte um item do tópico kline numa linha OHLCV (timestamp = abertura da vela)"""
+    return {
+        'timestamp': pd.to_datetime(int(kline['start']), unit='ms'),
+        'open': float(kline['open']),
+        'high': float(kline['high']),
+        'low': float(kline['low']),
+        'close': float(kline['close']),
+        'volume': float(kline['volume']),
+    }
+
+
+class KlineStreamer:
+    """
+    Ingestor de velas em tempo real para vários pares
+
+    Args:
+        pairs: Lista de (symbol, interval), ex: [('ETHUSDT', '1h')]
+        on_close: Callback (symbol, interval, row) chamado após gravar cada
+            vela confirmada; row é a linha processada (OHLCV + indicadores,
+            mais CONFIRMED_AT quando a mensagem traz ts)
+        url: Endereço do WebSocket (padrão: público da Bybit)
+        testnet: Usar a testnet da Bybit
+        historical_dir, processed_dir: Diretórios das séries
+        buffer_size: Velas mantidas em memória por par (CandleBuffer)
+    """
+
+    def __init__(self, pairs, on_close=None, url=None, testnet=False, channel_type=DEFAULT_CHANNEL,
+                 historical_dir=HISTORICAL_DIR, processed_dir=PROCESSED_DIR, buffer_size=DEFAULT_CAPACITY):
+        for symbol, interval in pairs:
+            if interval not in BYBIT_INTERVALS:
+                raise ValueError(f"Unsupported interval: {interval}")
+
+        self.pairs = list(dict.fromkeys(pairs))
+        self.on_close = on_close
+        self.url = url
+        self.testnet = testnet
+        self.channel_type = channel_type
+        self.historical_dir = historical_dir
+        self.processed_dir = processed_dir
+
+        self.queue = queue.Queue()
+        self.buffer_size = buffer_size
+        self.buffers = {}
+        self.last_closed = {}
+        self.indicators = {}
+        self.stats = {'messages': 0, 'closed': 0, 'duplicates': 0, 'gaps': 0, 'errors': 0}
+        self.ws = None
+        self._stop = threading.Event()
+
+    def load_buffers(self):
+        """Preenche o buffer de cada par com as velas mais recentes já gravadas"""
+        for symbol, interval in self.pairs:
+            name = f"{symbol}_{interval}"
+            buffer = CandleBuffer(self.buffer_size)
+            for directory in (self.processed_dir, self.historical_dir):
+                if series_exists(directory, name):
+                    buffer.extend(load_candles(directory, name, columns=OHLCV_COLUMNS, tail=self.buffer_size))
+                    break
+            self.buffers[(symbol, interval)] = buffer
+
+    def candles(self, symbol, interval, n=None, closed_only=False):
+        """View (sem cópia) das últimas n velas do par em memória, incluindo a em formação"""
+        return self.buffers[(symbol, interval)].last(n, closed_only)
+
+    def connect(self):
+        """Abre a conexão e assina os tópicos (uma assinatura por intervalo)"""
+        if not self.buffers:
+            self.load_buffers()
+
+        self.ws = KlineWebSocket(self.channel_type, url=self.url, testnet=self.testnet)
+
+        by_interval = {}
+        for symbol, interval in self.pairs:
+            by_interval.setdefault(interval, []).append(symbol)
+
+        for interval, symbols in by_interval.items():
+            self.ws.kline_stream(interval=BYBIT_INTERVALS[interval], symbol=symbols, callback=self.handle_message)
+
+    def handle_message(self, message):
+        """Callback do pybit (thread do WebSocket): guarda a vela em formação e enfileira as confirmadas"""
+        symbol, interval = parse_topic(message['topic'])
+        self.stats['messages'] += 1
+
+        buffer = self.buffers.get((symbol, interval))
+
+        for kline in message.get('data', []):
+            candle = kline_to_candle(kline)
+            closed = bool(kline.get('confirm'))
+            if buffer is not None:
+                buffer.upsert(candle, closed=closed)
+            if closed:
+                self.queue.put((symbol, interval, candle, message.get('ts')))
+
+    def _last_timestamp(self, symbol, interval):
+        """Última vela fechada já gravada no dataset processado"""
+        key = (symbol, interval)
+        if key not in self.last_closed:
+            name = f"{symbol}_{interval}"
+            if series_exists(self.processed_dir, name):
+                self.last_closed[key] = load_candles(self.processed_dir, name, columns=['timestamp'], tail=1)['timestamp'].max()
+            else:
+                self.last_closed[key] = None
+        return self.last_closed[key]
+
+    def store_candle(self, symbol, interval, candle):
+        """
+        Grava uma vela confirmada no histórico e no dataset processado
+
+        Returns:
+            Linha processada (Series) ou None se a vela já estava gravada ou
+            os indicadores ainda estão em aquecimento (série nova)
+        """
+        name = f"{symbol}_{interval}"
+        last = self._last_timestamp(symbol, interval)
+        timestamp = candle['timestamp']
+
+        if last is not None and timestamp <= last:
+            self.stats['duplicates'] += 1
+            return None
+
+        if last is not None and (timestamp - last).value > interval_ns(interval):
+            # Velas perdidas (ex: reconexão): o update_data preenche o histórico
+            self.stats['gaps'] += 1
+            print(f"  ⚠ {name}: lacuna de {last} a {timestamp}", file=sys.stderr)
+
+        new_data = pd.DataFrame([candle], columns=OHLCV_COLUMNS)
+
+        if interval == BASE_INTERVAL or series_exists(self.historical_dir, name):
+            append_candles(new_data, self.historical_dir, name)
+
+        if name not in self.indicators:
+            path = state_path(name, self.processed_dir)
+            self.indicators[name] = StreamingIndicators.load(path) if os.path.exists(path) else load_or_bootstrap(name)
+        indicators = self.indicators[name]
+
+        processed_rows = indicators.update_many(new_data)
+        if len(processed_rows):
+            append_candles(processed_rows, self.processed_dir, name)
+        indicators.save(state_path(name, self.processed_dir))
+
+        self.last_closed[(symbol, interval)] = timestamp
+        self.stats['closed'] += 1
+        return processed_rows.iloc[-1] if len(processed_rows) else None
+
+    def process_pending(self, timeout=None):
+        """
+        Grava as velas confirmadas da fila e chama on_close
+
+        Returns:
+            Número de velas novas gravadas
+        """
+        stored = 0
+        try:
+            item = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return 0
+
+        while True:
+            symbol, interval, candle, sent_at = item
+            try:
+                row = self.store_candle(symbol, interval, candle)
+            except Exception as e:
+                row = None
+                self.stats['errors'] += 1
+                print(f"  ✗ Erro ao gravar {symbol} {interval} {candle['timestamp']}: {e}", file=sys.stderr)
+
+            if row is not None:
+                stored += 1
+                if sent_at is not None:
+                    row = row.copy()
+                    row[CONFIRMED_AT] = int(sent_at)
+                if self.on_close is not None:
+                    try:
+                        self.on_close(symbol, interval, row)
+                    except Exception as e:
+                        print(f"  ✗ Callback falhou para {symbol} {interval}: {e}", file=sys.stderr)
+
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return stored
+
+    def run(self, duration=None):
+        """Conecta e processa velas até stop(), Ctrl+C ou `duration` segundos"""
+        if self.ws is None:
+            self.connect()
+
+        deadline = time.time() + duration if duration else None
+        try:
+            while not self._stop.is_set() and (deadline is None or time.time() < deadline):
+                self.process_pending(timeout=0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.exit()
+            self.ws = None
+
+
+def close_latency_ms(interval, row):
+    """
+    Tempo entre o fechamento da vela e agora
+
+    O fechamento é o fim nominal da vela ou, se anterior, o envio da mensagem
+    de confirmação pelo servidor (CONFIRMED_AT). Na Bybit a confirmação chega
+    depois do fim da vela; o fake_kline_server acelera o tempo e confirma
+    velas cujo fim nominal ainda está no futuro.
+    """
+    closed_at = pd.Timestamp(row['timestamp']).value + interval_ns(interval)
+    confirmed_at = row.get(CONFIRMED_AT)
+    if confirmed_at is not None and not pd.isna(confirmed_at):
+        closed_at = min(closed_at, int(confirmed_at) * 10**6)
+    return (time.time_ns() - closed_at) / 1e6
+
+
+def print_candle(symbol, interval, row):
+    """Callback padrão: uma linha JSON por vela fechada"""
+    print(json.dumps({
+        'symbol': symbol,
+        'interval': interval,
+        'timestamp': pd.Timestamp(row['timestamp']).isoformat(),
+        'close': float(row['close']),
+        'closeLatencyMs': round(close_latency_ms(interval, row), 1),
+    }), flush=True)
+
+
+def print_prediction(symbol, interval, row):
+    """Callback --predict: predição com o modelo do par assim que a vela fecha"""
+    from predict import make_prediction
+
+    result = make_prediction(symbol, interval)
+    result['closeLatencyMs'] = round(close_latency_ms(interval, row), 1)
+    print(json.dumps(result), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingestão de velas em tempo real via WebSocket')
+    parser.add_argument('pairs', nargs='+', help='Pares SYMBOL:INTERVAL (ex: ETHUSDT:1h)')
+    parser.add_argument('--predict', action='store_true', help='Fazer predição a cada vela fechada')
+    parser.add_argument('--url', help='Endereço do WebSocket (ex: ws://127.0.0.1:8765 do fake_kline_server.py)')
+    parser.add_argument('--testnet', action='store_true', help='Usar a testnet da Bybit')
+    parser.add_argument('--duration', type=float, help='Encerrar após N segundos')
+    args = parser.parse_args()
+
+    pairs = []
+    for item in args.pairs:
+        symbol, _, interval = item.partition(':')
+        if not symbol or interval not in BYBIT_INTERVALS:
+            parser.error(f"Par inválido: {item} (intervalos: {', '.join(BYBIT_INTERVALS)})")
+        pairs.append((symbol, interval))
+
+    streamer = KlineStreamer(
+        pairs,
+        on_close=print_prediction if args.predict else print_candle,
+        url=args.url,
+        testnet=args.testnet
+    )
+
+    print(f"Conectando: {', '.join(f'{s} {i}' for s, i in pairs)} ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})",
+          file=sys.stderr, flush=True)
+    streamer.run(duration=args.duration)
+
+    print(f"Encerrado: {streamer.stats}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
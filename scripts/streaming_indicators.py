@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Cálculo incremental de indicadores técnicos (O(1) por vela)
+
+Mantém o estado de EMA, SMA, RSI (Wilder), MACD, Bollinger Bands e volatilidade
+entre execuções, de modo que cada vela nova é processada sem recalcular o
+histórico. Os valores reproduzem add_technical_indicators (biblioteca ta)
+dentro de tolerância numérica.
+
+Uso: python3 streaming_indicators.py verify <SYMBOL_INTERVAL>
+Exemplo: python3 streaming_indicators.py verify ETHUSDT_1h
+"""
+
+import os
+import sys
+import json
+import math
+from collections import deque
+import numpy as np
+import pandas as pd
+
+from candle_store import HISTORICAL_DIR, PROCESSED_DIR, series_exists, load_candles
+
+STATE_VERSION = 1
+
+# Tolerância relativa da comparação com o cálculo em lote. Os dois caminhos
+# calculam o desvio padrão sobre a janela (add_technical_indicators.rolling_std),
+# então só as médias exponenciais acumulam diferenças de arredondamento.
+VERIFY_RTOL = 1e-6
+
+# Colunas de saída, na mesma ordem de add_technical_indicators
+OHLCV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+INDICATOR_COLUMNS = [
+    'ema_9', 'ema_21', 'ema_50',
+    'sma_20', 'sma_50', 'sma_200',
+    'rsi', 'macd', 'macd_signal', 'macd_diff',
+    'bb_middle', 'bb_upper', 'bb_lower',
+    'volume_sma', 'price_change_pct', 'volatility'
+]
+OUTPUT_COLUMNS = OHLCV_COLUMNS + INDICATOR_COLUMNS
+
+
+class EWM:
+    """Média exponencial equivalente a pandas ewm(adjust=False, min_periods=n)"""
+
+    def __init__(self, alpha, min_periods):
+        self.alpha = alpha
+        self.min_periods = min_periods
+        self.value = None
+        self.count = 0
+
+    def update(self, x):
+        if x is None or math.isnan(x):
+            return self.current()
+
+        if self.value is None:
+            self.value = x
+        elif self.value != x:
+            # Mesma sequência de operações do pandas para minimizar diferenças
+            old_wt = 1.0 - self.alpha
+            self.value = (old_wt * self.value + self.alpha * x) / (old_wt + self.alpha)
+
+        self.count += 1
+        return self.current()
+
+    def current(self):
+        return self.value if self.count >= self.min_periods else math.nan
+
+    def to_dict(self):
+        return {'alpha': self.alpha, 'min_periods': self.min_periods, 'value': self.value, 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, data):
+        ewm = cls(data['alpha'], data['min_periods'])
+        ewm.value = data['value']
+        ewm.count = data['count']
+        return ewm
+
+
+def ema(periods):
+    """EMA com span=periods (como ta.trend.EMAIndicator)"""
+    return EWM(2.0 / (periods + 1), periods)
+
+
+class RollingWindow:
+    """Janela deslizante em buffer circular com soma acumulada"""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self.nan_count = 0
+        self.updates = 0
+
+    def update(self, x):
+        if len(self.values) == self.window:
+            self._remove(self.values[0])
+        self.values.append(x)
+        if math.isnan(x):
+            self.nan_count += 1
+        else:
+            self.total += x
+
+        # Recalcular a soma periodicamente para evitar acúmulo de erro
+        self.updates += 1
+        if self.updates % self.window == 0:
+            self._resync()
+
+    def _remove(self, x):
+        if math.isnan(x):
+            self.nan_count -= 1
+        else:
+            self.total -= x
+
+    def _resync(self):
+        self.total = math.fsum(v for v in self.values if not math.isnan(v))
+        self.nan_count = sum(1 for v in self.values if math.isnan(v))
+
+    @property
+    def ready(self):
+        return len(self.values) == self.window and self.nan_count == 0
+
+    def mean(self):
+        if not self.ready:
+            return math.nan
+        return self.total / self.window
+
+    def std(self):
+        """Desvio padrão amostral (ddof=1), como pandas rolling().std()"""
+        if not self.ready:
+            return math.nan
+        values = np.fromiter(self.values, dtype=np.float64, count=self.window)
+        return float(values.std(ddof=1))
+
+    def to_dict(self):
+        return {'window': self.window, 'values': list(self.values), 'updates': self.updates}
+
+    @classmethod
+    def from_dict(cls, data):
+        rolling = cls(data['window'])
+        rolling.values.extend(data['values'])
+        rolling.updates = data['updates']
+        rolling._resync()
+        return rolling
+
+
+class StreamingIndicators:
+    """
+    Estado incremental dos indicadores de uma série
+
+    Cada chamada a update() consome uma vela e retorna a linha processada
+    (mesmas colunas do arquivo em data/processed) ou None enquanto os
+    indicadores ainda estão em aquecimento (ex: primeiras 200 velas da SMA 200).
+    """
+
+    def __init__(self):
+        self.ema_9 = ema(9)
+        self.ema_21 = ema(21)
+        self.ema_50 = ema(50)
+        self.ema_12 = ema(12)
+        self.ema_26 = ema(26)
+        self.macd_signal = ema(9)
+
+        self.sma_20 = RollingWindow(20)
+        self.sma_50 = RollingWindow(50)
+        self.sma_200 = RollingWindow(200)
+        self.volume_20 = RollingWindow(20)
+        self.change_20 = RollingWindow(20)
+
+        # RSI de Wilder (alpha = 1/14)
+        self.rsi_up = EWM(1.0 / 14, 14)
+        self.rsi_down = EWM(1.0 / 14, 14)
+
+        self.prev_close = None
+        self.last_timestamp = None
+        self.candles = 0
+
+    def update(self, candle):
+        """
+        Processa uma vela fechada
+
+        Args:
+            candle: dict (ou Series) com timestamp, open, high, low, close, volume
+
+        Returns:
+            dict com a linha processada ou None se os indicadores não estão prontos
+        """
+        close = float(candle['close'])
+        volume = float(candle['volume'])
+
+        ema_9 = self.ema_9.update(close)
+        ema_21 = self.ema_21.update(close)
+        ema_50 = self.ema_50.update(close)
+
+        self.sma_20.update(close)
+        self.sma_50.update(close)
+        self.sma_200.update(close)
+        self.volume_20.update(volume)
+
+        # RSI: primeira diferença é NaN e conta como 0 (como em ta)
+        diff = close - self.prev_close if self.prev_close is not None else math.nan
+        self.rsi_up.update(diff if diff > 0 else 0.0)
+        self.rsi_down.update(-diff if diff < 0 else 0.0)
+
+        macd = self.ema_12.update(close) - self.ema_26.update(close)
+        macd_signal = self.macd_signal.update(macd)
+
+        if self.prev_close is not None:
+            price_change_pct = (close / self.prev_close - 1) * 100
+        else:
+            price_change_pct = math.nan
+        self.change_20.update(price_change_pct)
+
+        self.prev_close = close
+        self.last_timestamp = pd.Timestamp(candle['timestamp'])
+        self.candles += 1
+
+        sma_20 = self.sma_20.mean()
+        rolling_std = self.sma_20.std()
+
+        row = {
+            'timestamp': self.last_timestamp,
+            'open': float(candle['open']),
+            'high': float(candle['high']),
+            'low': float(candle['low']),
+            'close': close,
+            'volume': volume,
+            'ema_9': ema_9,
+            'ema_21': ema_21,
+            'ema_50': ema_50,
+            'sma_20': sma_20,
+            'sma_50': self.sma_50.mean(),
+            'sma_200': self.sma_200.mean(),
+            'rsi': self._rsi(),
+            'macd': macd,
+            'macd_signal': macd_signal,
+            'macd_diff': macd - macd_signal,
+            'bb_middle': sma_20,
+            'bb_upper': sma_20 + rolling_std * 2,
+            'bb_lower': sma_20 - rolling_std * 2,
+            'volume_sma': self.volume_20.mean(),
+            'price_change_pct': price_change_pct,
+            'volatility': self.change_20.std(),
+        }
+
+        if any(isinstance(v, float) and math.isnan(v) for v in row.values()):
+            return None
+
+        return row
+
+    def _rsi(self):
+        up = self.rsi_up.current()
+        down = self.rsi_down.current()
+        if math.isnan(up) or math.isnan(down):
+            return math.nan
+        if down == 0:
+            return 100.0
+        return 100 - (100 / (1 + up / down))
+
+    def update_many(self, df):
+        """
+        Processa várias velas em ordem, ignorando as já consumidas
+
+        Returns:
+            DataFrame apenas com as linhas prontas (colunas de OUTPUT_COLUMNS)
+        """
+        df = df.sort_values('timestamp')
+        if self.last_timestamp is not None:
+            df = df[pd.to_datetime(df['timestamp']) > self.last_timestamp]
+
+        rows = []
+        for candle in df[OHLCV_COLUMNS].to_dict('records'):
+            row = self.update(candle)
+            if row is not None:
+                rows.append(row)
+
+        return pd.DataFrame(rows, columns=OUTPUT_COLUMNS)
+
+    @classmethod
+    def from_history(cls, df):
+        """Reconstrói o estado reprocessando um histórico OHLCV"""
+        state = cls()
+        state.update_many(df)
+        return state
+
+    def to_dict(self):
+        return {
+            'version': STATE_VERSION,
+            'last_timestamp': self.last_timestamp.isoformat() if self.last_timestamp is not None else None,
+            'prev_close': self.prev_close,
+            'candles': self.candles,
+            'ewm': {name: getattr(self, name).to_dict() for name in
+                    ('ema_9', 'ema_21', 'ema_50', 'ema_12', 'ema_26', 'macd_signal', 'rsi_up', 'rsi_down')},
+            'rolling': {name: getattr(self, name).to_dict() for name in
+                        ('sma_20', 'sma_50', 'sma_200', 'volume_20', 'change_20')},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != STATE_VERSION:
+            raise ValueError(f"Unsupported indicator state version: {data.get('version')}")
+
+        state = cls()
+        state.last_timestamp = pd.Timestamp(data['last_timestamp']) if data['last_timestamp'] else None
+        state.prev_close = data['prev_close']
+        state.candles = data['candles']
+        for name, value in data['ewm'].items():
+            setattr(state, name, EWM.from_dict(value))
+        for name, value in data['rolling'].items():
+            setattr(state, name, RollingWindow.from_dict(value))
+        return state
+
+    def save(self, path):
+        """Grava o estado em JSON (troca atômica)"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+
+def state_path(name, directory=PROCESSED_DIR):
+    """Arquivo de estado dos indicadores de uma série"""
+    return os.path.join(directory, f"{name}.indicators.json")
+
+
+def load_or_bootstrap(name):
+    """
+    Carrega o estado salvo da série ou o reconstrói a partir do histórico
+
+    Usa o histórico bruto (data/historical) quando ele está em dia com a
+    série processada; caso contrário, as colunas OHLCV da série processada.
+    """
+    path = state_path(name)
+    if os.path.exists(path):
+        return StreamingIndicators.load(path)
+
+    source = None
+    for directory in (HISTORICAL_DIR, PROCESSED_DIR):
+        if not series_exists(directory, name):
+            continue
+        last = load_candles(directory, name, columns=['timestamp'], tail=1)['timestamp'].max()
+        if source is None or last > source[1]:
+            source = (directory, last)
+
+    if source is None:
+        return StreamingIndicators()
+
+    return StreamingIndicators.from_history(load_candles(source[0], name, columns=OHLCV_COLUMNS))
+
+
+def verify(name):
+    """Compara o cálculo incremental com o cálculo em lote (ta)"""
+    from add_technical_indicators import add_technical_indicators
+
+    df = load_candles(HISTORICAL_DIR, name, columns=OHLCV_COLUMNS)
+
+    batch = add_technical_indicators(df)
+    streaming = StreamingIndicators()
+    streaming_rows = streaming.update_many(df)
+
+    print(f"Velas: {len(df)} | Linhas (lote): {len(batch)} | Linhas (incremental): {len(streaming_rows)}")
+
+    if len(batch) != len(streaming_rows):
+        print("✗ Número de linhas diferente")
+        return False
+
+    ok = True
+    for column in INDICATOR_COLUMNS:
+        expected = batch[column].to_numpy()
+        actual = streaming_rows[column].to_numpy()
+        max_abs = np.max(np.abs(expected - actual))
+        max_rel = np.max(np.abs(expected - actual) / np.maximum(np.abs(expected), 1e-12))
+        close = np.allclose(actual, expected, rtol=VERIFY_RTOL, atol=1e-8)
+        ok = ok and close
+        print(f"  {'✓' if close else '✗'} {column:<18} erro máximo: {max_abs:.3e} (relativo: {max_rel:.3e})")
+
+    print(f"Estado final: {streaming.candles} velas, última {streaming.last_timestamp}")
+    return ok
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] != 'verify':
+        print("Usage: python3 streaming_indicators.py verify <SYMBOL_INTERVAL>")
+        sys.exit(1)
+
+    sys.exit(0 if verify(sys.argv[2]) else 1)
+
+
+if __name__ == "__main__":
+    main()
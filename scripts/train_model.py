@@ -2,16 +2,41 @@
 """
 Script para treinar modelo de IA para trading de criptomoedas
 Usa Random Forest e Gradient Boosting para classificação
+
+Uso: python3 train_model.py [SYMBOL:INTERVAL ...] [--fast] [--sequential] [--cpus N]
+     python3 train_model.py --incremental [--retire] [--new-trees N] [--window N]
+     python3 train_model.py --validate-incremental [--rounds N] [--tolerance 0.02]
+     python3 train_model.py --benchmark-memory [SYMBOL:INTERVAL ...]
+
+--incremental estende o modelo salvo com árvores ajustadas nas velas chegadas
+desde o último treino (warm start), em vez de treinar do zero; a cada
+FULL_REFIT_EVERY rodadas é feito um treino completo. --validate-incremental
+compara os dois modos em ordem cronológica (acurácia no mesmo bloco de teste
+e CPU por rodada).
+
+As matrizes de treino são float32 e abertas com memory-mapping; os
+candidatos (todos árvores) treinam direto sobre elas, sem normalização.
+--benchmark-memory mede o pico de memória contra o formato anterior
+(float64 em RAM + cópias do StandardScaler).
 """
 
 import os
+import io
+import time
+import argparse
+import warnings
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
-import joblib
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, HistGradientBoostingClassifier
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
+from threadpoolctl import threadpool_limits
 from datetime import datetime
 
+import model_bundle
+from profiling import span, reset_peak_rss, current_rss_mb, peak_rss_mb
+
 # Diretórios
 TRAINING_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'training')
 MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models')
@@ -19,13 +44,19 @@ MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models')
 os.makedirs(MODELS_DIR, exist_ok=True)
 
 def load_training_data(symbol, interval):
-    """Carrega dados de treinamento para um símbolo e intervalo"""
+    """
+    Carrega dados de treinamento para um símbolo e intervalo
+    
+    As matrizes são abertas com memory-mapping (somente leitura): as páginas
+    são lidas do disco sob demanda e podem ser descartadas pelo kernel, em
+    vez de uma cópia inteira em RAM por processo.
+    """
     base_name = f"{symbol}_{interval}"
     
-    X_train = np.load(os.path.join(TRAINING_DIR, f'{base_name}_X_train.npy'))
-    X_test = np.load(os.path.join(TRAINING_DIR, f'{base_name}_X_test.npy'))
-    y_train = np.load(os.path.join(TRAINING_DIR, f'{base_name}_y_train.npy'))
-    y_test = np.load(os.path.join(TRAINING_DIR, f'{base_name}_y_test.npy'))
+    X_train = np.load(os.path.join(TRAINING_DIR, f'{base_name}_X_train.npy'), mmap_mode='r')
+    X_test = np.load(os.path.join(TRAINING_DIR, f'{base_name}_X_test.npy'), mmap_mode='r')
+    y_train = np.load(os.path.join(TRAINING_DIR, f'{base_name}_y_train.npy'), mmap_mode='r')
+    y_test = np.load(os.path.join(TRAINING_DIR, f'{base_name}_y_test.npy'), mmap_mode='r')
     
     # Carregar nomes das features
     with open(os.path.join(TRAINING_DIR, f'{base_name}_features.txt'), 'r') as f:
@@ -33,7 +64,7 @@ def load_training_data(symbol, interval):
     
     return X_train, X_test, y_train, y_test, feature_names
 
-def train_random_forest(X_train, y_train, X_test, y_test):
+def train_random_forest(X_train, y_train, X_test=None, y_test=None, n_jobs=-1):
     """Treina modelo Random Forest"""
     print("\n  Treinando Random Forest...")
     
@@ -43,12 +74,16 @@ def train_random_forest(X_train, y_train, X_test, y_test):
         min_samples_split=10,
         min_samples_leaf=5,
         random_state=42,
-        n_jobs=-1,
+        n_jobs=n_jobs,
         class_weight='balanced'  # Lidar com desbalanceamento de classes
     )
     
     model.fit(X_train, y_train)
     
+    # Sem conjunto de teste (ex: modelo final do walk-forward) não há avaliação
+    if X_test is None:
+        return model, None
+    
     # Avaliar
     y_pred = model.predict(X_test)
     accuracy = accuracy_score(y_test, y_pred)
@@ -57,8 +92,8 @@ def train_random_forest(X_train, y_train, X_test, y_test):
     
     return model, accuracy
 
-def train_gradient_boosting(X_train, y_train, X_test, y_test):
-    """Treina modelo Gradient Boosting"""
+def train_gradient_boosting(X_train, y_train, X_test=None, y_test=None, n_jobs=1):
+    """Treina modelo Gradient Boosting (single-threaded; n_jobs é ignorado)"""
     print("\n  Treinando Gradient Boosting...")
     
     model = GradientBoostingClassifier(
@@ -70,6 +105,10 @@ def train_gradient_boosting(X_train, y_train, X_test, y_test):
     
     model.fit(X_train, y_train)
     
+    # Sem conjunto de teste (ex: modelo final do walk-forward) não há avaliação
+    if X_test is None:
+        return model, None
+    
     # Avaliar
     y_pred = model.predict(X_test)
     accuracy = accuracy_score(y_test, y_pred)
@@ -78,6 +117,41 @@ def train_gradient_boosting(X_train, y_train, X_test, y_test):
     
     return model, accuracy
 
+def train_hist_gradient_boosting(X_train, y_train, X_test=None, y_test=None, n_jobs=-1):
+    """
+    Treina Gradient Boosting baseado em histogramas (modo rápido)
+    
+    Usa features discretizadas em bins, early stopping em uma fração de
+    validação e entradas float32.
+    """
+    print("\n  Treinando Hist Gradient Boosting...")
+    
+    X_train = np.asarray(X_train, dtype=np.float32)
+    
+    model = HistGradientBoostingClassifier(
+        max_iter=300,
+        learning_rate=0.1,
+        max_leaf_nodes=31,
+        early_stopping=True,
+        validation_fraction=0.1,
+        n_iter_no_change=10,
+        random_state=42
+    )
+    
+    # Threads OpenMP limitadas ao orçamento do job
+    with threadpool_limits(limits=n_jobs if n_jobs and n_jobs > 0 else None):
+        model.fit(X_train, y_train)
+        if X_test is None:
+            return model, None
+        y_pred = model.predict(np.asarray(X_test, dtype=np.float32))
+    
+    # Avaliar
+    accuracy = accuracy_score(y_test, y_pred)
+    
+    print(f"    Acurácia: {accuracy*100:.2f}% ({model.n_iter_} iterações)")
+    
+    return model, accuracy
+
 def evaluate_model(model, X_test, y_test, model_name):
     """Avalia modelo em detalhes"""
     print(f"\n  Avaliação detalhada - {model_name}:")
@@ -124,77 +198,155 @@ def evaluate_model(model, X_test, y_test, model_name):
     
     return accuracy
 
-def train_for_symbol_interval(symbol, interval):
-    """Treina modelos para um símbolo e intervalo específicos"""
-    print(f"\n{'='*60}")
-    print(f"Treinando modelos para {symbol} - {interval}")
-    print(f"{'='*60}")
-    
-    # Carregar dados
+# Modelos candidatos: chave -> (nome, função de treino, usa múltiplos núcleos)
+CANDIDATES = {
+    'rf': ('Random Forest', train_random_forest, True),
+    'gb': ('Gradient Boosting', train_gradient_boosting, False),
+    'hgb': ('Hist Gradient Boosting', train_hist_gradient_boosting, True),
+}
+
+# Candidatos baseados em árvores: invariantes à escala das features, treinam
+# direto sobre as matrizes float32 memory-mapped, sem normalização
+TREE_MODELS = {'rf', 'gb', 'hgb'}
+
+# Linhas por bloco na normalização (candidatos que não são árvores)
+SCALE_CHUNK_ROWS = 100_000
+
+# Modo rápido: troca o Gradient Boosting exato pelo baseado em histogramas
+FAST_CANDIDATES = ['rf', 'hgb']
+
+def candidate_keys(fast=False):
+    """Candidatos treinados por par"""
+    return FAST_CANDIDATES if fast else list(CANDIDATES)
+
+def fit_candidate(key, data, n_jobs=-1):
+    """
+    Treina um candidato e mede o tempo de ajuste
+    
+    Returns:
+        (nome, modelo, acurácia, segundos de ajuste)
+    """
+    name, train_fn, _ = CANDIDATES[key]
+    start = time.perf_counter()
+    with span('fit', rows=len(data['X_train']), model=key, n_jobs=n_jobs):
+        model, accuracy = train_fn(data['X_train'], data['y_train'], data['X_test'], data['y_test'],
+                                   n_jobs=n_jobs)
+    return name, model, accuracy, time.perf_counter() - start
+
+def needs_scaling(keys=None):
+    """Se algum candidato depende da escala das features (padrão: todos os candidatos)"""
+    return any(key not in TREE_MODELS for key in (keys or CANDIDATES))
+
+def identity_scaler(n_features):
+    """StandardScaler que não altera os dados (média 0, escala 1), salvo com modelos treinados sem normalização"""
+    return StandardScaler().fit(np.zeros((1, n_features)))
+
+def scale_in_chunks(X, scaler=None, chunk_rows=SCALE_CHUNK_ROWS):
+    """
+    Normaliza X bloco a bloco, sem cópias float64 da matriz inteira
+    
+    Args:
+        scaler: Scaler já ajustado; se None, é ajustado com partial_fit por bloco
+    
+    Returns:
+        (X normalizado em float32, scaler)
+    """
+    if scaler is None:
+        scaler = StandardScaler()
+        for start in range(0, len(X), chunk_rows):
+            scaler.partial_fit(X[start:start + chunk_rows])
+    
+    X_scaled = np.empty(X.shape, dtype=np.float32)
+    for start in range(0, len(X), chunk_rows):
+        X_scaled[start:start + chunk_rows] = scaler.transform(X[start:start + chunk_rows])
+    
+    return X_scaled, scaler
+
+def load_scaled_data(symbol, interval):
+    """
+    Carrega dados de treino/teste e ajusta o scaler (determinístico)
+    
+    Se todos os candidatos são árvores, as matrizes memory-mapped são usadas
+    diretamente e o scaler salvo é a identidade; caso contrário a
+    normalização é feita em blocos (scale_in_chunks).
+    """
     X_train, X_test, y_train, y_test, feature_names = load_training_data(symbol, interval)
     
-    print(f"  Amostras de treino: {len(X_train)}")
-    print(f"  Amostras de teste: {len(X_test)}")
-    print(f"  Features: {len(feature_names)}")
-    
-    # Normalizar dados
-    print("\n  Normalizando dados...")
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-    
-    # Treinar Random Forest
-    rf_model, rf_accuracy = train_random_forest(X_train_scaled, y_train, X_test_scaled, y_test)
-    
-    # Treinar Gradient Boosting
-    gb_model, gb_accuracy = train_gradient_boosting(X_train_scaled, y_train, X_test_scaled, y_test)
-    
-    # Escolher melhor modelo
-    if rf_accuracy >= gb_accuracy:
-        best_model = rf_model
-        best_model_name = "Random Forest"
-        best_accuracy = rf_accuracy
+    if needs_scaling():
+        X_train, scaler = scale_in_chunks(X_train)
+        X_test, _ = scale_in_chunks(X_test, scaler)
     else:
-        best_model = gb_model
-        best_model_name = "Gradient Boosting"
-        best_accuracy = gb_accuracy
+        scaler = identity_scaler(X_train.shape[1])
+    
+    return {
+        'X_train': X_train,
+        'X_test': X_test,
+        'y_train': y_train,
+        'y_test': y_test,
+        'scaler': scaler,
+        'feature_names': feature_names,
+        'scaling': 'chunked' if needs_scaling() else 'none',
+        'train_period': training_period(symbol, interval),
+    }
+
+def training_period(symbol, interval):
+    """Primeira e última vela da série processada usada no treino (None se não existir)"""
+    from candle_store import PROCESSED_DIR, series_exists, load_candles
+    
+    name = f"{symbol}_{interval}"
+    if not series_exists(PROCESSED_DIR, name):
+        return None
+    
+    timestamps = load_candles(PROCESSED_DIR, name, columns=['timestamp'])['timestamp']
+    if not len(timestamps):
+        return None
+    return [str(timestamps.iloc[0]), str(timestamps.iloc[-1])]
+
+def save_best_model(symbol, interval, data, candidates):
+    """
+    Escolhe o melhor candidato, avalia em detalhes e salva modelo/scaler/metadados
+    
+    Args:
+        data: Saída de load_scaled_data
+        candidates: Lista de (nome, modelo, acurácia, segundos de ajuste)
+                    na ordem de CANDIDATES
+    """
+    # Escolher melhor modelo (empate favorece o primeiro candidato)
+    best_model_name, best_model, best_accuracy, best_fit_seconds = candidates[0]
+    for name, model, accuracy, fit_seconds in candidates[1:]:
+        if accuracy > best_accuracy:
+            best_model_name, best_model, best_accuracy, best_fit_seconds = name, model, accuracy, fit_seconds
     
     print(f"\n  Melhor modelo: {best_model_name} ({best_accuracy*100:.2f}%)")
     
     # Avaliação detalhada do melhor modelo
-    evaluate_model(best_model, X_test_scaled, y_test, best_model_name)
+    evaluate_model(best_model, data['X_test'], data['y_test'], best_model_name)
     
-    # Salvar modelo e scaler
-    model_filename = f"{symbol}_{interval}_model.pkl"
-    scaler_filename = f"{symbol}_{interval}_scaler.pkl"
-    features_filename = f"{symbol}_{interval}_features.txt"
-    
-    joblib.dump(best_model, os.path.join(MODELS_DIR, model_filename))
-    joblib.dump(scaler, os.path.join(MODELS_DIR, scaler_filename))
-    
-    with open(os.path.join(MODELS_DIR, features_filename), 'w') as f:
-        f.write('\n'.join(feature_names))
-    
-    # Salvar metadados do modelo
+    # Metadados do modelo
     metadata = {
         'symbol': symbol,
         'interval': interval,
         'model_type': best_model_name,
         'accuracy': best_accuracy,
-        'train_samples': len(X_train),
-        'test_samples': len(X_test),
-        'features': feature_names,
+        'fit_seconds': best_fit_seconds,
+        'candidates': [
+            {'model_type': name, 'accuracy': accuracy, 'fit_seconds': fit_seconds}
+            for name, _, accuracy, fit_seconds in candidates
+        ],
+        'train_samples': len(data['X_train']),
+        'test_samples': len(data['X_test']),
+        'train_period': data.get('train_period'),
+        'training_dtype': str(data['X_train'].dtype),
+        'scaling': data.get('scaling'),
+        'features': data['feature_names'],
         'trained_at': datetime.now().isoformat()
     }
     
-    import json
-    metadata_filename = f"{symbol}_{interval}_metadata.json"
-    with open(os.path.join(MODELS_DIR, metadata_filename), 'w') as f:
-        json.dump(metadata, f, indent=2)
+    # Salvar modelo, scaler, features e metadados em um único bundle
+    bundle_path = model_bundle.bundle_path(symbol, interval, MODELS_DIR)
+    digest = model_bundle.save_bundle(bundle_path, best_model, data['scaler'], data['feature_names'], metadata)
     
-    print(f"\n✓ Modelo salvo: {model_filename}")
-    print(f"✓ Scaler salvo: {scaler_filename}")
-    print(f"✓ Metadados salvos: {metadata_filename}")
+    print(f"\n✓ Modelo salvo: {os.path.basename(bundle_path)} ({digest[:12]})")
     
     return {
         'symbol': symbol,
@@ -203,8 +355,560 @@ def train_for_symbol_interval(symbol, interval):
         'accuracy': best_accuracy
     }
 
+def train_for_symbol_interval(symbol, interval, fast=False, n_jobs=-1):
+    """
+    Treina modelos para um símbolo e intervalo específicos
+    
+    Args:
+        fast: Usa Hist Gradient Boosting no lugar do Gradient Boosting exato
+        n_jobs: Núcleos dos candidatos paralelos (ex: fatia do retrain.py)
+    """
+    print(f"\n{'='*60}")
+    print(f"Treinando modelos para {symbol} - {interval}")
+    print(f"{'='*60}")
+    
+    reset_peak_rss()
+    
+    # Carregar dados (memory-mapped) e normalizar se necessário
+    data = load_scaled_data(symbol, interval)
+    
+    print(f"  Amostras de treino: {len(data['X_train'])}")
+    print(f"  Amostras de teste: {len(data['X_test'])}")
+    print(f"  Features: {len(data['feature_names'])}")
+    print(f"  Matrizes: {data['X_train'].dtype}, {(data['X_train'].nbytes + data['X_test'].nbytes) / 1024**2:.1f} MB, "
+          f"normalização: {data['scaling']}")
+    
+    candidates = [fit_candidate(key, data, n_jobs=n_jobs) for key in candidate_keys(fast)]
+    
+    result = save_best_model(symbol, interval, data, candidates)
+    result['peak_rss_mb'] = peak_rss_mb()
+    print(f"  Pico de memória: {result['peak_rss_mb']:.0f} MB")
+    return result
+
+def _fit_candidate(symbol, interval, key, n_jobs):
+    """
+    Job do scheduler: treina um candidato de um par (executa em processo filho)
+    
+    Returns:
+        (candidato, pico de RSS do job em MB)
+    """
+    reset_peak_rss()
+    data = load_scaled_data(symbol, interval)
+    
+    # Saída dos workers é suprimida para não intercalar no terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        candidate = fit_candidate(key, data, n_jobs=n_jobs)
+    return candidate, peak_rss_mb()
+
+def train_parallel(pairs, cpu_budget=None, fast=False):
+    """
+    Treina todos os pares com os candidatos de cada par como jobs concorrentes
+    
+    Cada job reserva núcleos do orçamento global: Gradient Boosting usa 1,
+    Random Forest recebe uma fatia do orçamento via n_jobs. Um job só é
+    iniciado quando há núcleos livres suficientes, então o total nunca
+    excede cpu_budget.
+    
+    Args:
+        pairs: Lista de (symbol, interval)
+        cpu_budget: Núcleos disponíveis (padrão: todos)
+        fast: Usa Hist Gradient Boosting no lugar do Gradient Boosting exato
+    
+    Returns:
+        (resultados por par, timings por job)
+    """
+    cpu_budget = max(1, cpu_budget or os.cpu_count() or 1)
+    multi_cores = max(1, min(cpu_budget - 1, cpu_budget // max(1, len(pairs))))
+    
+    # Jobs single-threaded (mais longos) primeiro
+    keys = candidate_keys(fast)
+    jobs = [
+        (symbol, interval, key, multi_cores if CANDIDATES[key][2] else 1)
+        for key in sorted(keys, key=lambda key: CANDIDATES[key][2])
+        for symbol, interval in pairs
+    ]
+    
+    print(f"\nOrçamento de CPU: {cpu_budget} núcleos, {len(jobs)} jobs "
+          f"(modelos paralelos com {multi_cores} núcleo(s) cada)")
+    
+    fitted = {pair: {} for pair in pairs}
+    timings = []
+    results = []
+    free_cores = cpu_budget
+    running = {}
+    
+    with ProcessPoolExecutor(max_workers=cpu_budget) as executor:
+        while jobs or running:
+            # Iniciar jobs enquanto houver núcleos livres
+            while jobs and (jobs[0][3] <= free_cores or not running):
+                job = jobs.pop(0)
+                free_cores -= job[3]
+                running[executor.submit(_fit_candidate, *job)] = job
+            
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                symbol, interval, key, cores = running.pop(future)
+                free_cores += cores
+                name = CANDIDATES[key][0]
+                
+                try:
+                    candidate, peak = future.result()
+                except Exception as e:
+                    print(f"\n✗ Erro ao treinar {symbol} {interval} ({name}): {e}")
+                    fitted[(symbol, interval)][key] = None
+                else:
+                    _, _, accuracy, seconds = candidate
+                    print(f"  ✓ {symbol} {interval} {name}: {seconds:.1f}s "
+                          f"({cores} núcleo(s), acurácia {accuracy*100:.2f}%, pico {peak:.0f} MB)")
+                    fitted[(symbol, interval)][key] = candidate
+                    timings.append({
+                        'symbol': symbol,
+                        'interval': interval,
+                        'model': name,
+                        'cores': cores,
+                        'seconds': seconds,
+                        'peak_rss_mb': peak,
+                    })
+                
+                # Par completo: escolher o melhor e salvar
+                pair_models = fitted[(symbol, interval)]
+                candidates = [pair_models[k] for k in keys if pair_models.get(k) is not None]
+                if len(pair_models) == len(keys) and candidates:
+                    try:
+                        results.append(save_best_model(
+                            symbol, interval, load_scaled_data(symbol, interval), candidates
+                        ))
+                    except Exception as e:
+                        print(f"\n✗ Erro ao salvar {symbol} {interval}: {e}")
+    
+    return results, timings
+
+# ---------------------------------------------------------------------------
+# Treino incremental (warm start)
+# ---------------------------------------------------------------------------
+
+# Árvores (RF) ou estágios de boosting (GB/HGB) acrescentados por rodada
+INCREMENTAL_TREES = 10
+# Random Forest: velas mais recentes usadas nas árvores novas (no mínimo as velas novas)
+INCREMENTAL_WINDOW = 1000
+# Boosting: estágios novos param de ser acrescentados se a validação não melhorar
+INCREMENTAL_PATIENCE = 3
+# Rodadas incrementais antes de forçar um treino completo
+FULL_REFIT_EVERY = 30
+# Velas mais recentes fora do ajuste incremental, usadas para reavaliar o modelo
+INCREMENTAL_TEST_ROWS = 200
+# Queda de acurácia aceita em relação ao modelo base e ao treino completo (validação)
+INCREMENTAL_TOLERANCE = 0.02
+
+WARM_START_MODELS = (RandomForestClassifier, GradientBoostingClassifier, HistGradientBoostingClassifier)
+
+def extend_model(model, X_new, y_new, new_trees=INCREMENTAL_TREES, retire=False, n_jobs=-1):
+    """
+    Acrescenta ao ensemble árvores ajustadas em dados recentes (warm_start)
+    
+    Random Forest: novas árvores independentes; com retire, as mais antigas
+    são descartadas e o tamanho do ensemble fica constante. Gradient Boosting
+    (exato ou histogramas): novos estágios ajustados aos resíduos do ensemble
+    atual nos dados recentes. Estágios de boosting dependem dos anteriores,
+    então retire não se aplica.
+    
+    Args:
+        model: Modelo já treinado (modificado in-place)
+        X_new, y_new: Janela recente, já normalizada com o scaler do modelo
+    
+    Raises:
+        ValueError: modelo sem warm start ou janela sem todas as classes
+    """
+    if not isinstance(model, WARM_START_MODELS):
+        raise ValueError(f"{type(model).__name__} does not support warm start")
+    
+    missing = set(model.classes_) - set(np.unique(y_new))
+    if missing:
+        raise ValueError(f"recent window lacks classes {sorted(int(c) for c in missing)}")
+    
+    if isinstance(model, RandomForestClassifier):
+        size = len(model.estimators_)
+        model.set_params(warm_start=True, n_estimators=size + new_trees, n_jobs=n_jobs)
+        with warnings.catch_warnings():
+            # class_weight='balanced' passa a ser calculado sobre a janela recente (intencional)
+            warnings.filterwarnings('ignore', message='class_weight presets')
+            model.fit(X_new, y_new)
+        if retire:
+            model.estimators_ = model.estimators_[new_trees:]
+            model.n_estimators = len(model.estimators_)
+    
+    elif isinstance(model, GradientBoostingClassifier):
+        model.set_params(warm_start=True, n_estimators=model.n_estimators_ + new_trees,
+                         n_iter_no_change=INCREMENTAL_PATIENCE, validation_fraction=0.1)
+        model.fit(X_new, y_new)
+    
+    else:
+        model.set_params(warm_start=True, max_iter=model.n_iter_ + new_trees, early_stopping=True,
+                         n_iter_no_change=INCREMENTAL_PATIENCE)
+        with threadpool_limits(limits=n_jobs if n_jobs and n_jobs > 0 else None):
+            model.fit(np.asarray(X_new, dtype=np.float32), y_new)
+    
+    return model
+
+def ensemble_size(model):
+    """Árvores (RF) ou estágios de boosting do modelo"""
+    if isinstance(model, RandomForestClassifier):
+        return len(model.estimators_)
+    if isinstance(model, GradientBoostingClassifier):
+        return int(model.n_estimators_)
+    return int(model.n_iter_)
+
+def window_start(model, end, new_samples, window=INCREMENTAL_WINDOW):
+    """
+    Início das linhas usadas numa rodada incremental terminando em `end`
+    
+    Random Forest: apenas a janela recente (árvores novas independentes).
+    Boosting: todo o histórico; estágios ajustados só na janela recente
+    puxam o ensemble para a distribuição de classes dela e, na validação,
+    ficaram bem abaixo do treino completo.
+    """
+    if isinstance(model, RandomForestClassifier):
+        return max(0, end - max(window, new_samples))
+    return 0
+
+def load_chronological_data(symbol, interval):
+    """
+    Matriz completa da série em ordem cronológica (a mesma do walk-forward)
+    
+    Returns:
+        (X, y, timestamps, nomes das features), arrays com memory-mapping
+    """
+    from prepare_training_data import build_feature_matrix
+    
+    matrix = build_feature_matrix(f"{symbol}_{interval}")
+    paths = matrix['paths']
+    return (
+        np.load(paths['X'], mmap_mode='r'),
+        np.load(paths['y'], mmap_mode='r'),
+        np.load(paths['timestamps'], mmap_mode='r'),
+        matrix['features'],
+    )
+
+def train_incremental(symbol, interval, new_trees=INCREMENTAL_TREES, retire=False, window=INCREMENTAL_WINDOW,
+                      fast=False, n_jobs=-1):
+    """
+    Atualiza o modelo salvo com as velas chegadas desde o último treino
+    
+    As árvores novas são ajustadas com o scaler do modelo, na janela das
+    `window` velas mais recentes (Random Forest) ou em todo o histórico
+    (boosting, ver window_start). Cai para
+    o treino completo quando não há modelo ou período de treino registrado,
+    o tipo de modelo não suporta warm start, as features mudaram, a janela não
+    tem todas as classes ou já foram feitas FULL_REFIT_EVERY rodadas.
+    
+    As INCREMENTAL_TEST_ROWS velas mais recentes (após a purga de
+    FUTURE_CANDLES) ficam fora do ajuste e reavaliam o modelo atualizado; a
+    acurácia dos metadados passa a ser essa. Elas entram na rodada seguinte.
+    """
+    from prepare_training_data import FUTURE_CANDLES
+    
+    print(f"\n{'='*60}")
+    print(f"Treino incremental para {symbol} - {interval}")
+    print(f"{'='*60}")
+    
+    def full_refit(reason):
+        print(f"  Treino completo: {reason}")
+        return train_for_symbol_interval(symbol, interval, fast=fast, n_jobs=n_jobs)
+    
+    path = model_bundle.bundle_path(symbol, interval, MODELS_DIR)
+    if not os.path.exists(path):
+        return full_refit('modelo não encontrado')
+    
+    # Sem memory-mapping: o modelo é modificado
+    bundle = model_bundle.load_bundle(path, mmap=False)
+    model, scaler, metadata = bundle['model'], bundle['scaler'], bundle['metadata']
+    incremental = metadata.get('incremental') or {}
+    data_until = metadata.get('data_until') or (metadata.get('train_period') or [None, None])[1]
+    
+    if data_until is None:
+        return full_refit('período de treino não registrado no modelo')
+    if not isinstance(model, WARM_START_MODELS):
+        return full_refit(f"{type(model).__name__} não suporta warm start")
+    if incremental.get('rounds', 0) >= FULL_REFIT_EVERY:
+        return full_refit(f"{FULL_REFIT_EVERY} rodadas incrementais desde o último treino completo")
+    
+    X, y, timestamps, feature_names = load_chronological_data(symbol, interval)
+    if feature_names != list(bundle['feature_names']):
+        return full_refit('lista de features mudou')
+    
+    # Bloco de teste no fim da série; os rótulos das velas anteriores a ele
+    # olham FUTURE_CANDLES à frente, então essas também ficam fora do ajuste
+    test_start = len(X) - INCREMENTAL_TEST_ROWS
+    fit_end = max(0, test_start - FUTURE_CANDLES)
+    new_samples = int((timestamps[:fit_end] > np.datetime64(data_until)).sum())
+    result = {
+        'symbol': symbol,
+        'interval': interval,
+        'model_type': metadata.get('model_type', type(model).__name__),
+        'accuracy': metadata.get('accuracy'),
+        'new_samples': new_samples,
+    }
+    if not new_samples:
+        print(f"  ✓ Sem velas novas desde {data_until}")
+        return result
+    
+    start = window_start(model, fit_end, new_samples, window)
+    X_recent = scaler.transform(X[start:fit_end])
+    y_recent = np.asarray(y[start:fit_end])
+    
+    print(f"  Velas novas: {new_samples} | Janela: {len(X_recent)} | Ensemble atual: {ensemble_size(model)}")
+    
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    try:
+        with span('fit', rows=len(X_recent), model=type(model).__name__, mode='incremental', n_jobs=n_jobs):
+            extend_model(model, X_recent, y_recent, new_trees=new_trees, retire=retire, n_jobs=n_jobs)
+    except ValueError as e:
+        return full_refit(str(e))
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    
+    previous_accuracy = metadata.get('accuracy')
+    accuracy = float(accuracy_score(y[test_start:], model.predict(scaler.transform(X[test_start:]))))
+    
+    metadata['accuracy'] = accuracy
+    metadata['data_until'] = str(timestamps[fit_end - 1])
+    metadata['incremental'] = {
+        'rounds': incremental.get('rounds', 0) + 1,
+        'new_samples': new_samples,
+        'window_samples': len(X_recent),
+        'trees_added': new_trees,
+        'retire': retire,
+        'ensemble_size': ensemble_size(model),
+        'test_samples': INCREMENTAL_TEST_ROWS,
+        'previous_accuracy': previous_accuracy,
+        'fit_seconds': wall,
+        'cpu_seconds': cpu,
+        'updated_at': datetime.now().isoformat(),
+    }
+    
+    digest = model_bundle.save_bundle(path, model, scaler, bundle['feature_names'], metadata)
+    print(f"  ✓ +{new_trees} {'(mais antigas descartadas) ' if retire and isinstance(model, RandomForestClassifier) else ''}"
+          f"→ {ensemble_size(model)} em {wall:.2f}s (CPU {cpu:.2f}s), rodada {metadata['incremental']['rounds']}")
+    print(f"  Acurácia nas {INCREMENTAL_TEST_ROWS} velas mais recentes: {accuracy*100:.2f}%"
+          f"{f' (antes: {previous_accuracy*100:.2f}%)' if previous_accuracy is not None else ''}")
+    print(f"✓ Modelo salvo: {os.path.basename(path)} ({digest[:12]})")
+    
+    result['accuracy'] = accuracy
+    result['incremental'] = metadata['incremental']
+    return result
+
+def validate_incremental(symbol, interval, keys=None, rounds=7, new_rows=None, test_rows=None,
+                         new_trees=INCREMENTAL_TREES, retire=False, window=INCREMENTAL_WINDOW,
+                         tolerance=INCREMENTAL_TOLERANCE, n_jobs=-1):
+    """
+    Compara o treino incremental com o treino completo em ordem cronológica
+    
+    Um modelo base é treinado até `rounds` blocos de `new_rows` velas antes
+    do fim (padrão: um dia de velas por bloco). Em seguida:
+    
+    - incremental: o modelo base recebe uma rodada de warm start por bloco;
+    - completo: um modelo novo é treinado com todas as velas até o último bloco.
+    
+    Os três são avaliados no mesmo bloco de teste final (após a purga), e o
+    incremental passa se a acurácia não ficar mais de `tolerance` abaixo da
+    do completo nem da do modelo base. O custo é comparado em CPU por rodada.
+    
+    Returns:
+        Lista de resultados por candidato
+    """
+    from prepare_training_data import FUTURE_CANDLES
+    from resample import interval_ns
+    
+    keys = keys or candidate_keys()
+    X, y, _, _ = load_chronological_data(symbol, interval)
+    
+    new_rows = new_rows or max(1, 86400 * 10**9 // interval_ns(interval))
+    test_rows = test_rows or max(200, new_rows * rounds)
+    train_end = len(X) - test_rows - FUTURE_CANDLES
+    base_end = train_end - rounds * new_rows
+    if base_end < test_rows:
+        raise ValueError(f"not enough samples for {rounds} rounds of {new_rows} (have {len(X)})")
+    
+    print(f"\n{'='*60}")
+    print(f"Validação incremental: {symbol} - {interval}")
+    print(f"{'='*60}")
+    print(f"  Base: {base_end} amostras | {rounds} rodada(s) de {new_rows} | Teste: {test_rows} "
+          f"| +{new_trees} por rodada{' (descartando as mais antigas)' if retire else ''}")
+    
+    y_test = np.asarray(y[-test_rows:])
+    base_scaler = StandardScaler().fit(X[:base_end])
+    X_base = base_scaler.transform(X[:base_end])
+    
+    results = []
+    for key in keys:
+        name, train_fn, _ = CANDIDATES[key]
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            model, _ = train_fn(X_base, np.asarray(y[:base_end]), n_jobs=n_jobs)
+        base_accuracy = accuracy_score(y_test, model.predict(base_scaler.transform(X[-test_rows:])))
+        
+        # Incremental: uma rodada por bloco, com o scaler do modelo base
+        incremental_cpu = 0.0
+        for round_index in range(rounds):
+            end = base_end + (round_index + 1) * new_rows
+            start = window_start(model, end, new_rows, window)
+            X_recent = base_scaler.transform(X[start:end])
+            
+            cpu = time.process_time()
+            extend_model(model, X_recent, np.asarray(y[start:end]), new_trees=new_trees, retire=retire, n_jobs=n_jobs)
+            incremental_cpu += time.process_time() - cpu
+        incremental_accuracy = accuracy_score(y_test, model.predict(base_scaler.transform(X[-test_rows:])))
+        
+        # Completo: scaler e modelo refeitos com todo o histórico
+        cpu = time.process_time()
+        full_scaler = StandardScaler().fit(X[:train_end])
+        with contextlib.redirect_stdout(io.StringIO()):
+            full_model, _ = train_fn(full_scaler.transform(X[:train_end]), np.asarray(y[:train_end]), n_jobs=n_jobs)
+        full_cpu = time.process_time() - cpu
+        full_accuracy = accuracy_score(y_test, full_model.predict(full_scaler.transform(X[-test_rows:])))
+        
+        round_cpu = incremental_cpu / rounds
+        results.append({
+            'model': key,
+            'model_type': name,
+            'base_accuracy': base_accuracy,
+            'incremental_accuracy': incremental_accuracy,
+            'full_accuracy': full_accuracy,
+            'incremental_cpu_per_round': round_cpu,
+            'full_cpu': full_cpu,
+            'speedup': full_cpu / round_cpu if round_cpu else float('inf'),
+            'ensemble_size': ensemble_size(model),
+            'passed': (full_accuracy - incremental_accuracy <= tolerance
+                       and base_accuracy - incremental_accuracy <= tolerance),
+        })
+    
+    print(f"\n  {'Modelo':<24} {'Base':>8} {'Increm.':>8} {'Completo':>9} {'CPU/rodada':>11} {'CPU compl.':>11} {'Speedup':>8}")
+    print("  " + "-" * 84)
+    for r in results:
+        print(f"  {r['model_type']:<24} {r['base_accuracy']*100:7.2f}% {r['incremental_accuracy']*100:7.2f}% "
+              f"{r['full_accuracy']*100:8.2f}% {r['incremental_cpu_per_round']:10.2f}s {r['full_cpu']:10.2f}s "
+              f"{r['speedup']:7.1f}x {'✓' if r['passed'] else '✗'}")
+    print(f"\n  Tolerância: {tolerance*100:.1f} p.p. abaixo do modelo base e do treino completo")
+    
+    return results
+
+def _memory_run(symbol, interval, key, legacy_dir=None):
+    """
+    Job da medição de memória (processo novo): carrega, normaliza e treina um candidato
+    
+    Args:
+        legacy_dir: Diretório com as matrizes em float64; se informado, usa o
+            caminho anterior (np.load inteiro em RAM + StandardScaler.fit_transform)
+    """
+    baseline = current_rss_mb()
+    reset_peak_rss()
+    
+    if legacy_dir:
+        base_name = f"{symbol}_{interval}"
+        X_train = np.load(os.path.join(legacy_dir, f'{base_name}_X_train.npy'))
+        X_test = np.load(os.path.join(legacy_dir, f'{base_name}_X_test.npy'))
+        scaler = StandardScaler()
+        data = {
+            'X_train': scaler.fit_transform(X_train),
+            'X_test': scaler.transform(X_test),
+            'y_train': np.load(os.path.join(legacy_dir, f'{base_name}_y_train.npy')),
+            'y_test': np.load(os.path.join(legacy_dir, f'{base_name}_y_test.npy')),
+        }
+    else:
+        data = load_scaled_data(symbol, interval)
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        fit_candidate(key, data, n_jobs=1)
+    
+    return {'baseline_mb': baseline, 'peak_mb': peak_rss_mb()}
+
+def benchmark_memory(symbol, interval, key='rf'):
+    """
+    Mede o pico de RSS do treino de um candidato em dois formatos:
+    
+    - float64: matrizes lidas inteiras em RAM e normalizadas com fit_transform
+      (formato anterior, recriado a partir dos arquivos atuais);
+    - float32 memory-mapped: load_scaled_data atual.
+    
+    Cada medição roda num processo novo (spawn), sem herdar memória do pai.
+    
+    Returns:
+        Dicionário formato -> {'baseline_mb', 'peak_mb'}
+    """
+    import shutil
+    import tempfile
+    import multiprocessing
+    
+    base_name = f"{symbol}_{interval}"
+    legacy_dir = tempfile.mkdtemp(prefix='training_float64_')
+    
+    try:
+        for suffix in ('X_train', 'X_test', 'y_train', 'y_test'):
+            values = np.load(os.path.join(TRAINING_DIR, f'{base_name}_{suffix}.npy'), mmap_mode='r')
+            values = values.astype(np.float64) if suffix.startswith('X') else np.asarray(values)
+            np.save(os.path.join(legacy_dir, f'{base_name}_{suffix}.npy'), values)
+            del values
+        
+        results = {}
+        context = multiprocessing.get_context('spawn')
+        for label, directory in (('float64', legacy_dir), ('float32 mmap', None)):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results[label] = executor.submit(_memory_run, symbol, interval, key, directory).result()
+    finally:
+        shutil.rmtree(legacy_dir, ignore_errors=True)
+    
+    X_train = np.load(os.path.join(TRAINING_DIR, f'{base_name}_X_train.npy'), mmap_mode='r')
+    print(f"\n{symbol} {interval}: {X_train.shape[0]} x {X_train.shape[1]} ({CANDIDATES[key][0]})")
+    print(f"  {'Formato':<14} {'Pico (MB)':>10} {'Acima da base':>14}")
+    for label, values in results.items():
+        print(f"  {label:<14} {values['peak_mb']:>10.1f} {values['peak_mb'] - values['baseline_mb']:>14.1f}")
+    
+    legacy = results['float64']['peak_mb'] - results['float64']['baseline_mb']
+    current = results['float32 mmap']['peak_mb'] - results['float32 mmap']['baseline_mb']
+    if legacy > 0:
+        print(f"  Redução do pico (acima da base): {(1 - current / legacy) * 100:.1f}%")
+    
+    return results
+
+def print_timing_summary(timings, wall_seconds):
+    """Resumo de tempo por job e speedup em relação à execução serial"""
+    print("\nTempo por job:")
+    print(f"{'Símbolo':<12} {'Intervalo':<10} {'Modelo':<24} {'Núcleos':>8} {'Tempo':>10} {'Pico':>9}")
+    print("-" * 78)
+    for t in sorted(timings, key=lambda t: -t['seconds']):
+        print(f"{t['symbol']:<12} {t['interval']:<10} {t['model']:<24} {t['cores']:>8} {t['seconds']:>9.1f}s "
+              f"{t['peak_rss_mb']:>6.0f} MB")
+    
+    total = sum(t['seconds'] for t in timings)
+    print(f"\nTempo total dos jobs: {total:.1f}s | Tempo de parede: {wall_seconds:.1f}s "
+          f"| Speedup: {total / wall_seconds if wall_seconds else 0:.2f}x")
+
 def main():
     """Treina modelos para todos os símbolos e intervalos"""
+    parser = argparse.ArgumentParser(description='Treina modelos para todos os pares')
+    parser.add_argument('--cpus', type=int, default=None, help='Orçamento de núcleos (padrão: todos)')
+    parser.add_argument('--sequential', action='store_true', help='Treina um par por vez')
+    parser.add_argument('--fast', action='store_true',
+                        help='Modo rápido: Hist Gradient Boosting no lugar do Gradient Boosting exato')
+    parser.add_argument('pairs', nargs='*', help='Pares SYMBOL:INTERVAL (padrão: todos)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Acrescenta árvores ajustadas nas velas novas ao modelo salvo (warm start)')
+    parser.add_argument('--validate-incremental', action='store_true',
+                        help='Compara o treino incremental com o completo (acurácia e CPU), sem salvar')
+    parser.add_argument('--new-trees', type=int, default=INCREMENTAL_TREES, help='Árvores/estágios por rodada')
+    parser.add_argument('--retire', action='store_true',
+                        help='Random Forest: descarta as árvores mais antigas (tamanho constante)')
+    parser.add_argument('--window', type=int, default=INCREMENTAL_WINDOW,
+                        help='Random Forest: velas recentes usadas por rodada')
+    parser.add_argument('--rounds', type=int, default=7, help='Validação: rodadas incrementais')
+    parser.add_argument('--tolerance', type=float, default=INCREMENTAL_TOLERANCE,
+                        help='Validação: queda de acurácia aceita (fração, ex: 0.02)')
+    parser.add_argument('--benchmark-memory', action='store_true',
+                        help='Mede o pico de memória do treino (Random Forest) em float64 vs float32 memory-mapped')
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("TREINAMENTO DE MODELOS DE IA PARA TRADING")
     print("=" * 60)
@@ -215,15 +919,55 @@ def main():
     symbols = ['BTCUSDT', 'ETHUSDT', 'SOLUSDT']
     intervals = ['5m', '15m', '1h']
     
-    results = []
+    pairs = [(symbol, interval) for symbol in symbols for interval in intervals]
+    if args.pairs:
+        pairs = [tuple(item.split(':', 1)) for item in args.pairs]
     
-    for symbol in symbols:
-        for interval in intervals:
+    if args.benchmark_memory:
+        for symbol, interval in pairs:
+            try:
+                benchmark_memory(symbol, interval)
+            except FileNotFoundError as e:
+                print(f"\n✗ {symbol} {interval}: {e}")
+        return
+    
+    if args.validate_incremental:
+        passed = True
+        for symbol, interval in pairs:
             try:
-                result = train_for_symbol_interval(symbol, interval)
+                results = validate_incremental(symbol, interval, keys=candidate_keys(args.fast), rounds=args.rounds,
+                                               new_trees=args.new_trees, retire=args.retire, window=args.window,
+                                               tolerance=args.tolerance)
+            except (FileNotFoundError, ValueError) as e:
+                print(f"\n✗ {symbol} {interval}: {e}")
+                continue
+            passed = passed and all(r['passed'] for r in results)
+        raise SystemExit(0 if passed else 1)
+    
+    start = time.perf_counter()
+    
+    if args.incremental:
+        results = []
+        timings = []
+        for symbol, interval in pairs:
+            try:
+                results.append(train_incremental(symbol, interval, new_trees=args.new_trees, retire=args.retire,
+                                                 window=args.window, fast=args.fast))
+            except Exception as e:
+                print(f"\n✗ Erro ao treinar {symbol} {interval}: {e}")
+    elif args.sequential:
+        results = []
+        timings = []
+        for symbol, interval in pairs:
+            try:
+                result = train_for_symbol_interval(symbol, interval, fast=args.fast)
                 results.append(result)
             except Exception as e:
                 print(f"\n✗ Erro ao treinar {symbol} {interval}: {e}")
+    else:
+        results, timings = train_parallel(pairs, args.cpus, fast=args.fast)
+    
+    wall_seconds = time.perf_counter() - start
     
     print("\n" + "=" * 60)
     print("TREINAMENTO CONCLUÍDO!")
@@ -231,14 +975,17 @@ def main():
     
     # Resumo
     print("\nResumo dos modelos treinados:")
-    print(f"{'Símbolo':<12} {'Intervalo':<10} {'Modelo':<20} {'Acurácia':<10}")
-    print("-" * 60)
+    print(f"{'Símbolo':<12} {'Intervalo':<10} {'Modelo':<24} {'Acurácia':<10}")
+    print("-" * 68)
     for result in results:
-        print(f"{result['symbol']:<12} {result['interval']:<10} {result['model_type']:<20} {result['accuracy']*100:>6.2f}%")
+        print(f"{result['symbol']:<12} {result['interval']:<10} {result['model_type']:<24} {result['accuracy']*100:>6.2f}%")
     
     # Acurácia média
     avg_accuracy = np.mean([r['accuracy'] for r in results])
     print(f"\nAcurácia média: {avg_accuracy*100:.2f}%")
+    
+    if timings:
+        print_timing_summary(timings, wall_seconds)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Inferência de árvores baseada em arrays NumPy
+Exporta RandomForest, GradientBoosting e HistGradientBoosting treinados
+para arrays de nós compactos e avalia classe + probabilidades em uma passada
+
+O resultado reproduz exatamente o scikit-learn:
+    - mesma conversão de entrada (float32 para árvores do sklearn, float64 no HGB)
+    - mesma ordem de soma (sequencial, árvore a árvore, via cumsum)
+    - mesmo valor inicial do boosting (_raw_predict_init / baseline)
+    - mesma softmax (subtraindo o máximo) e expit
+
+RandomForest com n_jobs != 1 soma as árvores em ordem não determinística no
+sklearn; a comparação exata vale contra n_jobs=1.
+
+Uso: python3 tree_inference.py benchmark <symbol> <interval>
+"""
+
+import sys
+import time
+import numpy as np
+import sklearn
+from scipy.special import expit
+from sklearn.ensemble import (
+    RandomForestClassifier, GradientBoostingClassifier, HistGradientBoostingClassifier
+)
+
+PACKED_FORMAT = 'packed-trees-v1'
+
+# A partir do sklearn 1.4 as folhas guardam frações de classe e predict_proba
+# não normaliza mais; antes guardavam contagens normalizadas na predição
+NORMALIZE_LEAF_VALUES = tuple(int(v) for v in sklearn.__version__.split('.')[:2]) < (1, 4)
+
+# Linhas avaliadas por bloco no modo em lote (limita memória de linhas x árvores)
+BATCH_ROWS = 4096
+
+
+def _pack_sklearn_trees(trees):
+    """
+    Concatena árvores do sklearn em arrays globais
+
+    children[i] = (esquerda, direita) em índices globais; folhas apontam para
+    si mesmas, então a travessia roda um número fixo de níveis sem máscaras.
+    """
+    features, thresholds, children, missing, values, roots = [], [], [], [], [], []
+    offset = 0
+    depth = 0
+
+    for tree in trees:
+        n = tree.node_count
+        index = np.arange(n, dtype=np.int64)
+        is_leaf = tree.children_left == -1
+
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.int64))
+        thresholds.append(tree.threshold.astype(np.float64))
+        children.append(np.stack([
+            np.where(is_leaf, index, tree.children_left),
+            np.where(is_leaf, index, tree.children_right),
+        ], axis=1) + offset)
+        missing.append(np.asarray(getattr(tree, 'missing_go_to_left', np.zeros(n)), dtype=bool))
+        values.append(tree.value[:, 0, :])
+        roots.append(offset)
+
+        offset += n
+        depth = max(depth, tree.max_depth)
+
+    return {
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'children': np.concatenate(children).astype(np.int64),
+        'missing_left': np.concatenate(missing),
+        'value': np.concatenate(values),
+        'roots': np.array(roots, dtype=np.int64),
+        'depth': int(depth),
+    }
+
+
+def _pack_hist_predictors(predictors):
+    """Concatena os preditores do HistGradientBoosting (ordem iteração, classe)"""
+    features, thresholds, children, missing, values, roots = [], [], [], [], [], []
+    offset = 0
+    depth = 0
+
+    for predictor in predictors:
+        nodes = predictor.nodes
+        if nodes['is_categorical'].any():
+            raise ValueError("Categorical splits are not supported")
+
+        n = len(nodes)
+        index = np.arange(n, dtype=np.int64)
+        is_leaf = nodes['is_leaf'].astype(bool)
+
+        features.append(np.where(is_leaf, 0, nodes['feature_idx']).astype(np.int64))
+        thresholds.append(nodes['num_threshold'].astype(np.float64))
+        children.append(np.stack([
+            np.where(is_leaf, index, nodes['left'].astype(np.int64)),
+            np.where(is_leaf, index, nodes['right'].astype(np.int64)),
+        ], axis=1) + offset)
+        missing.append(nodes['missing_go_to_left'].astype(bool))
+        values.append(nodes['value'].astype(np.float64)[:, None])
+        roots.append(offset)
+
+        offset += n
+        depth = max(depth, int(nodes['depth'].max()))
+
+    return {
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'children': np.concatenate(children).astype(np.int64),
+        'missing_left': np.concatenate(missing),
+        'value': np.concatenate(values),
+        'roots': np.array(roots, dtype=np.int64),
+        'depth': int(depth),
+    }
+
+
+def pack_model(model, scaler=None):
+    """
+    Exporta um modelo treinado para arrays de nós
+
+    Args:
+        model: RandomForestClassifier, GradientBoostingClassifier ou
+               HistGradientBoostingClassifier treinado
+        scaler: StandardScaler opcional, aplicado antes das árvores
+
+    Returns:
+        Dicionário de arrays (pode ser gravado no bundle do modelo)
+    """
+    if isinstance(model, RandomForestClassifier):
+        if model.n_outputs_ != 1:
+            raise ValueError("Only single-output forests are supported")
+
+        packed = _pack_sklearn_trees([estimator.tree_ for estimator in model.estimators_])
+
+        if NORMALIZE_LEAF_VALUES:
+            # Mesma normalização de DecisionTreeClassifier.predict_proba
+            normalizer = packed['value'].sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            packed['value'] = packed['value'] / normalizer
+
+        packed.update({
+            'kind': 'forest',
+            'input_dtype': 'float32',
+            'n_outputs': len(model.classes_),
+        })
+
+    elif isinstance(model, GradientBoostingClassifier):
+        stages = model.estimators_
+        packed = _pack_sklearn_trees([stages[i, k].tree_ for i in range(stages.shape[0])
+                                      for k in range(stages.shape[1])])
+        packed['value'] = model.learning_rate * packed['value'][:, :1]
+
+        # Predição inicial independe de X (estimador init constante ou 'zero')
+        init = model._raw_predict_init(np.zeros((1, model.n_features_in_), dtype=np.float32))
+
+        packed.update({
+            'kind': 'boosting',
+            'input_dtype': 'float32',
+            'n_outputs': stages.shape[1],
+            'init': np.asarray(init[0], dtype=np.float64),
+            'binary_inclusive': True,   # GB: classe positiva se raw >= 0
+        })
+
+    elif isinstance(model, HistGradientBoostingClassifier):
+        if getattr(model, '_preprocessor', None) is not None:
+            raise ValueError("Categorical features are not supported")
+
+        packed = _pack_hist_predictors([p for iteration in model._predictors for p in iteration])
+        packed.update({
+            'kind': 'boosting',
+            'input_dtype': 'float64',
+            'n_outputs': model.n_trees_per_iteration_,
+            'init': np.asarray(model._baseline_prediction, dtype=np.float64).ravel(),
+            'binary_inclusive': False,  # HGB: classe positiva se raw > 0
+        })
+
+    else:
+        raise ValueError(f"Unsupported model type: {type(model).__name__}")
+
+    packed['format'] = PACKED_FORMAT
+    packed['classes'] = np.asarray(model.classes_)
+    packed['n_features'] = int(model.n_features_in_)
+
+    if scaler is not None:
+        packed['scaler_mean'] = np.asarray(scaler.mean_, dtype=np.float64)
+        packed['scaler_scale'] = np.asarray(scaler.scale_, dtype=np.float64)
+
+    return packed
+
+
+def _softmax(raw):
+    """Softmax idêntica a sklearn.utils.extmath.softmax"""
+    raw = raw - raw.max(axis=1).reshape(-1, 1)
+    np.exp(raw, out=raw)
+    raw /= raw.sum(axis=1).reshape(-1, 1)
+    return raw
+
+
+class PackedModel:
+    """
+    Avaliador dos arrays gerados por pack_model
+
+    Se o scaler foi exportado junto, as entradas são features brutas;
+    caso contrário, features já normalizadas (como no modelo original).
+    """
+
+    def __init__(self, packed):
+        if packed.get('format') != PACKED_FORMAT:
+            raise ValueError("Unsupported packed model format")
+
+        self.packed = packed
+        self.kind = packed['kind']
+        self.classes_ = packed['classes']
+        self.n_outputs = int(packed['n_outputs'])
+        self.depth = int(packed['depth'])
+        self.dtype = np.dtype(packed['input_dtype'])
+
+        self.feature = packed['feature']
+        self.threshold = packed['threshold']
+        self.children = packed['children'].reshape(-1)  # intercalado: 2*nó + (direita?)
+        self.missing_left = packed['missing_left']
+        self.value = packed['value']
+        self.roots = packed['roots']
+
+        self.mean = packed.get('scaler_mean')
+        self.scale = packed.get('scaler_scale')
+
+    @classmethod
+    def from_estimator(cls, model, scaler=None):
+        """PackedModel para o estimador, ou None se o tipo não for suportado"""
+        try:
+            return cls(pack_model(model, scaler))
+        except ValueError:
+            return None
+
+    def _prepare(self, X):
+        X = np.array(X, dtype=np.float64)
+        if self.mean is not None:
+            # Mesmas operações de StandardScaler.transform
+            X -= self.mean
+            X /= self.scale
+        return X.astype(self.dtype, copy=False)
+
+    def _leaves(self, X):
+        """Folha alcançada por cada linha em cada árvore: shape (linhas, árvores)"""
+        n_rows, n_features = X.shape
+        flat = np.ascontiguousarray(X).reshape(-1)
+        offsets = (np.arange(n_rows, dtype=np.int64) * n_features)[:, None]
+        nodes = np.broadcast_to(self.roots, (n_rows, len(self.roots)))
+        has_nan = np.isnan(flat).any()
+
+        for _ in range(self.depth):
+            values = flat.take(offsets + self.feature.take(nodes))
+            go_right = ~(values <= self.threshold.take(nodes))
+            if has_nan:
+                go_right &= ~(np.isnan(values) & self.missing_left.take(nodes))
+            nodes = self.children.take(2 * nodes + go_right)
+
+        return nodes
+
+    def _output(self, leaves):
+        """(classes, probabilidades) a partir das folhas alcançadas"""
+        n_rows, n_trees = leaves.shape
+
+        if self.kind == 'forest':
+            # Soma sequencial árvore a árvore, como no predict_proba do sklearn
+            proba = np.cumsum(self.value[leaves], axis=1)[:, -1]
+            proba /= n_trees
+            return self.classes_.take(np.argmax(proba, axis=1)), proba
+
+        k = self.n_outputs
+        contributions = self.value[leaves, 0].reshape(n_rows, n_trees // k, k)
+        init = np.broadcast_to(self.packed['init'], (n_rows, 1, k))
+        raw = np.cumsum(np.concatenate([init, contributions], axis=1), axis=1)[:, -1]
+
+        if k == 1:
+            raw = raw[:, 0]
+            positive = raw >= 0 if self.packed['binary_inclusive'] else raw > 0
+            proba = np.empty((n_rows, 2), dtype=np.float64)
+            proba[:, 1] = expit(raw)
+            proba[:, 0] = 1 - proba[:, 1]
+            return self.classes_[positive.astype(int)], proba
+
+        encoded = np.argmax(raw, axis=1)
+        return self.classes_[encoded], _softmax(raw)
+
+    def predict_with_proba(self, X):
+        """
+        Classe e probabilidades para um lote de linhas em uma única passada
+
+        Returns:
+            (classes, probabilidades) com shapes (n,) e (n, n_classes)
+        """
+        X = self._prepare(np.atleast_2d(X))
+        if len(X) <= BATCH_ROWS:
+            return self._output(self._leaves(X))
+
+        classes, probas = [], []
+        for start in range(0, len(X), BATCH_ROWS):
+            c, p = self._output(self._leaves(X[start:start + BATCH_ROWS]))
+            classes.append(c)
+            probas.append(p)
+        return np.concatenate(classes), np.concatenate(probas)
+
+    def predict_row(self, x):
+        """Classe e probabilidades de uma única linha (caminho de baixa latência)"""
+        classes, proba = self._output(self._leaves(self._prepare(np.asarray(x).reshape(1, -1))))
+        return classes[0], proba[0]
+
+    def predict(self, X):
+        return self.predict_with_proba(X)[0]
+
+    def predict_proba(self, X):
+        return self.predict_with_proba(X)[1]
+
+
+def benchmark(symbol, interval, rows=200):
+    """Compara latência por linha e exatidão contra o sklearn"""
+    from backtest import Backtester
+
+    backtester = Backtester(symbol, interval)
+    model, scaler = backtester.model, backtester.scaler
+    if hasattr(model, 'n_jobs'):
+        model.set_params(n_jobs=1)
+
+    X = backtester.feature_matrix()
+    sample = X[-rows:]
+
+    start = time.perf_counter()
+    packed = PackedModel(pack_model(model, scaler))
+    pack_ms = (time.perf_counter() - start) * 1000
+
+    # Exatidão em toda a série
+    X_scaled = scaler.transform(X)
+    sk_classes = model.predict(X_scaled)
+    sk_proba = model.predict_proba(X_scaled)
+    classes, proba = packed.predict_with_proba(X)
+    exact = np.array_equal(sk_classes, classes) and np.array_equal(sk_proba, proba)
+
+    start = time.perf_counter()
+    for x in sample:
+        x_scaled = scaler.transform(x.reshape(1, -1))
+        model.predict(x_scaled)
+        model.predict_proba(x_scaled)
+    sklearn_us = (time.perf_counter() - start) / len(sample) * 1e6
+
+    start = time.perf_counter()
+    for x in sample:
+        packed.predict_row(x)
+    packed_us = (time.perf_counter() - start) / len(sample) * 1e6
+
+    start = time.perf_counter()
+    packed.predict_with_proba(X)
+    batch_us = (time.perf_counter() - start) / len(X) * 1e6
+
+    print(f"Modelo: {type(model).__name__} ({len(packed.roots)} árvores, "
+          f"{len(packed.feature)} nós, profundidade {packed.depth}) - exportado em {pack_ms:.1f} ms")
+    print(f"Idêntico ao sklearn em {len(X)} linhas: {'sim' if exact else 'NÃO'} "
+          f"(max |Δp| = {np.abs(sk_proba - proba).max():.3g})")
+    print(f"Linha única - sklearn (transform + predict + predict_proba): {sklearn_us:,.0f} µs")
+    print(f"Linha única - arrays:                                       {packed_us:,.0f} µs "
+          f"({sklearn_us / packed_us:.1f}x)")
+    start = time.perf_counter()
+    X_scaled = scaler.transform(X)
+    model.predict(X_scaled)
+    model.predict_proba(X_scaled)
+    sklearn_batch_us = (time.perf_counter() - start) / len(X) * 1e6
+
+    print(f"Lote - sklearn: {sklearn_batch_us:.2f} µs/linha | arrays: {batch_us:.2f} µs/linha")
+
+    return exact
+
+
+def main():
+    if len(sys.argv) < 4 or sys.argv[1] != 'benchmark':
+        print(__doc__)
+        sys.exit(1)
+
+    exact = benchmark(sys.argv[2], sys.argv[3])
+    sys.exit(0 if exact else 1)
+
+
+if __name__ == "__main__":
+    main()
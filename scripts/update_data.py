@@ -2,10 +2,13 @@
 """
 Script para atualizar dados das criptomoedas
 Busca dados das últimas 24h e adiciona ao dataset existente
+
+Apenas o intervalo base (5m) é buscado na Bybit e gravado no histórico;
+as velas dos intervalos maiores são derivadas dele por reamostragem.
 """
 
 import os
-import pandas as pd
+import time
 from datetime import datetime, timedelta
 import sys
 
@@ -13,12 +16,62 @@ import sys
 PROJECT_DIR = os.path.dirname(os.path.dirname(__file__))
 sys.path.insert(0, os.path.join(PROJECT_DIR, 'scripts'))
 
-from bybit_client import BybitClient
-from add_technical_indicators import add_indicators
+from bybit_client import BybitClient, INTERVAL_MS
+from candle_store import series_exists, load_candles, append_candles
+from resample import BASE_INTERVAL, derive_candles
+from streaming_indicators import OHLCV_COLUMNS, load_or_bootstrap, state_path
+from profiling import span
 
 DATA_DIR = os.path.join(PROJECT_DIR, 'data', 'processed')
+HISTORICAL_DIR = os.path.join(PROJECT_DIR, 'data', 'historical')
+
+# Intervalo no formato Bybit
+BYBIT_INTERVALS = {
+    '5m': '5',
+    '15m': '15',
+    '1h': '60'
+}
+
+def fetch_base_data(client, symbol, days=1):
+    """
+    Busca as velas fechadas do intervalo base e anexa ao histórico
+
+    A busca termina na última vela fechada (a vela em formação seria gravada
+    de vez, já que o append não substitui velas) e começa após a última vela
+    gravada, então uma segunda chamada para o mesmo símbolo não faz
+    requisições enquanto nenhuma vela nova fechar.
 
-def update_symbol_data(symbol, interval, days=1):
+    Returns:
+        Número de velas novas gravadas
+    """
+    name = f"{symbol}_{BASE_INTERVAL}"
+    bybit_interval = BYBIT_INTERVALS[BASE_INTERVAL]
+    interval_ms = INTERVAL_MS[bybit_interval]
+
+    now_ms = int(time.time() * 1000)
+    end_time = now_ms // interval_ms * interval_ms - 1  # fim da última vela fechada
+    start_time = end_time + 1 - int(timedelta(days=days).total_seconds() * 1000)
+
+    if series_exists(HISTORICAL_DIR, name):
+        last = load_candles(HISTORICAL_DIR, name, columns=['timestamp'], tail=1)['timestamp']
+        if len(last):
+            start_time = max(start_time, last.iloc[-1].value // 10**6 + interval_ms)
+
+    if start_time > end_time:
+        return 0
+
+    new_data = client.get_historical_data(symbol, bybit_interval, start_time=start_time, end_time=end_time)
+
+    if new_data is None or len(new_data) == 0:
+        return 0
+
+    # Descartar qualquer vela ainda em formação
+    closes_ms = new_data['timestamp'].to_numpy(dtype='datetime64[ms]').view('int64') + interval_ms
+    new_data = new_data[closes_ms <= now_ms]
+
+    return append_candles(new_data[OHLCV_COLUMNS], HISTORICAL_DIR, name)
+
+def update_symbol_data(symbol, interval, days=1, fetch=True):
     """
     Atualiza dados de um símbolo específico
     
@@ -26,43 +79,30 @@ def update_symbol_data(symbol, interval, days=1):
         symbol: Par de trading
         interval: Intervalo das velas
         days: Número de dias para buscar
+        fetch: Busca o intervalo base na Bybit antes de derivar (False se
+               ele já foi atualizado nesta execução para o mesmo símbolo)
     """
     print(f"\nAtualizando {symbol} {interval}...")
     
-    data_file = os.path.join(DATA_DIR, f"{symbol}_{interval}.csv")
+    name = f"{symbol}_{interval}"
     
-    # Carregar dados existentes
-    if os.path.exists(data_file):
-        existing_data = pd.read_csv(data_file)
-        existing_data['timestamp'] = pd.to_datetime(existing_data['timestamp'])
-        last_timestamp = existing_data['timestamp'].max()
+    # Carregar apenas a última vela existente
+    if series_exists(DATA_DIR, name):
+        last_timestamp = load_candles(DATA_DIR, name, columns=['timestamp'], tail=1)['timestamp'].max()
         print(f"  Última data no dataset: {last_timestamp}")
     else:
         print(f"  Arquivo não encontrado, criando novo dataset")
-        existing_data = None
         last_timestamp = None
     
     try:
-        # Buscar novos dados da Bybit
-        client = BybitClient(testnet=False)
-        
-        # Mapear intervalo para formato Bybit
-        interval_map = {
-            '5m': '5',
-            '15m': '15',
-            '1h': '60'
-        }
-        bybit_interval = interval_map.get(interval, '60')
-        
-        new_data = client.get_historical_data(symbol, bybit_interval, days=days)
-        
-        if new_data is None or len(new_data) == 0:
-            print(f"  ✗ Nenhum dado novo disponível")
-            return False
+        # Buscar apenas o intervalo base na Bybit
+        if fetch:
+            client = BybitClient(testnet=False)
+            fetched = fetch_base_data(client, symbol, days=days)
+            print(f"  Velas {BASE_INTERVAL} novas no histórico: {fetched}")
         
-        # Filtrar apenas dados novos
-        if last_timestamp is not None:
-            new_data = new_data[new_data['timestamp'] > last_timestamp]
+        # Velas completas do intervalo pedido, posteriores ao dataset
+        new_data = derive_candles(symbol, interval, HISTORICAL_DIR, after=last_timestamp)
         
         if len(new_data) == 0:
             print(f"  ✓ Dados já estão atualizados")
@@ -70,21 +110,21 @@ def update_symbol_data(symbol, interval, days=1):
         
         print(f"  Novos dados: {len(new_data)} velas")
         
-        # Adicionar indicadores técnicos
-        new_data = add_indicators(new_data)
+        new_data = new_data[OHLCV_COLUMNS]
         
-        # Combinar com dados existentes
-        if existing_data is not None:
-            combined_data = pd.concat([existing_data, new_data], ignore_index=True)
-            combined_data = combined_data.sort_values('timestamp').reset_index(drop=True)
-            combined_data = combined_data.drop_duplicates(subset=['timestamp']).reset_index(drop=True)
-        else:
-            combined_data = new_data
+        # Indicadores incrementais: o estado (EMAs, janelas, RSI) é mantido
+        # entre execuções, então apenas as velas novas são processadas
+        with span('indicators', rows=len(new_data), series=name, mode='streaming'):
+            indicators = load_or_bootstrap(name)
+            processed_rows = indicators.update_many(new_data)
         
-        # Salvar dados atualizados
-        combined_data.to_csv(data_file, index=False)
+        # Anexar aos datasets existentes (apenas os bytes novos são gravados)
+        if interval != BASE_INTERVAL and series_exists(HISTORICAL_DIR, name):
+            append_candles(new_data, HISTORICAL_DIR, name)
+        appended = append_candles(processed_rows, DATA_DIR, name)
+        indicators.save(state_path(name))
         
-        print(f"  ✓ Dataset atualizado: {len(combined_data)} velas totais")
+        print(f"  ✓ Dataset atualizado: {appended} velas anexadas")
         return True
         
     except Exception as e:
@@ -106,8 +146,12 @@ def main():
     ]
     
     results = []
+    fetched = set()
     for symbol, interval in symbols:
-        success = update_symbol_data(symbol, interval, days=1)
+        # O intervalo base é buscado uma vez por símbolo
+        success = update_symbol_data(symbol, interval, days=1, fetch=symbol not in fetched)
+        if success:
+            fetched.add(symbol)
         results.append((symbol, interval, success))
     
     print("\n" + "=" * 60)
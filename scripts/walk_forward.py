@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Treinamento e avaliação walk-forward (validação temporal com purga)
+
+O split aleatório de prepare_training_data mistura velas futuras no treino e
+infla a acurácia. Aqui cada fold treina apenas com o passado e testa no bloco
+seguinte:
+
+    |------ treino ------|purga|-- teste --|
+    |--------- treino ---------|purga|-- teste --|
+
+A purga remove do fim do treino as velas cujo label olha para dentro do
+bloco de teste (FUTURE_CANDLES velas à frente).
+
+A matriz de features é montada uma única vez e gravada em .npy; os folds são
+apenas intervalos de índices sobre a matriz aberta com memory-mapping, e rodam
+em paralelo em processos separados. Ao final, o melhor candidato (média das
+acurácias nos folds) é treinado na janela mais recente e salvo como modelo.
+
+Uso: python3 walk_forward.py [SYMBOL:INTERVAL ...] [--splits 5] [--test-size N]
+                             [--train-window N] [--purge N] [--models rf,hgb]
+                             [--workers N] [--no-save] [--report arquivo.json]
+"""
+
+import os
+import io
+import json
+import time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import accuracy_score, balanced_accuracy_score, precision_recall_fscore_support
+
+import model_bundle
+import train_model
+from prepare_training_data import FUTURE_CANDLES, build_feature_matrix
+
+DEFAULT_SPLITS = 5
+LABELS = [-1, 0, 1]
+LABEL_NAMES = {-1: 'SELL', 0: 'HOLD', 1: 'BUY'}
+
+
+def make_folds(n_samples, n_splits=DEFAULT_SPLITS, test_size=None, train_window=None, purge=FUTURE_CANDLES):
+    """
+    Define os folds como intervalos de índices [início, fim)
+
+    Args:
+        n_samples: Número de amostras da matriz
+        n_splits: Número de folds (blocos de teste consecutivos no fim da série)
+        test_size: Amostras por bloco de teste (padrão: n_samples // (n_splits + 1))
+        train_window: Tamanho máximo do treino (None = janela expansível desde o início)
+        purge: Amostras removidas entre o fim do treino e o início do teste
+
+    Returns:
+        Lista de dicionários com train_start, train_end, test_start, test_end
+    """
+    test_size = test_size or n_samples // (n_splits + 1)
+    first_test = n_samples - n_splits * test_size
+
+    if test_size <= 0 or first_test - purge <= 0:
+        raise ValueError(f"Not enough samples ({n_samples}) for {n_splits} folds of {test_size}")
+
+    folds = []
+    for fold in range(n_splits):
+        test_start = first_test + fold * test_size
+        train_end = test_start - purge
+        train_start = 0 if train_window is None else max(0, train_end - train_window)
+        folds.append({
+            'fold': fold,
+            'train_start': train_start,
+            'train_end': train_end,
+            'test_start': test_start,
+            'test_end': test_start + test_size,
+        })
+
+    return folds
+
+
+def open_matrix(paths):
+    """Abre X, y e timestamps com memory-mapping (somente leitura)"""
+    return (
+        np.load(paths['X'], mmap_mode='r'),
+        np.load(paths['y'], mmap_mode='r'),
+        np.load(paths['timestamps'], mmap_mode='r'),
+    )
+
+
+def fold_metrics(y_true, y_pred):
+    """Acurácia, acurácia balanceada e precisão/recall por classe"""
+    precision, recall, f1, support = precision_recall_fscore_support(
+        y_true, y_pred, labels=LABELS, zero_division=0
+    )
+    return {
+        'accuracy': float(accuracy_score(y_true, y_pred)),
+        'balanced_accuracy': float(balanced_accuracy_score(y_true, y_pred)),
+        'classes': {
+            LABEL_NAMES[label]: {
+                'precision': float(precision[i]),
+                'recall': float(recall[i]),
+                'f1': float(f1[i]),
+                'support': int(support[i]),
+            }
+            for i, label in enumerate(LABELS)
+        },
+    }
+
+
+def _run_fold(paths, fold, keys, n_jobs):
+    """Treina e avalia os candidatos em um fold (executa em processo filho)"""
+    X, y, timestamps = open_matrix(paths)
+
+    # Fatias de um memmap são views: nada é copiado até o scaler
+    X_train, y_train = X[fold['train_start']:fold['train_end']], y[fold['train_start']:fold['train_end']]
+    X_test, y_test = X[fold['test_start']:fold['test_end']], y[fold['test_start']:fold['test_end']]
+
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+    data = {'X_train': X_train_scaled, 'y_train': np.asarray(y_train),
+            'X_test': X_test_scaled, 'y_test': np.asarray(y_test)}
+
+    result = dict(fold)
+    result['train_period'] = [str(timestamps[fold['train_start']]), str(timestamps[fold['train_end'] - 1])]
+    result['test_period'] = [str(timestamps[fold['test_start']]), str(timestamps[fold['test_end'] - 1])]
+    result['candidates'] = {}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for key in keys:
+            name, model, _, fit_seconds = train_model.fit_candidate(key, data, n_jobs=n_jobs)
+            metrics = fold_metrics(data['y_test'], model.predict(X_test_scaled))
+            metrics['model_type'] = name
+            metrics['fit_seconds'] = fit_seconds
+            result['candidates'][key] = metrics
+
+    return result
+
+
+def run_folds(paths, folds, keys, workers=None):
+    """
+    Executa os folds em paralelo
+
+    Cada processo recebe uma fatia igual dos núcleos para os candidatos
+    que usam múltiplos núcleos (n_jobs).
+    """
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(workers or cpus, len(folds)))
+    n_jobs = max(1, cpus // workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run_fold, paths, fold, keys, n_jobs) for fold in folds]
+        return [future.result() for future in futures]
+
+
+def summarize(results, keys):
+    """Média e desvio das métricas de cada candidato nos folds"""
+    summary = {}
+    for key in keys:
+        accuracies = [r['candidates'][key]['accuracy'] for r in results]
+        balanced = [r['candidates'][key]['balanced_accuracy'] for r in results]
+        summary[key] = {
+            'model_type': train_model.CANDIDATES[key][0],
+            'accuracy_mean': float(np.mean(accuracies)),
+            'accuracy_std': float(np.std(accuracies)),
+            'balanced_accuracy_mean': float(np.mean(balanced)),
+        }
+    return summary
+
+
+def train_final_model(paths, key, train_window=None):
+    """
+    Treina o candidato escolhido na janela mais recente da série
+
+    Returns:
+        (modelo, scaler, início da janela)
+    """
+    X, y, _ = open_matrix(paths)
+    start = 0 if train_window is None else max(0, len(X) - train_window)
+
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X[start:])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        model, _ = train_model.CANDIDATES[key][1](X_scaled, np.asarray(y[start:]))
+
+    return model, scaler, start
+
+
+def walk_forward(symbol, interval, n_splits=DEFAULT_SPLITS, test_size=None, train_window=None,
+                 purge=FUTURE_CANDLES, keys=None, workers=None, save=True):
+    """
+    Avaliação walk-forward de um par e treino do modelo final
+
+    Returns:
+        Relatório com os folds, o resumo por candidato e o modelo escolhido
+    """
+    keys = keys or train_model.candidate_keys(fast=True)
+    base_name = f"{symbol}_{interval}"
+
+    print(f"\n{'='*60}")
+    print(f"Walk-forward: {symbol} - {interval}")
+    print(f"{'='*60}")
+
+    start = time.perf_counter()
+    matrix = build_feature_matrix(base_name)
+    paths = matrix['paths']
+    print(f"  Matriz de features: {matrix['samples']} amostras x {len(matrix['features'])} features "
+          f"({time.perf_counter() - start:.2f}s)")
+
+    folds = make_folds(matrix['samples'], n_splits, test_size, train_window, purge)
+
+    start = time.perf_counter()
+    results = run_folds(paths, folds, keys, workers)
+    print(f"  {len(folds)} folds em {time.perf_counter() - start:.2f}s")
+
+    print(f"\n  {'Fold':<6} {'Treino':<16} {'Teste':<16} " + "  ".join(f"{k:>8}" for k in keys))
+    for r in results:
+        train_range = f"{r['train_start']}-{r['train_end']}"
+        test_range = f"{r['test_start']}-{r['test_end']}"
+        accuracies = "  ".join(f"{r['candidates'][k]['accuracy']*100:7.2f}%" for k in keys)
+        print(f"  {r['fold']:<6} {train_range:<16} {test_range:<16} {accuracies}")
+
+    summary = summarize(results, keys)
+
+    # Melhor candidato pela acurácia média (empate favorece a ordem de CANDIDATES)
+    best_key = max(keys, key=lambda k: summary[k]['accuracy_mean'])
+    best = summary[best_key]
+    print(f"\n  Melhor modelo: {best['model_type']} "
+          f"({best['accuracy_mean']*100:.2f}% ± {best['accuracy_std']*100:.2f}%)")
+
+    report = {
+        'symbol': symbol,
+        'interval': interval,
+        'samples': matrix['samples'],
+        'purge': purge,
+        'train_window': train_window,
+        'folds': results,
+        'summary': summary,
+        'best_model': best_key,
+    }
+
+    if save:
+        model, scaler, window_start = train_final_model(paths, best_key, train_window)
+        X, _, timestamps = open_matrix(paths)
+
+        metadata = {
+            'symbol': symbol,
+            'interval': interval,
+            'model_type': best['model_type'],
+            'accuracy': best['accuracy_mean'],
+            'validation': 'walk_forward',
+            'walk_forward': {
+                'splits': n_splits,
+                'purge': purge,
+                'accuracy_std': best['accuracy_std'],
+                'balanced_accuracy': best['balanced_accuracy_mean'],
+                'fold_accuracies': [r['candidates'][best_key]['accuracy'] for r in results],
+                'candidates': summary,
+            },
+            'train_samples': len(X) - window_start,
+            'train_period': [str(timestamps[window_start]), str(timestamps[-1])],
+            'features': matrix['features'],
+            'trained_at': datetime.now().isoformat()
+        }
+
+        bundle_path = model_bundle.bundle_path(symbol, interval, train_model.MODELS_DIR)
+        digest = model_bundle.save_bundle(bundle_path, model, scaler, matrix['features'], metadata)
+        report['model_path'] = bundle_path
+        print(f"  ✓ Modelo final ({len(X) - window_start} amostras mais recentes) salvo: "
+              f"{os.path.basename(bundle_path)} ({digest[:12]})")
+
+    return report
+
+
+def parse_pair(value):
+    if ':' not in value:
+        raise argparse.ArgumentTypeError(f"Par inválido '{value}' (use SYMBOL:INTERVAL)")
+    symbol, interval = value.split(':', 1)
+    return symbol.upper(), interval
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Treinamento e avaliação walk-forward')
+    parser.add_argument('pairs', nargs='*', type=parse_pair, help='Pares no formato SYMBOL:INTERVAL')
+    parser.add_argument('--splits', type=int, default=DEFAULT_SPLITS, help='Número de folds')
+    parser.add_argument('--test-size', type=int, default=None, help='Amostras por bloco de teste')
+    parser.add_argument('--train-window', type=int, default=None,
+                        help='Tamanho máximo da janela de treino (padrão: expansível)')
+    parser.add_argument('--purge', type=int, default=FUTURE_CANDLES, help='Amostras purgadas antes do teste')
+    parser.add_argument('--models', default=','.join(train_model.candidate_keys(fast=True)),
+                        help=f"Candidatos ({','.join(train_model.CANDIDATES)})")
+    parser.add_argument('--workers', type=int, default=None, help='Processos (padrão: um por fold, até o nº de CPUs)')
+    parser.add_argument('--no-save', action='store_true', help='Apenas avalia, sem salvar o modelo final')
+    parser.add_argument('--report', default=None, help='Grava o relatório completo em JSON')
+    args = parser.parse_args()
+
+    keys = [key.strip() for key in args.models.split(',') if key.strip()]
+    unknown = [key for key in keys if key not in train_model.CANDIDATES]
+    if unknown:
+        parser.error(f"Candidatos desconhecidos: {', '.join(unknown)}")
+
+    pairs = args.pairs or [
+        (symbol, interval)
+        for symbol in ['BTCUSDT', 'ETHUSDT', 'SOLUSDT']
+        for interval in ['5m', '15m', '1h']
+    ]
+
+    print("=" * 60)
+    print("TREINAMENTO WALK-FORWARD")
+    print("=" * 60)
+    print(f"Folds: {args.splits} | Purga: {args.purge} | "
+          f"Janela de treino: {args.train_window or 'expansível'} | Candidatos: {', '.join(keys)}")
+    print("=" * 60)
+
+    reports = []
+    for symbol, interval in pairs:
+        try:
+            reports.append(walk_forward(
+                symbol, interval,
+                n_splits=args.splits,
+                test_size=args.test_size,
+                train_window=args.train_window,
+                purge=args.purge,
+                keys=keys,
+                workers=args.workers,
+                save=not args.no_save
+            ))
+        except FileNotFoundError as e:
+            print(f"\n✗ {symbol} {interval}: {e}")
+
+    print("\n" + "=" * 60)
+    print("RESUMO WALK-FORWARD")
+    print("=" * 60)
+    print(f"{'Símbolo':<12} {'Intervalo':<10} {'Modelo':<24} {'Acurácia (média ± desvio)':<26}")
+    print("-" * 68)
+    for report in reports:
+        best = report['summary'][report['best_model']]
+        print(f"{report['symbol']:<12} {report['interval']:<10} {best['model_type']:<24} "
+              f"{best['accuracy_mean']*100:6.2f}% ± {best['accuracy_std']*100:.2f}%")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(reports, f, indent=2)
+        print(f"\n✓ Relatório salvo em: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ import { createContext } from "./context";
 import { serveStatic, setupVite } from "./vite";
 import { scheduleBacktest7Days } from "../jobs/liveBacktest7Days";
 import { scheduleMarketDataCollection, scheduleRealtimeDataUpdate } from "../services/bybitIntegration";
+import { stopPredictionService } from "../services/predictionService";
 
 function isPortAvailable(port: number): Promise<boolean> {
   return new Promise(resolve => {
@@ -70,6 +71,15 @@ async function startServer() {
     scheduleMarketDataCollection();
     scheduleRealtimeDataUpdate();
   });
+
+  // Encerrar o processo Python de predição junto com o servidor
+  process.on("exit", stopPredictionService);
+  for (const signal of ["SIGINT", "SIGTERM"] as const) {
+    process.on(signal, () => {
+      stopPredictionService();
+      process.exit(0);
+    });
+  }
 }
 
 startServer().catch(console.error);
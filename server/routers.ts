@@ -9,6 +9,7 @@ import { users } from "../drizzle/schema";
 import { getDb } from "./db";
 import * as db from "./db";
 import crypto from "crypto";
+import { getLastRetrainMetrics, getRecentSpans } from "./services/pipelineMetrics";
 
 // Backtesting router
 const backtestRouter = router({
@@ -223,6 +224,18 @@ export const appRouter = router({
     logs: protectedProcedure.query(async ({ ctx }) => {
       return await db.getRetrainLogs(ctx.user.id, 50);
     }),
+
+    // Tempo, CPU e memória por etapa do pipeline Python (scripts/profiling.py)
+    metrics: protectedProcedure
+      .input(z.object({
+        limit: z.number().default(200),
+      }).optional())
+      .query(async ({ input }) => {
+        return {
+          lastRun: await getLastRetrainMetrics(),
+          spans: await getRecentSpans(input?.limit || 200),
+        };
+      }),
   }),
 
   // Backtesting
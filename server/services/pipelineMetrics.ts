@@ -0,0 +1,95 @@
+import path from "path";
+import { promises as fs } from "fs";
+
+/**
+ * Leitura das métricas do pipeline Python (scripts/profiling.py)
+ * Spans em logs/spans.jsonl (uma linha JSON por etapa) e resumo por execução em retrain_log.json
+ */
+
+const PROJECT_DIR = path.join(__dirname, "..", "..");
+const SPANS_FILE = process.env.PIPELINE_SPANS_FILE || path.join(PROJECT_DIR, "logs", "spans.jsonl");
+const RETRAIN_LOG_FILE = path.join(PROJECT_DIR, "retrain_log.json");
+
+// Bytes lidos do fim do arquivo de spans (evita carregar o histórico inteiro)
+const SPANS_TAIL_BYTES = 256 * 1024;
+
+export interface PipelineSpan {
+  stage: string;
+  started_at: string;
+  wall_seconds: number;
+  cpu_seconds: number;
+  peak_rss_mb: number;
+  rows: number | null;
+  ok: boolean;
+  run_id?: string | null;
+  [key: string]: unknown;
+}
+
+async function readTail(file: string, bytes: number): Promise<string> {
+  let handle;
+  try {
+    handle = await fs.open(file, "r");
+  } catch {
+    return "";
+  }
+
+  try {
+    const { size } = await handle.stat();
+    const start = Math.max(0, size - bytes);
+    const buffer = Buffer.alloc(size - start);
+    await handle.read(buffer, 0, buffer.length, start);
+    const text = buffer.toString("utf-8");
+    // Descartar a primeira linha se o corte caiu no meio dela
+    return start > 0 ? text.slice(text.indexOf("\n") + 1) : text;
+  } finally {
+    await handle.close();
+  }
+}
+
+/**
+ * Últimos spans gravados pelo pipeline (mais recentes por último)
+ */
+export async function getRecentSpans(limit = 200): Promise<PipelineSpan[]> {
+  const text = await readTail(SPANS_FILE, SPANS_TAIL_BYTES);
+  const spans: PipelineSpan[] = [];
+
+  for (const line of text.split("\n")) {
+    if (!line.trim()) continue;
+    try {
+      spans.push(JSON.parse(line));
+    } catch {
+      // Linha incompleta (escrita em andamento)
+    }
+  }
+
+  return spans.slice(-limit);
+}
+
+/**
+ * Resumo por etapa da última execução do retrain.py
+ */
+export async function getLastRetrainMetrics() {
+  try {
+    const logs = JSON.parse(await fs.readFile(RETRAIN_LOG_FILE, "utf-8"));
+    const last = Array.isArray(logs) ? logs[logs.length - 1] : null;
+    if (!last) return null;
+
+    return {
+      runId: last.run_id ?? null,
+      timestamp: last.timestamp,
+      success: last.success,
+      wallSeconds: last.wall_seconds ?? null,
+      ran: last.ran ?? null,
+      skipped: last.skipped ?? null,
+      stages: last.stages ?? {},
+      steps: (last.steps ?? []).map((step: any) => ({
+        step: step.step,
+        status: step.status ?? null,
+        success: step.success,
+        wallSeconds: step.wall_seconds ?? null,
+      })),
+    };
+  } catch {
+    return null;
+  }
+}
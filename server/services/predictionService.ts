@@ -0,0 +1,132 @@
+import path from "path";
+import { spawn, ChildProcessWithoutNullStreams } from "child_process";
+import { createInterface } from "readline";
+
+/**
+ * Cliente do serviço de predição persistente (scripts/prediction_server.py)
+ * Mantém um único processo Python com os modelos carregados e troca mensagens JSON-lines
+ */
+
+const SCRIPTS_DIR = path.join(__dirname, "..", "..", "scripts");
+const REQUEST_TIMEOUT_MS = 30_000;
+
+interface PendingRequest {
+  resolve: (value: any) => void;
+  timer: NodeJS.Timeout;
+}
+
+export interface PredictionResponse<T = any> {
+  result: T | null;
+  latencyMs: number | null;
+}
+
+let child: ChildProcessWithoutNullStreams | null = null;
+let nextId = 1;
+const pending = new Map<number, PendingRequest>();
+
+function rejectAllPending(reason: string) {
+  for (const [id, request] of Array.from(pending.entries())) {
+    clearTimeout(request.timer);
+    request.resolve({ result: null, latencyMs: null });
+    pending.delete(id);
+  }
+  if (reason) {
+    console.error(`[PredictionService] ${reason}`);
+  }
+}
+
+function ensureProcess(): ChildProcessWithoutNullStreams {
+  if (child && child.exitCode === null && !child.killed) {
+    return child;
+  }
+
+  const scriptPath = path.join(SCRIPTS_DIR, "prediction_server.py");
+  const proc = spawn("python3", [scriptPath], { cwd: SCRIPTS_DIR });
+
+  const lines = createInterface({ input: proc.stdout });
+  lines.on("line", (line) => {
+    let message: any;
+    try {
+      message = JSON.parse(line);
+    } catch (error) {
+      console.error(`[PredictionService] Invalid response: ${line}`);
+      return;
+    }
+
+    const request = pending.get(message.id);
+    if (!request) return;
+
+    clearTimeout(request.timer);
+    pending.delete(message.id);
+    request.resolve({ result: message.result ?? null, latencyMs: message.latencyMs ?? null });
+  });
+
+  proc.stderr.on("data", (data) => {
+    console.error(`[PredictionService] ${data.toString().trim()}`);
+  });
+
+  proc.on("exit", (code) => {
+    if (child === proc) child = null;
+    rejectAllPending(`Prediction server exited with code ${code}`);
+  });
+
+  proc.on("error", (error) => {
+    if (child === proc) child = null;
+    rejectAllPending(`Failed to start prediction server: ${error}`);
+  });
+
+  child = proc;
+  return proc;
+}
+
+/**
+ * Envia uma requisição ao serviço e aguarda a resposta correspondente
+ */
+export function sendRequest<T = any>(payload: Record<string, unknown>): Promise<PredictionResponse<T>> {
+  return new Promise((resolve) => {
+    const proc = ensureProcess();
+    const id = nextId++;
+
+    const timer = setTimeout(() => {
+      pending.delete(id);
+      console.error(`[PredictionService] Request ${id} timed out`);
+      resolve({ result: null, latencyMs: null });
+    }, REQUEST_TIMEOUT_MS);
+
+    pending.set(id, { resolve, timer });
+    proc.stdin.write(JSON.stringify({ id, ...payload }) + "\n");
+  });
+}
+
+/**
+ * Solicita predição para um par usando o modelo residente em memória
+ */
+export function requestPrediction<T = any>(symbol: string, interval: string) {
+  return sendRequest<T>({ cmd: "predict", symbol, interval });
+}
+
+/**
+ * Solicita predições para vários pares numa única requisição
+ * O resultado é um array na ordem dos pares, cada item com o próprio latencyMs
+ */
+export function requestBatchPrediction<T = any>(pairs: Array<{ symbol: string; interval: string }>) {
+  return sendRequest<Array<T>>({ cmd: "batch", pairs });
+}
+
+/**
+ * Estatísticas de latência reportadas pelo próprio serviço
+ */
+export function getPredictionStats() {
+  return sendRequest({ cmd: "stats" });
+}
+
+/**
+ * Encerra o processo do serviço (ex: no shutdown do servidor)
+ */
+export function stopPredictionService() {
+  if (child) {
+    child.stdin.end();
+    child.kill();
+    child = null;
+  }
+}
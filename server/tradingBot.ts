@@ -5,10 +5,9 @@
 
 import * as db from './db';
 import path from 'path';
-import { spawn } from 'child_process';
+import { requestBatchPrediction } from './services/predictionService';
 
 const MODELS_DIR = path.join(__dirname, '..', 'models');
-const SCRIPTS_DIR = path.join(__dirname, '..', 'scripts');
 
 // Símbolos e intervalos suportados
 const SUPPORTED_PAIRS = [
@@ -25,71 +24,63 @@ interface PredictionResult {
   indicators: any;
 }
 
+type PredictionResponseItem = PredictionResult & { error?: string; latencyMs?: number };
+
 /**
- * Executa script Python para fazer predição usando modelo treinado
+ * Solicita ao serviço Python persistente as predições de todos os pares numa única requisição
+ * Retorna um item por par, na mesma ordem (null quando não houver predição)
  */
-async function runPrediction(symbol: string, interval: string): Promise<PredictionResult | null> {
-  return new Promise((resolve, reject) => {
-    const scriptPath = path.join(SCRIPTS_DIR, 'predict.py');
-    
-    const python = spawn('python3', [scriptPath, symbol, interval]);
-    
-    let stdout = '';
-    let stderr = '';
-    
-    python.stdout.on('data', (data) => {
-      stdout += data.toString();
-    });
-    
-    python.stderr.on('data', (data) => {
-      stderr += data.toString();
-    });
-    
-    python.on('close', (code) => {
-      if (code !== 0) {
-        console.error(`Prediction script error for ${symbol} ${interval}:`, stderr);
-        resolve(null);
-        return;
-      }
-      
-      try {
-        const result = JSON.parse(stdout);
-        resolve(result);
-      } catch (error) {
-        console.error(`Failed to parse prediction result for ${symbol} ${interval}:`, error);
-        resolve(null);
-      }
-    });
-    
-    python.on('error', (error) => {
-      console.error(`Failed to start prediction script:`, error);
-      resolve(null);
-    });
+async function runPredictions(pairs: typeof SUPPORTED_PAIRS): Promise<Array<PredictionResult | null>> {
+  const { result, latencyMs } = await requestBatchPrediction<PredictionResponseItem>(pairs);
+
+  if (!result || !Array.isArray(result)) {
+    if (result && (result as any).error) {
+      console.error(`Batch prediction error:`, (result as any).error);
+    }
+    return pairs.map(() => null);
+  }
+
+  console.log(`[Bot] Batch of ${pairs.length} predictions served in ${latencyMs}ms`);
+
+  return result.map((item, i) => {
+    const { symbol, interval } = pairs[i];
+
+    if (!item || item.error) {
+      console.error(`Prediction error for ${symbol} ${interval}:`, item?.error);
+      return null;
+    }
+
+    console.log(`[Bot] Prediction for ${symbol} ${interval} served in ${item.latencyMs}ms`);
+    return item;
   });
 }
 
 /**
- * Analisa mercado para um par específico
+ * Analisa mercado para todos os pares
  */
-async function analyzeMarket(symbol: string, interval: string): Promise<PredictionResult | null> {
+async function analyzeMarkets(pairs: typeof SUPPORTED_PAIRS): Promise<Array<PredictionResult | null>> {
   try {
-    console.log(`[Bot] Analyzing ${symbol} ${interval}...`);
-    
-    const prediction = await runPrediction(symbol, interval);
-    
-    if (!prediction) {
-      console.log(`[Bot] No prediction available for ${symbol} ${interval}`);
-      return null;
-    }
+    console.log(`[Bot] Analyzing ${pairs.map(p => `${p.symbol} ${p.interval}`).join(', ')}...`);
     
-    // TODO: Salvar análise no banco quando a tabela estiver disponível
+    const predictions = await runPredictions(pairs);
     
-    console.log(`[Bot] ${symbol} ${interval}: ${prediction.prediction.toUpperCase()} (${prediction.confidence}% confidence)`);
+    predictions.forEach((prediction, i) => {
+      const { symbol, interval } = pairs[i];
+      
+      if (!prediction) {
+        console.log(`[Bot] No prediction available for ${symbol} ${interval}`);
+        return;
+      }
+      
+      // TODO: Salvar análise no banco quando a tabela estiver disponível
+      
+      console.log(`[Bot] ${symbol} ${interval}: ${prediction.prediction.toUpperCase()} (${prediction.confidence}% confidence)`);
+    });
     
-    return prediction;
+    return predictions;
   } catch (error) {
-    console.error(`[Bot] Error analyzing ${symbol} ${interval}:`, error);
-    return null;
+    console.error(`[Bot] Error analyzing markets:`, error);
+    return pairs.map(() => null);
   }
 }
 
@@ -250,10 +241,10 @@ export async function runBotCycle(userId: number) {
     
     console.log(`[Bot] Running cycle for user ${userId}...`);
     
-    // Analisar todos os pares suportados
-    for (const pair of SUPPORTED_PAIRS) {
-      const prediction = await analyzeMarket(pair.symbol, pair.interval);
-      
+    // Analisar todos os pares suportados (uma única requisição ao serviço)
+    const predictions = await analyzeMarkets(SUPPORTED_PAIRS);
+    
+    for (const prediction of predictions) {
       if (prediction && prediction.prediction !== 'hold') {
         await executeTrade(userId, prediction, config);
       }